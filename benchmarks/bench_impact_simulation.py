@@ -0,0 +1,76 @@
+"""Benchmark the Impact Calculator's Monte Carlo engine
+
+Run from the repository root:
+
+    python -m benchmarks.bench_impact_simulation
+
+Builds a synthetic bill table shaped like the pilot data (135k bills,
+same segment mix and basket sizes), bootstraps it once and then times
+``simulate_impact`` across every slider position. Exits non-zero if the
+median rerun exceeds the 100 ms interactivity budget.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from zeno_analytics.segments import SEGMENT_DTYPE, SEGMENTS
+from zeno_analytics.simulation import N_SCENARIOS, bootstrap_segments, simulate_impact
+
+BUDGET_MS = 100.0
+
+# Pilot segment mix and average baskets (see DOCUMENTATION.md)
+PILOT_SHARES = np.array([0.382, 0.564, 0.054])
+PILOT_BASKETS = np.array([264.63, 295.96, 371.29])
+
+
+def synthetic_bills(n_bills, seed=0):
+    """Bill table with lognormal baskets matching the pilot segment means"""
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(len(SEGMENTS), size=n_bills, p=PILOT_SHARES)
+    sigma = 0.9
+    mu = np.log(PILOT_BASKETS) - sigma ** 2 / 2
+    revenue = rng.lognormal(mu[codes], sigma)
+    return pd.DataFrame({
+        'revenue-value': revenue,
+        'user_segment': pd.Categorical.from_codes(codes, dtype=SEGMENT_DTYPE),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=135_249)
+    parser.add_argument('--scenarios', type=int, default=N_SCENARIOS)
+    parser.add_argument('--monthly-bills', type=int, default=30_000)
+    args = parser.parse_args(argv)
+
+    bills = synthetic_bills(args.bills)
+    start = time.perf_counter()
+    bootstrap = bootstrap_segments(bills)
+    bootstrap_ms = (time.perf_counter() - start) * 1000
+
+    current = bills['user_segment'].value_counts(normalize=True).reindex(SEGMENTS).to_numpy()
+    have_coins = current[1] + current[2]
+    timings = []
+    # Every position of the 'Target % Who USE Coins' slider (0.5% steps)
+    for target_users in np.arange(0.0, have_coins, 0.005):
+        target = np.array([current[0], have_coins - target_users, target_users])
+        start = time.perf_counter()
+        simulate_impact(bootstrap, current, target, args.monthly_bills, n_scenarios=args.scenarios)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    print(f"bills={args.bills:,} scenarios={args.scenarios:,} slider_positions={len(timings)}")
+    print(f"bootstrap (once per dataset): {bootstrap_ms:.1f} ms")
+    print(f"simulate per rerun: median {np.median(timings):.2f} ms, "
+          f"p95 {np.percentile(timings, 95):.2f} ms, max {timings.max():.2f} ms")
+    if np.median(timings) > BUDGET_MS:
+        print(f"FAIL: median exceeds the {BUDGET_MS:.0f} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Benchmark the data pipeline stage by stage on synthetic dumps
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --rows 100000 1000000 --json results.json
+
+For each size a synthetic dump is written (see ``benchmarks.synthetic``)
+and every stage behind the app is timed: CSV parse, date parsing, schema
+typing, the Parquet cache, bill aggregation, segment labelling, the
+derived structures and the per-page KPI computations. Each stage records
+wall and CPU seconds plus peak resident memory. Pass ``--baseline`` with
+an earlier JSON file to fail on stages that got slower than
+``--tolerance``.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import add_arguments, generator_options, write_line_items
+from zeno_analytics.bills import aggregate_bills
+from zeno_analytics.cohorts import build_histories
+from zeno_analytics.cube import build_cube
+from zeno_analytics.impact import project_impact, sweep_from_stats
+from zeno_analytics.ingest import BILL_DATE_FORMAT, CACHE_DIR, USED_COLUMNS, apply_schema, read_line_items
+from zeno_analytics.kpis import segment_kpis
+from zeno_analytics.segments import assign_segments, compute_segment_stats
+from zeno_analytics.significance import segment_lift
+from zeno_analytics.simulation import bootstrap_segments, simulate_impact
+from zeno_analytics.sketches import build_sketches
+from zeno_analytics.snapshots import build_snapshot
+from zeno_analytics.timeseries import TREND_MEASURES, build_daily_series
+
+# Stages faster than this are too noisy to flag as regressions
+MIN_COMPARE_SECONDS = 0.05
+
+
+def _status_mb(field):
+    """A memory field of /proc/self/status in MiB, or None where it is unavailable"""
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _rss_mb():
+    rss = _status_mb('VmRSS')
+    return float('nan') if rss is None else rss
+
+
+def _reset_peak():
+    """Reset the kernel's peak-RSS counter; False where that is unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_mb():
+    """Peak resident memory: VmHWM, which clear_refs resets, else the process-wide ru_maxrss"""
+    peak = _status_mb('VmHWM')
+    if peak is None:
+        # ru_maxrss (KiB on Linux) is never reset
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+class StageTimer:
+    """Collects one record per timed stage"""
+
+    def __init__(self, verbose=True):
+        self.stages = []
+        self.verbose = verbose
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        gc.collect()
+        peak_is_per_stage = _reset_peak()
+        rss_before = _rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield
+        record = {
+            'stage': name,
+            'seconds': time.perf_counter() - wall,
+            'cpu_seconds': time.process_time() - cpu,
+            'rss_before_mb': rss_before,
+            'peak_rss_mb': _peak_mb(),
+            # Without clear_refs the peak is the process-wide high-water mark
+            'peak_is_per_stage': peak_is_per_stage,
+        }
+        self.stages.append(record)
+        if self.verbose:
+            print(f"  {name:<22} {record['seconds']:9.3f} s  cpu {record['cpu_seconds']:9.3f} s  "
+                  f"peak {record['peak_rss_mb']:9.1f} MiB", flush=True)
+
+
+def run_pipeline(path, stage):
+    """Run every stage behind the app on the dump at ``path``"""
+    with stage('csv_parse'):
+        raw = pd.read_csv(path, usecols=USED_COLUMNS, low_memory=False)
+    with stage('date_parse'):
+        pd.to_datetime(raw['bill_date'], format=BILL_DATE_FORMAT)
+    with stage('schema'):
+        apply_schema(raw)
+    rows = len(raw)
+    del raw
+
+    with stage('cache_cold_read'):
+        read_line_items(path)
+    with stage('cache_warm_read'):
+        line_items = read_line_items(path)
+    with stage('aggregate_bills'):
+        bill_data = aggregate_bills(line_items)
+    del line_items
+    with stage('assign_segments'):
+        bill_data = assign_segments(bill_data)
+    with stage('segment_stats'):
+        stats = compute_segment_stats(bill_data)
+    with stage('build_cube'):
+        cube = build_cube(bill_data)
+    with stage('build_sketches'):
+        sketches = build_sketches(bill_data)
+    with stage('bootstrap_segments'):
+        bootstrap = bootstrap_segments(bill_data)
+    with stage('build_histories'):
+        histories = build_histories(bill_data)
+    with stage('build_daily_series'):
+        daily = build_daily_series(bill_data)
+    with stage('build_snapshot'):
+        build_snapshot('benchmark', stats, cube)
+
+    # Per-page work on each rerun, from the structures above
+    with stage('page_executive'):
+        stores = cube.stores[:max(len(cube.stores) // 2, 1)]
+        months = cube.months[:max(len(cube.months) // 2, 1)]
+        segment_kpis(cube.segment_stats(stores, months, patients=False))
+        sketches.distinct_patients(stores, months[0].start_time, months[-1].end_time)
+    with stage('page_funnel'):
+        kpis = segment_kpis(stats)
+        segment_lift(cube)
+        segment_lift(cube, by=('store-name', 'month'))
+    with stage('page_cohorts'):
+        histories.cohort_retention()
+        histories.retention_by_segment()
+        histories.purchase_intervals()
+        histories.transitions()
+        histories.holder_conversion()
+    with stage('page_trends'):
+        for measure in TREND_MEASURES:
+            daily.seasonal_trend(measure)
+            daily.week_over_week(measure, by_store=True)
+    with stage('page_impact'):
+        impact = project_impact(kpis, kpis.overall_conversion + 5, 30_000)
+        simulate_impact(
+            bootstrap,
+            [kpis.direct_pct / 100, kpis.holders_pct / 100, kpis.users_pct / 100],
+            [impact.new_direct_pct / 100, impact.new_holder_pct / 100, impact.new_user_pct / 100],
+            30_000,
+        )
+    with stage('page_documentation'):
+        sweep_from_stats(stats, np.arange(5, 30, 2.5), [10_000, 30_000, 50_000])
+    return {'rows': rows, 'bills': len(bill_data)}
+
+
+def _environment():
+    import pyarrow
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pyarrow.__version__,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Stages slower than ``baseline`` by more than ``tolerance``, per size"""
+    previous = {
+        (run['target_rows'], stage['stage']): stage['seconds']
+        for run in baseline['runs'] for stage in run['stages']
+    }
+    regressions = []
+    for run in results['runs']:
+        for stage in run['stages']:
+            before = previous.get((run['target_rows'], stage['stage']))
+            if before is None or max(before, stage['seconds']) < MIN_COMPARE_SECONDS:
+                continue
+            if stage['seconds'] > before * (1 + tolerance):
+                regressions.append((run['target_rows'], stage['stage'], before, stage['seconds']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000],
+                        help="approximate line items per synthetic dump (100k to 50M)")
+    parser.add_argument('--csv', help="benchmark this dump instead of synthetic ones "
+                                      "(its existing Parquet cache makes the cold read warm)")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown against --baseline (0.25 = 25%%)")
+    parser.add_argument('--workdir', help="where dumps are written (default: a temp dir, removed after)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = {
+        'benchmark': 'pipeline',
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': _environment(),
+        'generator': generator_options(args),
+        'runs': [],
+    }
+    workdir = args.workdir or tempfile.mkdtemp(prefix='zeno-bench-')
+    try:
+        targets = [None] if args.csv else args.rows
+        for target_rows in targets:
+            if args.csv:
+                path = args.csv
+            else:
+                path = os.path.join(workdir, f"line_items_{target_rows}.csv")
+                n_bills = max(int(target_rows / args.items_per_bill), 1)
+                start = time.perf_counter()
+                write_line_items(path, n_bills, **generator_options(args))
+                print(f"generated {path} in {time.perf_counter() - start:.1f} s", flush=True)
+            print(f"{os.path.basename(path)} ({os.path.getsize(path) / 2**20:.0f} MiB)", flush=True)
+            stage = StageTimer()
+            sizes = run_pipeline(path, stage)
+            results['runs'].append(dict(target_rows=target_rows, csv_bytes=os.path.getsize(path),
+                                        **sizes, stages=stage.stages))
+            if not args.csv and not args.workdir:
+                # Large dumps and their Parquet caches add up across sizes
+                os.remove(path)
+                shutil.rmtree(os.path.join(workdir, CACHE_DIR), ignore_errors=True)
+            gc.collect()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f"results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for target_rows, name, before, after in regressions:
+            print(f"REGRESSION rows={target_rows} {name}: {before:.3f} s -> {after:.3f} s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
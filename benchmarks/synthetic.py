@@ -0,0 +1,137 @@
+"""Synthetic line-item dumps in the pilot CSV layout
+
+Writes CSVs with the same columns and formats as the pilot dump (one row
+per drug in a bill; bill-level columns repeated on every line) so the
+benchmarks can run at any size without the real data. Bills are written
+in chunks, so 50M-row files need no more memory than a 100k-row one.
+
+Run from the repository root to write a standalone file:
+
+    python -m benchmarks.synthetic out.csv --rows 1000000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'id',
+    'patient-id',
+    'bill_date',
+    'store-name',
+    'drug-id',
+    'drug-name',
+    'revenue-value',
+    'zrd_promo_discount',
+    'eligibilty_flag',
+]
+
+# Pilot mix (see DOCUMENTATION.md): 61.8% of bills are eligible and 8.7%
+# of eligible bills redeem coins
+ELIGIBILITY_RATE = 0.618
+DISCOUNT_RATE = 0.087
+ITEMS_PER_BILL = 2.0
+N_STORES = 10
+N_DRUGS = 20_000
+CHUNK_BILLS = 250_000
+
+FIRST_BILL_ID = 1_000_000
+START_DATE = '2024-01-01'
+DAYS = 180
+
+
+def _line_items(rng, first_bill, n_bills, items_per_bill, n_stores, n_patients,
+                eligibility_rate, discount_rate, start, days):
+    items = 1 + rng.poisson(items_per_bill - 1, n_bills)
+    line_bill = np.repeat(np.arange(n_bills), items)
+    first_line = np.zeros(len(line_bill), dtype=bool)
+    first_line[np.cumsum(items) - items] = True
+
+    eligible = rng.random(n_bills) < eligibility_rate
+    redeemed = eligible & (rng.random(n_bills) < discount_rate)
+    seconds = rng.integers(0, days * 86_400, n_bills)
+    bill_date = np.datetime_as_string(np.datetime64(start, 's') + seconds.astype('timedelta64[s]'))
+    stores = np.array([f"Store {i + 1:03d}" for i in range(n_stores)])
+
+    revenue = np.round(rng.lognormal(np.log(120), 0.8, len(line_bill)), 2)
+    # A redeeming bill always has the promo on its first line, sometimes on more
+    promo = redeemed[line_bill] & (first_line | (rng.random(len(line_bill)) < 0.3))
+    discount = np.where(promo, np.round(revenue * rng.uniform(0.02, 0.1, len(line_bill)), 2), np.nan)
+
+    drug_id = rng.integers(1, N_DRUGS, len(line_bill))
+    return pd.DataFrame({
+        'id': first_bill + line_bill,
+        'patient-id': rng.integers(1, n_patients + 1, n_bills)[line_bill],
+        'bill_date': np.char.replace(bill_date, 'T', ' ')[line_bill],
+        'store-name': stores[rng.integers(0, n_stores, n_bills)][line_bill],
+        'drug-id': drug_id,
+        'drug-name': np.char.add('Drug ', drug_id.astype(str)),
+        'revenue-value': revenue,
+        'zrd_promo_discount': discount,
+        'eligibilty_flag': eligible[line_bill].astype(np.int8),
+    }, columns=COLUMNS)
+
+
+def write_line_items(path, n_bills, items_per_bill=ITEMS_PER_BILL, n_stores=N_STORES, n_patients=None,
+                     eligibility_rate=ELIGIBILITY_RATE, discount_rate=DISCOUNT_RATE,
+                     start=START_DATE, days=DAYS, seed=0, chunk_bills=CHUNK_BILLS):
+    """Write a synthetic dump of ``n_bills`` bills to ``path``; return the row count
+
+    ``items_per_bill`` is the mean lines per bill (at least one each);
+    ``n_patients`` defaults to a third of the bills, so patients repeat.
+    """
+    if items_per_bill < 1:
+        raise ValueError("items_per_bill must be at least 1")
+    rng = np.random.default_rng(seed)
+    n_patients = n_patients or max(n_bills // 3, 1)
+    rows = 0
+    with open(path, 'w', newline='') as fh:
+        for first in range(0, n_bills, chunk_bills):
+            chunk = _line_items(
+                rng, FIRST_BILL_ID + first, min(chunk_bills, n_bills - first), items_per_bill,
+                n_stores, n_patients, eligibility_rate, discount_rate, start, days,
+            )
+            chunk.to_csv(fh, header=first == 0, index=False)
+            rows += len(chunk)
+    return rows
+
+
+def add_arguments(parser):
+    """Generator options shared by the benchmark scripts"""
+    parser.add_argument('--items-per-bill', type=float, default=ITEMS_PER_BILL)
+    parser.add_argument('--stores', type=int, default=N_STORES)
+    parser.add_argument('--patients', type=int, default=None, help="default: a third of the bills")
+    parser.add_argument('--eligibility-rate', type=float, default=ELIGIBILITY_RATE)
+    parser.add_argument('--discount-rate', type=float, default=DISCOUNT_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generator_options(args):
+    return {
+        'items_per_bill': args.items_per_bill,
+        'n_stores': args.stores,
+        'n_patients': args.patients,
+        'eligibility_rate': args.eligibility_rate,
+        'discount_rate': args.discount_rate,
+        'seed': args.seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=1_000_000, help="approximate line items")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    n_bills = max(int(args.rows / args.items_per_bill), 1)
+    rows = write_line_items(args.path, n_bills, **generator_options(args))
+    print(f"wrote {rows:,} line items in {n_bills:,} bills to {args.path} "
+          f"({os.path.getsize(args.path) / 2**20:.0f} MiB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
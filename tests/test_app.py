@@ -0,0 +1,153 @@
+"""The Streamlit app loaded end to end under ``AppTest`` on synthetic dumps
+
+Each run is a separate interpreter with its own working directory and
+environment, since the pipeline reads its configuration at import time.
+The harness has no ``__main__`` guard, like an app script under
+``streamlit run``: anything that spawns worker processes from it re-runs it.
+"""
+import glob
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_line_items
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'zeno_analytics_app.py')
+N_BILLS = 3000
+TIMEOUT = 300
+
+HARNESS = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+
+results = {}
+for page in sys.argv[2:]:
+    at = AppTest.from_file(sys.argv[1], default_timeout=120)
+    at.run()
+    if not at.exception and at.sidebar.selectbox[0].value != page:
+        at.sidebar.selectbox[0].select(page).run()
+    results[page] = {
+        'exceptions': [exc.message for exc in at.exception],
+        'metrics': {metric.label: metric.value for metric in at.metric},
+    }
+print(json.dumps(results))
+"""
+
+STOPPED_PAGE_HARNESS = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+from zeno_analytics.profiling import RECORDER
+
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+at.sidebar.multiselect[0].select('Store 001')
+at.sidebar.select_slider[0].set_value(('2024-02', '2024-02'))
+at.run()
+print(json.dumps({
+    'warnings': [warning.value for warning in at.warning],
+    'exceptions': [exc.message for exc in at.exception],
+    'spans': RECORDER.totals().get('page.executive_dashboard', {}).get('count', 0),
+}))
+"""
+
+PAGES = ["📊 Executive Dashboard", "📖 Documentation"]
+ALL_PAGES = ["📊 Executive Dashboard", "🔬 Funnel Analysis", "📈 Trends", "💡 Impact Calculator", "📖 Documentation"]
+
+
+def _split_by_store(dump, directory):
+    """Write ``dump`` as one CSV per store under ``directory``"""
+    os.makedirs(directory)
+    for i, (_, lines) in enumerate(pd.read_csv(dump).groupby('store-name')):
+        lines.to_csv(os.path.join(directory, f"part-{i:02d}.csv"), index=False)
+
+
+def _run_app(cwd, env, pages=PAGES, harness_code=HARNESS):
+    env = dict(os.environ, PYTHONPATH=ROOT, **env)
+    harness = os.path.join(cwd, 'harness.py')
+    with open(harness, 'w') as fh:
+        fh.write(harness_code)
+    # Own process group, so a hang takes any worker processes down with it
+    proc = subprocess.Popen(
+        [sys.executable, harness, APP, *pages], cwd=cwd, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True,
+    )
+    try:
+        out, err = proc.communicate(timeout=TIMEOUT)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.communicate()
+        pytest.fail(f"App did not finish loading within {TIMEOUT}s")
+    assert proc.returncode == 0, err
+    return json.loads(out.splitlines()[-1])
+
+
+def _assert_loaded(results):
+    for page, result in results.items():
+        assert result['exceptions'] == [], page
+    assert results[PAGES[0]]['metrics']['Total Bills'] == f"{N_BILLS:,}"
+
+
+def test_dump_glob_with_several_ingest_workers(tmp_path):
+    dump = tmp_path / 'full.csv'
+    write_line_items(dump, N_BILLS)
+    _split_by_store(dump, tmp_path / 'dumps')
+    dump.unlink()
+    _assert_loaded(_run_app(tmp_path, {'ZENO_DUMP_GLOB': 'dumps', 'ZENO_INGEST_WORKERS': '3'}))
+
+
+def test_base_dump_with_daily_dumps(tmp_path):
+    write_line_items(tmp_path / 'full.csv', N_BILLS)
+    lines = pd.read_csv(tmp_path / 'full.csv')
+    os.remove(tmp_path / 'full.csv')
+    # The base dump holds the first half of the bills, two daily dumps the rest
+    ids = lines['id'].unique()
+    base, first, second = ids[:N_BILLS // 2], ids[N_BILLS // 2:3 * N_BILLS // 4], ids[3 * N_BILLS // 4:]
+    lines[lines['id'].isin(base)].to_csv(tmp_path / 'data dump for old pilot stores.csv', index=False)
+    os.makedirs(tmp_path / 'daily dumps')
+    for day, chunk in zip(['2024-07-01', '2024-07-02'], [first, second]):
+        lines[lines['id'].isin(chunk)].to_csv(tmp_path / 'daily dumps' / f"{day}.csv", index=False)
+    _assert_loaded(_run_app(tmp_path, {'ZENO_INGEST_WORKERS': '3'}))
+
+
+def test_sql_backend_skips_the_bill_table(tmp_path):
+    write_line_items(tmp_path / 'data dump for old pilot stores.csv', N_BILLS)
+    results = _run_app(tmp_path, {'ZENO_BACKEND': 'sql', 'ZENO_SQL_ENGINE': 'sqlite'}, ALL_PAGES)
+    _assert_loaded(results)
+    assert glob.glob(str(tmp_path / '.zeno_cache' / 'bills.*.sqlite'))
+    assert not glob.glob(str(tmp_path / '.zeno_cache' / 'bills.*.arrow'))
+
+
+def test_unfiltered_customers_are_exact(tmp_path):
+    # More bills than the sketches count exactly
+    dump = tmp_path / 'data dump for old pilot stores.csv'
+    write_line_items(dump, 60_000)
+    patients = pd.read_csv(dump, usecols=['patient-id'])['patient-id'].nunique()
+    metrics = _run_app(tmp_path, {}, PAGES[:1])[PAGES[0]]['metrics']
+    assert metrics['Unique Customers'] == f"{patients:,}"
+
+
+def test_page_span_closes_when_the_page_stops(tmp_path):
+    # Store 001 only sells in January, Store 002 only in February
+    lines = pd.DataFrame({
+        'id': [1, 2, 3, 4],
+        'patient-id': [10, 11, 12, 13],
+        'bill_date': ['2024-01-05 10:00:00', '2024-01-06 10:00:00', '2024-02-05 10:00:00', '2024-02-06 10:00:00'],
+        'store-name': ['Store 001', 'Store 001', 'Store 002', 'Store 002'],
+        'drug-id': [5, 6, 7, 8],
+        'drug-name': ['Drug 5', 'Drug 6', 'Drug 7', 'Drug 8'],
+        'revenue-value': [100.0, 120.0, 90.0, 80.0],
+        'zrd_promo_discount': [None, 5.0, None, None],
+        'eligibilty_flag': [0, 1, 1, 0],
+    })
+    lines.to_csv(tmp_path / 'data dump for old pilot stores.csv', index=False)
+    result = _run_app(tmp_path, {}, [], STOPPED_PAGE_HARNESS)
+    assert result['exceptions'] == []
+    assert result['warnings'] == ["No bills match the selected filters"]
+    # The first run and the stopped rerun each recorded their page span
+    assert result['spans'] == 2
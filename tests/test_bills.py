@@ -0,0 +1,54 @@
+"""Streaming and parallel bill aggregation against the one-shot groupby"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_line_items
+from zeno_analytics.bills import aggregate_bills, aggregate_bills_streaming, finish_bills, partial_bills_parallel
+from zeno_analytics.ingest import read_line_items
+
+N_BILLS = 5000
+
+
+@pytest.fixture(scope='module')
+def dumps(tmp_path_factory):
+    """The full dump, and the same lines split into three files mid-bill"""
+    directory = tmp_path_factory.mktemp('dumps')
+    full = directory / 'full.csv'
+    write_line_items(full, N_BILLS)
+    lines = pd.read_csv(full)
+    # Missing values on some bills' first lines, so 'first' has to skip them
+    first_lines = np.flatnonzero(~lines['id'].duplicated().to_numpy())[::7]
+    lines.loc[first_lines, 'patient-id'] = np.nan
+    lines.loc[first_lines[::2], 'store-name'] = np.nan
+    lines.to_csv(full, index=False)
+
+    # Cut inside a multi-line bill near each third of the file
+    continues = np.flatnonzero(lines['id'].duplicated().to_numpy())
+    cuts = [0] + [int(continues[np.searchsorted(continues, len(lines) * k // 3)]) for k in (1, 2)] + [len(lines)]
+    parts = []
+    for i in range(3):
+        parts.append(str(directory / f"part{i}.csv"))
+        lines.iloc[cuts[i]:cuts[i + 1]].to_csv(parts[-1], index=False)
+    return str(full), parts
+
+
+@pytest.fixture(scope='module')
+def expected(dumps):
+    full, _ = dumps
+    return aggregate_bills(read_line_items(full))
+
+
+# 97 lines split most multi-line bills across chunks somewhere in the dump
+@pytest.mark.parametrize('chunk_rows', [97, 997, 10**6])
+def test_streaming_matches_groupby(dumps, expected, chunk_rows):
+    full, _ = dumps
+    pd.testing.assert_frame_equal(aggregate_bills_streaming(full, chunk_rows=chunk_rows), expected)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('chunk_rows', [97, 10**6])
+def test_parallel_matches_groupby(dumps, expected, workers, chunk_rows):
+    _, parts = dumps
+    actual = finish_bills(partial_bills_parallel(parts, chunk_rows, workers))
+    pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,67 @@
+"""Patient histories against a naive per-patient pandas computation"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from zeno_analytics.cohorts import build_histories
+from zeno_analytics.segments import SEGMENT_DTYPE, SEGMENTS
+
+N_BILLS = 20_000
+N_PATIENTS = 3_000
+
+
+@pytest.fixture(scope='module')
+def bill_data():
+    rng = np.random.default_rng(0)
+    # Bills at a few fixed times of day, so many share a patient and timestamp
+    dates = (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 200, N_BILLS), unit='D')
+             + pd.to_timedelta(rng.choice([9, 13, 18], N_BILLS), unit='h'))
+    patients = rng.integers(0, N_PATIENTS, N_BILLS).astype(np.int32)
+    return pd.DataFrame({
+        'id': np.arange(N_BILLS, dtype=np.int32),
+        'patient-id': pd.Series(patients, dtype='Int32').where(rng.random(N_BILLS) > 0.01),
+        'bill_date': pd.Series(dates).where(rng.random(N_BILLS) > 0.01),
+        'user_segment': pd.Categorical.from_codes(rng.integers(0, 3, N_BILLS), dtype=SEGMENT_DTYPE),
+    })
+
+
+@pytest.fixture(scope='module')
+def naive(bill_data):
+    """Bills with an ID and date, ordered per patient by date, then bill id"""
+    bills = bill_data.dropna(subset=['patient-id', 'bill_date'])
+    return bills.sort_values(['patient-id', 'bill_date', 'id'], kind='stable').reset_index(drop=True)
+
+
+def test_transitions(bill_data, naive):
+    # Bills of a patient at the same time follow each other in bill id order
+    following = naive.groupby('patient-id')['user_segment'].shift(-1)
+    pairs = naive.assign(to_segment=following).dropna(subset=['to_segment'])
+    expected = pd.crosstab(pairs['user_segment'].astype(str), pairs['to_segment'].astype(str))
+    expected = expected.reindex(index=SEGMENTS, columns=SEGMENTS, fill_value=0)
+    actual = build_histories(bill_data).transitions()
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+
+def test_repeat_rate(bill_data, naive):
+    expected = (naive.groupby('patient-id').size() > 1).mean()
+    assert build_histories(bill_data).repeat_rate() == pytest.approx(expected)
+
+
+def test_cohort_retention(bill_data, naive):
+    months = naive['bill_date'].dt.to_period('M')
+    cohort = months.groupby(naive['patient-id']).transform('min')
+    active = pd.DataFrame({'patient': naive['patient-id'], 'cohort': cohort,
+                           'age': (months - cohort).map(lambda offset: offset.n)}).drop_duplicates()
+    sizes = active[active['age'] == 0].groupby('cohort').size()
+    shares = active.groupby(['cohort', 'age']).size().unstack(fill_value=0).div(sizes, axis=0)
+
+    actual = build_histories(bill_data).cohort_retention()
+    assert actual['patients'].tolist() == sizes.tolist()
+    last = months.max()
+    for cohort_month, row in actual.drop(columns='patients').iterrows():
+        for age, share in row.items():
+            if cohort_month + age > last:
+                assert np.isnan(share)
+            else:
+                assert share == pytest.approx(shares.loc[cohort_month].get(age, 0.0))
+
@@ -0,0 +1,93 @@
+"""Extending the additive structures with appended bills matches a rebuild"""
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_line_items
+from zeno_analytics.bills import finish_bills, partial_bills_parallel
+from zeno_analytics.cube import build_cube, extend_cube
+from zeno_analytics.pipeline import _appended_bills, _extended
+from zeno_analytics.segments import assign_segments, compute_segment_stats
+from zeno_analytics.sqlstore import check_parity
+from zeno_analytics.timeseries import build_daily_series, extend_daily_series
+
+N_BILLS = 5000
+
+
+@pytest.fixture(scope='module', params=['integer ids', 'string ids'])
+def bill_data(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp('dumps') / 'dump.csv'
+    write_line_items(path, N_BILLS)
+    if request.param == 'string ids':
+        # Non-integer IDs are read as categories
+        lines = pd.read_csv(path)
+        lines['id'] = 'B' + lines['id'].astype(str)
+        lines['patient-id'] = 'P' + lines['patient-id'].astype(str)
+        lines.to_csv(path, index=False)
+    return assign_segments(finish_bills(partial_bills_parallel([str(path)])))
+
+
+def _split(bill_data, split):
+    """The table before ``split``'s bills arrived, with its own categories"""
+    if split == 'late':
+        added = bill_data['bill_date'] > bill_data['bill_date'].quantile(0.8)
+    elif split == 'mixed':
+        added = np.random.default_rng(0).random(len(bill_data)) < 0.1
+    else:
+        # Every bill of one store is new
+        added = bill_data['store-name'] == bill_data['store-name'].iloc[0]
+    old = bill_data[~added].reset_index(drop=True)
+    for column in ['id', 'patient-id', 'store-name']:
+        if isinstance(old[column].dtype, pd.CategoricalDtype):
+            old[column] = old[column].cat.remove_unused_categories()
+    return old, bill_data[added]
+
+
+def _cells(cube):
+    cells = cube.cells.astype({'store-name': str, 'month': str, 'user_segment': str})
+    return cells.sort_values(['store-name', 'month', 'user_segment']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('split', ['late', 'mixed', 'new store'])
+def test_extended_cube_matches_rebuild(bill_data, split):
+    old, added = _split(bill_data, split)
+    extended, rebuilt = extend_cube(build_cube(old), added), build_cube(bill_data)
+    pd.testing.assert_frame_equal(_cells(extended), _cells(rebuilt), check_dtype=False)
+    assert extended.stores == rebuilt.stores
+    assert extended.segment_stats(months=rebuilt.months[:2]).total_patients == \
+        rebuilt.segment_stats(months=rebuilt.months[:2]).total_patients
+
+
+@pytest.mark.parametrize('split', ['late', 'mixed', 'new store'])
+def test_extended_daily_series_matches_rebuild(bill_data, split):
+    old, added = _split(bill_data, split)
+    extended, rebuilt = extend_daily_series(build_daily_series(old), added), build_daily_series(bill_data)
+    assert extended.dates.equals(rebuilt.dates)
+    assert extended.stores == rebuilt.stores
+    np.testing.assert_allclose(extended.cumulative, rebuilt.cumulative, rtol=1e-12)
+
+
+def test_appended_bills_are_found(bill_data):
+    old, added = _split(bill_data, 'new store')
+    found = _appended_bills(old, bill_data)
+    assert found is not None
+    assert found['id'].tolist() == added['id'].tolist()
+
+
+def test_changed_bills_are_not_an_append(bill_data):
+    old, _ = _split(bill_data, 'mixed')
+    changed = bill_data.copy()
+    changed.loc[changed['id'] == old['id'].iloc[10], 'revenue-value'] += 1
+    assert _appended_bills(old, changed) is None
+    # A bill dropped from the new table
+    assert _appended_bills(old, bill_data[bill_data['id'] != old['id'].iloc[10]]) is None
+
+
+def test_extended_stats_match(bill_data):
+    old, _ = _split(bill_data, 'late')
+    previous = SimpleNamespace(bill_data=old, cube=build_cube(old), daily=build_daily_series(old))
+    _, _, stats = _extended(previous, bill_data)
+    parity = check_parity(compute_segment_stats(bill_data), stats)
+    assert parity['match'].all(), parity[~parity['match']]
@@ -0,0 +1,53 @@
+"""Size-bounded LRU cache"""
+from zeno_analytics.lru import SizedLRUCache
+
+
+def _cache(max_bytes):
+    # Values are their own size
+    return SizedLRUCache(max_bytes, sizeof=lambda value: value)
+
+
+def test_hit_skips_the_build():
+    cache = _cache(10)
+    assert cache.get_or_build('a', lambda: 3) == 3
+    assert cache.get_or_build('a', lambda: 4) == 3
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_by_size():
+    cache = _cache(10)
+    for key in 'abc':
+        cache.get_or_build(key, lambda: 3)
+    assert (len(cache), cache.size_bytes) == (3, 9)
+    cache.get_or_build('d', lambda: 4)
+    # 'a' was the oldest; dropping it leaves 10 bytes
+    assert (len(cache), cache.size_bytes) == (3, 10)
+    assert cache.get_or_build('a', lambda: 5) == 5
+
+
+def test_hit_makes_an_entry_recent():
+    cache = _cache(10)
+    for key in 'abc':
+        cache.get_or_build(key, lambda: 3)
+    cache.get_or_build('a', lambda: 0)
+    cache.get_or_build('d', lambda: 3)
+    # 'b' is now the least recently used
+    assert cache.get_or_build('a', lambda: 0) == 3
+    assert cache.get_or_build('c', lambda: 0) == 3
+    assert cache.get_or_build('b', lambda: 1) == 1
+
+
+def test_oversized_value_is_returned_but_not_cached():
+    cache = _cache(10)
+    cache.get_or_build('a', lambda: 3)
+    assert cache.get_or_build('big', lambda: 11) == 11
+    assert (len(cache), cache.size_bytes) == (1, 3)
+    assert cache.get_or_build('big', lambda: 12) == 12
+    assert cache.get_or_build('a', lambda: 0) == 3
+
+
+def test_clear():
+    cache = _cache(10)
+    cache.get_or_build('a', lambda: 3)
+    cache.clear()
+    assert (len(cache), cache.size_bytes) == (0, 0)
@@ -0,0 +1,59 @@
+"""Data-quality checks over a small crafted dump"""
+import pandas as pd
+import pytest
+
+from zeno_analytics.ingest import USED_COLUMNS, apply_schema
+from zeno_analytics.quality import CHECKS, QualityScan
+
+COLUMNS = ['id', 'patient-id', 'bill_date', 'store-name', 'revenue-value',
+           'zrd_promo_discount', 'drug-id', 'eligibilty_flag']
+LINES = [
+    (1, 10, '2024-01-01 10:00:00', 'A', 100, None, 5, 0),
+    (1, 10, '2024-01-01 10:00:00', 'A', 100, None, 5, 0),   # duplicate
+    (2, 11, 'not a date', 'A', 50, 'abc', 6, 1),            # bad date and amount
+    (3, 12, '2024-01-02 10:00:00', 'B', -20, None, 7, 0),   # negative revenue
+    (4, 13, '2024-01-03 10:00:00', 'B', 10, 30, 8, 1),      # discount over revenue
+    (5, 14, '2024-01-04 10:00:00', 'A', 10, None, 9, 0),
+    (5, 15, '2024-01-04 10:00:00', 'B', 10, None, 10, 0),   # patient and store disagree
+    (6, 16, '2024-01-05 10:00:00', 'A', 10, None, 9, 0),
+    (6, 16, '2024-01-05 10:00:00', 'A', 10, None, 9, 0),    # duplicate
+    (6, 16, '2024-02-05 10:00:00', 'A', 10, None, 11, 0),   # date disagrees
+]
+EXPECTED = {
+    'unparseable_dates': 1,
+    'unparseable_amounts': 1,
+    'negative_revenue': 1,
+    'discount_over_revenue': 1,
+    'identical_lines': 2,
+    'inconsistent_bills': 2,
+}
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / 'dump.csv'
+    pd.DataFrame(LINES, columns=COLUMNS).to_csv(path, index=False)
+    return path
+
+
+def _scan(path, chunk_rows):
+    scan = QualityScan()
+    for raw in pd.read_csv(path, usecols=USED_COLUMNS, low_memory=False, chunksize=chunk_rows):
+        scan.update(raw, apply_schema(raw))
+    return scan.report()
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 3, 4, 100])
+def test_counts_do_not_depend_on_chunking(dump, chunk_rows):
+    report = _scan(dump, chunk_rows)
+    assert set(report['counts']) == set(CHECKS)
+    assert report['counts'] == EXPECTED
+    assert report['lines'] == len(LINES)
+    assert report['bills'] == 6
+
+
+def test_samples_point_at_csv_lines(dump):
+    samples = _scan(dump, 3)['samples']
+    # Header is line 1, so the second data line is line 3
+    assert [row['line'] for row in samples['identical_lines']] == ['3', '10']
+    assert sorted(row['id'] for row in samples['inconsistent_bills']) == ['5', '6']
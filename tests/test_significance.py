@@ -0,0 +1,75 @@
+"""Student t distribution against published table values"""
+import numpy as np
+import pytest
+
+from zeno_analytics.significance import _betainc, t_quantile, t_two_sided_p
+
+# Two-sided 95% critical values of Student's t
+T_975 = {
+    1: 12.7062047,
+    2: 4.30265273,
+    3: 3.18244631,
+    5: 2.57058184,
+    10: 2.22813885,
+    29: 2.04522964,
+    30: 2.04227246,
+    100: 1.98397152,
+    1000: 1.96233908,
+    1e6: 1.95996625,
+}
+# (t, df, two-sided p)
+P_VALUES = [
+    (12.7062047, 1, 0.05),
+    (63.6567412, 1, 0.01),
+    (4.30265273, 2, 0.05),
+    (3.16927267, 10, 0.01),
+    (2.04227246, 30, 0.05),
+    (1.98397152, 100, 0.05),
+    (2.57582930, 1e6, 0.01),
+    (0.0, 5, 1.0),
+]
+
+
+@pytest.mark.parametrize('a, b, x, expected', [
+    (2, 3, 0.4, 0.5248),              # binomial sum: P(Bin(4, 0.4) >= 2)
+    (1, 1, 0.3, 0.3),                 # uniform
+    (3, 1, 0.3, 0.027),               # x ** a
+    (1, 4, 0.2, 1 - 0.8 ** 4),        # 1 - (1 - x) ** b
+    (0.5, 0.5, 0.5, 0.5),             # symmetric
+    (3, 1, 0.9, 0.729),               # above the mean: symmetry branch
+    (1, 4, 0.8, 1 - 0.2 ** 4),
+])
+def test_betainc_closed_forms(a, b, x, expected):
+    assert float(_betainc(a, b, x)) == pytest.approx(expected, rel=1e-6)
+
+
+def test_betainc_edges_and_shapes():
+    result = _betainc([2.0, 2.0, 2.0], 3.0, [0.0, 0.4, 1.0])
+    assert result.shape == (3,)
+    np.testing.assert_allclose(result, [0.0, 0.5248, 1.0], atol=1e-12)
+
+
+@pytest.mark.parametrize('t, df, expected', P_VALUES)
+def test_two_sided_p(t, df, expected):
+    assert float(t_two_sided_p(t, df)) == pytest.approx(expected, rel=1e-6, abs=1e-9)
+
+
+def test_two_sided_p_is_symmetric_and_rejects_bad_input():
+    np.testing.assert_allclose(t_two_sided_p([-2.5, 2.5], 7), t_two_sided_p(2.5, 7))
+    assert np.isnan(t_two_sided_p([np.nan, 1.0], [5, 0])).all()
+
+
+@pytest.mark.parametrize('df', sorted(T_975))
+def test_quantile_matches_table(df):
+    # Refined to the table's precision below 30 df; Cornish-Fisher alone above
+    rel = 1e-7 if df < 30 else 1e-5
+    assert float(t_quantile(0.975, df)) == pytest.approx(T_975[df], rel=rel)
+    assert float(t_quantile(0.025, df)) == pytest.approx(-T_975[df], rel=rel)
+
+
+def test_quantile_inverts_p_value():
+    df = np.array([1.0, 1.7, 3.5, 12.0, 45.0, 400.0])
+    for probability in [0.9, 0.975, 0.995]:
+        t = t_quantile(probability, df)
+        assert t.shape == df.shape
+        np.testing.assert_allclose(t_two_sided_p(t, df), 2 * (1 - probability), rtol=1e-4)
@@ -0,0 +1,80 @@
+"""Distinct-patient sketches against exact counts"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from zeno_analytics.segments import SEGMENT_DTYPE
+from zeno_analytics.sketches import EXACT_MAX_BILLS, build_sketches
+
+N_BILLS = 200_000
+N_PATIENTS = 120_000
+STORES = [f"Store {i:03d}" for i in range(1, 6)]
+
+
+@pytest.fixture(scope='module')
+def bill_data():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'patient-id': rng.integers(0, N_PATIENTS, N_BILLS).astype(np.int32),
+        'bill_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90 * 86_400, N_BILLS), unit='s'),
+        'store-name': pd.Categorical(rng.choice(STORES, N_BILLS)),
+        'user_segment': pd.Categorical.from_codes(rng.integers(0, 3, N_BILLS), dtype=SEGMENT_DTYPE),
+    })
+
+
+@pytest.fixture(scope='module')
+def sketches(bill_data):
+    return build_sketches(bill_data)
+
+
+SLICES = [
+    {},
+    {'stores': STORES[:2]},
+    {'start': '2024-02-01', 'end': '2024-02-29 23:59:59'},
+    {'stores': STORES[1:4], 'segments': ['Coin Holders', 'Coin Users']},
+]
+
+
+def _exact(bill_data, stores=None, start=None, end=None, segments=None):
+    mask = pd.Series(True, index=bill_data.index)
+    if stores is not None:
+        mask &= bill_data['store-name'].isin(stores)
+    if segments is not None:
+        mask &= bill_data['user_segment'].isin(segments)
+    days = bill_data['bill_date'].dt.normalize()
+    if start is not None:
+        mask &= days >= pd.Timestamp(start)
+    if end is not None:
+        mask &= days <= pd.Timestamp(end)
+    return bill_data.loc[mask, 'patient-id'].nunique(), int(mask.sum())
+
+
+@pytest.mark.parametrize('slice_', SLICES)
+def test_estimate_within_error_bound(bill_data, sketches, slice_):
+    expected, _ = _exact(bill_data, **slice_)
+    count = sketches.distinct_patients(**slice_, exact_max_bills=0)
+    assert not count.exact
+    # About 99.7% of estimates fall within three standard errors
+    assert abs(count.value - expected) <= 3 * count.relative_error * expected
+
+
+@pytest.mark.parametrize('slice_', SLICES)
+def test_small_slices_are_exact(bill_data, sketches, slice_):
+    expected, bills = _exact(bill_data, **slice_)
+    count = sketches.distinct_patients(**slice_, exact_max_bills=bills)
+    assert count == (expected, True, 0.0)
+    assert not sketches.distinct_patients(**slice_, exact_max_bills=bills - 1).exact
+
+
+def test_default_exact_threshold(bill_data, sketches):
+    # One store over a few weeks stays under the default threshold
+    slice_ = {'stores': STORES[:1], 'start': '2024-01-01', 'end': '2024-01-21'}
+    expected, bills = _exact(bill_data, **slice_)
+    assert bills <= EXACT_MAX_BILLS
+    assert sketches.distinct_patients(**slice_) == (expected, True, 0.0)
+    assert not sketches.distinct_patients().exact
+
+
+def test_precision_is_checked(bill_data):
+    with pytest.raises(ValueError):
+        build_sketches(bill_data, precision=8)
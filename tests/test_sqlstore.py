@@ -0,0 +1,85 @@
+"""SQL backend parity with the pandas pipeline on a synthetic dump"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_line_items
+from zeno_analytics.bills import finish_bills, partial_bills_parallel
+from zeno_analytics.cube import build_cube
+from zeno_analytics.segments import assign_segments, compute_segment_stats
+from zeno_analytics.snapshots import build_snapshot
+from zeno_analytics.sqlstore import SqlStore, build_sql_store, check_parity
+
+N_BILLS = 5000
+# Small chunks, so bills span chunks as well as files
+CHUNK_ROWS = 997
+
+
+@pytest.fixture(scope='module', params=['integer ids', 'string ids'])
+def backends(request, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('dumps')
+    write_line_items(directory / 'full.csv', N_BILLS)
+    lines = pd.read_csv(directory / 'full.csv')
+    if request.param == 'string ids':
+        # Non-integer IDs are read as categories
+        lines['id'] = 'B' + lines['id'].astype(str)
+        lines['patient-id'] = 'P' + lines['patient-id'].astype(str)
+    # Split mid-bill: the bill on the boundary has lines in both files
+    sources = [str(directory / 'a.csv'), str(directory / 'b.csv')]
+    half = len(lines) // 2
+    lines.iloc[:half].to_csv(sources[0], index=False)
+    lines.iloc[half:].to_csv(sources[1], index=False)
+
+    bill_data = assign_segments(finish_bills(partial_bills_parallel(sources, CHUNK_ROWS)))
+    path = str(directory / 'bills.sqlite')
+    build_sql_store(sources, path, engine='sqlite', chunk_rows=CHUNK_ROWS)
+    return bill_data, SqlStore(path, engine='sqlite')
+
+
+def _keys(index):
+    return [tuple(map(str, key)) if isinstance(key, tuple) else str(key) for key in index]
+
+
+def test_segment_stats_match(backends):
+    bill_data, store = backends
+    parity = check_parity(compute_segment_stats(bill_data), store.segment_stats())
+    assert parity['match'].all(), parity[~parity['match']]
+
+
+def test_filtered_segment_stats_match(backends):
+    bill_data, store = backends
+    cube = build_cube(bill_data)
+    stores, months = cube.stores[:3], cube.months[1:3]
+    parity = check_parity(cube.segment_stats(stores, months), store.segment_stats(stores, months))
+    assert parity['match'].all(), parity[~parity['match']]
+
+
+@pytest.mark.parametrize('by', [(), ('user_segment',), ('month',), ('store-name', 'month', 'user_segment')])
+def test_query_matches_cube(backends, by):
+    bill_data, store = backends
+    cube = build_cube(bill_data)
+    expected, actual = cube.query(by=by), store.query(by=by)
+    assert _keys(actual.index) == _keys(expected.index)
+    columns = list(expected.columns)
+    np.testing.assert_allclose(actual[columns].to_numpy(float), expected[columns].to_numpy(float), rtol=1e-9)
+
+
+def test_filtered_query_matches_cube(backends):
+    bill_data, store = backends
+    cube = build_cube(bill_data)
+    assert store.stores == cube.stores
+    assert store.months == cube.months
+    filters = dict(stores=cube.stores[:2], months=cube.months[2:4], segments=['Coin Holders', 'Coin Users'])
+    expected = cube.query(by=('store-name',), **filters)
+    actual = store.query(by=('store-name',), **filters)
+    assert _keys(actual.index) == _keys(expected.index)
+    np.testing.assert_allclose(actual.to_numpy(float), expected[actual.columns].to_numpy(float), rtol=1e-9)
+
+
+def test_snapshot_matches(backends):
+    bill_data, store = backends
+    expected = build_snapshot('v', compute_segment_stats(bill_data), build_cube(bill_data))
+    actual = build_snapshot('v', store.segment_stats(), store)
+    assert actual.rows.keys() == expected.rows.keys()
+    for key, values in expected.rows.items():
+        np.testing.assert_allclose(actual.rows[key], values, rtol=1e-9)
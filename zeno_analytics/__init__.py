@@ -0,0 +1,59 @@
+"""Headless analytics core for the Zeno Coin Analytics Platform
+
+Data loading, bill aggregation, segmentation and the KPI / impact math,
+usable without Streamlit or Plotly. Submodules are imported on first
+attribute access, so ``import zeno_analytics`` itself is nearly free::
+
+    import zeno_analytics as za
+
+    bills = za.load_bill_data()
+    kpis = za.segment_kpis(za.compute_segment_stats(bills))
+"""
+import importlib
+
+_EXPORTS = {
+    'BackgroundRefresher': 'refresh',
+    'aggregate_bills': 'bills',
+    'aggregate_bills_streaming': 'bills',
+    'bootstrap_segments': 'simulation',
+    'build_cube': 'cube',
+    'build_daily_series': 'timeseries',
+    'build_histories': 'cohorts',
+    'build_sketches': 'sketches',
+    'build_snapshot': 'snapshots',
+    'compute_segment_stats': 'segments',
+    'current_version': 'pipeline',
+    'extend_cube': 'cube',
+    'extend_daily_series': 'timeseries',
+    'load_bill_data': 'pipeline',
+    'load_shared_bill_data': 'pipeline',
+    'load_snapshot': 'snapshots',
+    'load_sql_store': 'pipeline',
+    'partial_bills_parallel': 'bills',
+    'prepare_dataset': 'pipeline',
+    'project_impact': 'impact',
+    'quality_report': 'ingest',
+    'read_line_items': 'ingest',
+    'segment_kpis': 'kpis',
+    'segment_lift': 'significance',
+    'simulate_impact': 'simulation',
+    'sweep_from_stats': 'impact',
+    'sweep_scenarios': 'impact',
+    'SEGMENTS': 'segments',
+    'SegmentStats': 'segments',
+    'SqlStore': 'sqlstore',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
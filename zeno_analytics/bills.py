@@ -0,0 +1,153 @@
+"""Bill-level aggregation of line items
+
+``aggregate_bills`` groups a full line-item frame in one pass.
+``aggregate_bills_streaming`` produces the same table from chunks, so peak
+memory is bounded by the chunk size plus the bill table.
+``partial_bills_parallel`` pre-aggregates many dump files, optionally in a
+process pool; batch jobs size it with ``ZENO_INGEST_WORKERS`` (default one
+per CPU).
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .ingest import CHUNK_ROWS, DATA_FILE, PAISE_PER_RUPEE, iter_line_items, read_line_items
+from .profiling import Span, timed
+
+INGEST_WORKERS = int(os.environ.get('ZENO_INGEST_WORKERS', 0)) or os.cpu_count() or 1
+
+BILL_AGGREGATION = {
+    'patient-id': 'first',
+    'bill_date': 'first',
+    'store-name': 'first',
+    'revenue-value': 'sum',
+    'zrd_promo_discount': 'sum',
+    'drug-id': 'count',
+    'eligibilty_flag': 'max',
+    'has_zeno_discount': 'max'
+}
+
+# How two partial aggregates of the same bill combine. Partials are kept in
+# source order, so 'first' of partials is the first non-null line overall.
+_COMBINE = {'first': 'first', 'sum': 'sum', 'count': 'sum', 'max': 'max'}
+PARTIAL_AGGREGATION = {column: _COMBINE[how] for column, how in BILL_AGGREGATION.items()}
+
+
+def finish_bills(partials):
+    """Turn per-bill partial aggregates into the bill_data layout"""
+    bill_data = partials.reset_index()
+    bill_data.rename(columns={'drug-id': 'items_per_bill'}, inplace=True)
+    bill_data['items_per_bill'] = bill_data['items_per_bill'].astype('int16')
+    for column in ['revenue-value', 'zrd_promo_discount']:
+        bill_data[column] = bill_data[column] / PAISE_PER_RUPEE
+    return bill_data
+
+
+@timed('bills.aggregate')
+def aggregate_bills(line_items):
+    """Aggregate a line-item frame to one row per bill"""
+    return finish_bills(line_items.groupby('id').agg(BILL_AGGREGATION))
+
+
+def _concat(frames):
+    """Concatenate partials, unioning categories so categoricals survive"""
+    frames = [frame.reset_index() for frame in frames]
+    combined = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            combined[column] = pd.Series(union_categoricals(parts, sort_categories=True))
+        else:
+            combined[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(combined)
+
+
+@timed('bills.fold_partials')
+def fold_partials(frames):
+    """Combine per-bill partials given in source order into one partial"""
+    return _concat(frames).groupby('id').agg(PARTIAL_AGGREGATION)
+
+
+def merge_partials(stored, new):
+    """Fold ``new`` partials into ``stored``, re-aggregating only shared bills
+
+    Unlike ``fold_partials`` the cost of the groupby scales with ``new``;
+    bills of ``stored`` that do not reappear are carried over untouched.
+    """
+    touched = stored.index.isin(new.index)
+    merged = fold_partials([stored[touched], new])
+    return _concat([stored[~touched], merged]).set_index('id').sort_index()
+
+
+def partial_bills(path=DATA_FILE, chunk_rows=CHUNK_ROWS):
+    """Per-bill partial aggregates of a dump, computed chunk by chunk
+
+    Each chunk is reduced to per-bill partials, which are folded into the
+    running table whenever the pending partials outgrow it. Bills that span
+    chunk boundaries are merged by the fold.
+    """
+    folded = None
+    pending, pending_rows = [], 0
+    for chunk in iter_line_items(path, chunk_rows):
+        with Span('bills.aggregate_chunk'):
+            partial = chunk.groupby('id').agg(BILL_AGGREGATION)
+        if folded is None:
+            folded = partial
+            continue
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= len(folded):
+            folded = fold_partials([folded] + pending)
+            pending, pending_rows = [], 0
+    if folded is None:
+        return read_line_items(path).groupby('id').agg(BILL_AGGREGATION)
+    if pending:
+        folded = fold_partials([folded] + pending)
+    return folded
+
+
+@timed('bills.fold_disjoint')
+def fold_disjoint(frames):
+    """``fold_partials`` for frames that mostly hold different bills
+
+    Only bills present in more than one frame go through the groupby; the
+    rest are carried over, so merging per-store dumps costs little more
+    than concatenating them.
+    """
+    combined = _concat(frames)
+    shared = combined['id'].duplicated(keep=False).to_numpy()
+    if shared.any():
+        folded = combined[shared].groupby('id').agg(PARTIAL_AGGREGATION)
+        combined = _concat([combined[~shared].set_index('id'), folded])
+    return combined.set_index('id').sort_index()
+
+
+@timed('bills.partial_bills_parallel')
+def partial_bills_parallel(paths, chunk_rows=CHUNK_ROWS, workers=1):
+    """Per-bill partials of several dumps, one file per worker process
+
+    Each worker parses (and caches) one file and reduces it to per-bill
+    partials; they are folded in ``paths`` order, so bills spanning files
+    resolve exactly as in a single sequential pass. Only batch jobs should
+    ask for ``workers > 1``: spawned workers re-import the caller's main
+    script, which inside a Streamlit server is the app itself.
+    """
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        partials = [partial_bills(path, chunk_rows) for path in paths]
+    else:
+        # Spawned, not forked: callers such as the refresh thread run alongside other threads
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            partials = list(pool.map(partial_bills, paths, [chunk_rows] * len(paths)))
+    return partials[0] if len(partials) == 1 else fold_disjoint(partials)
+
+
+def aggregate_bills_streaming(path=DATA_FILE, chunk_rows=CHUNK_ROWS):
+    """Aggregate a dump to one row per bill without loading all line items
+
+    The result equals ``aggregate_bills(read_line_items(path))``.
+    """
+    return finish_bills(partial_bills(path, chunk_rows))
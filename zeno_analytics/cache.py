@@ -0,0 +1,48 @@
+"""File helpers shared by every on-disk cache
+
+Caches (parsed dumps, the bill store, shared bill tables, snapshots, the
+SQL store) are written under ``CACHE_DIR`` by whichever process gets there
+first and read by all the others, so every write goes through a temp file
+and an atomic rename, and builders on one host take a lock.
+"""
+import contextlib
+import json
+import os
+
+
+def read_manifest(manifest_path):
+    """The JSON manifest at ``manifest_path``, or None if it is missing or unreadable"""
+    try:
+        with open(manifest_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path, write):
+    """Write via a temp file and rename so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def build_lock(path):
+    """Serialise builders on one host so only the first worker aggregates"""
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): concurrent builders race, the atomic rename keeps it safe
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(os.path.join(os.path.dirname(path), 'bills.lock'), 'w') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
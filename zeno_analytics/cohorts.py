@@ -0,0 +1,233 @@
+"""Patient histories: acquisition cohorts, retention and segment transitions
+
+Bills are sorted once by (patient, bill date) into a CSR-style layout: the
+bills of patient ``p`` are rows ``offsets[p]:offsets[p + 1]`` of a few flat
+arrays. Every journey metric is then a vectorized pass over neighbouring
+rows, ``bincount`` over (cohort, age) codes or a ``reduceat`` over the
+patient offsets, never a per-patient groupby.
+
+Bills without a patient ID or bill date are left out.
+"""
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+from .segments import SEGMENTS, segment_codes
+
+RETENTION_MONTHS = 12
+INTERVAL_COLUMNS = ['bills', 'returned', 'return_rate', 'median_days', 'mean_days', 'p25_days', 'p75_days']
+
+
+class HolderConversion(NamedTuple):
+    # Patients with at least one Coin Holders bill
+    holders: int
+    # ... of whom a later bill was a Coin Users bill
+    converted: int
+    rate: float
+    # Days from the first holder bill to the first user bill after it
+    median_days: float
+
+
+def _month_numbers(dates):
+    """Months since 1970-01 of datetime64 values"""
+    return dates.astype('datetime64[M]').astype(np.int64)
+
+
+@dataclass(frozen=True)
+class PatientHistories:
+    """Every bill grouped per patient, in bill-date order
+
+    ``patients[p]`` is the ID of patient code ``p``; the per-bill arrays
+    ``days`` (days since 1970-01-01), ``months`` (months since 1970-01)
+    and ``segments`` (codes into ``SEGMENTS``) are sorted by patient, then
+    date, with patient ``p`` at ``offsets[p]:offsets[p + 1]``.
+    """
+    patients: np.ndarray
+    offsets: np.ndarray
+    days: np.ndarray
+    months: np.ndarray
+    segments: np.ndarray
+
+    @property
+    def n_patients(self):
+        return len(self.patients)
+
+    @property
+    def n_bills(self):
+        return len(self.days)
+
+    @property
+    def bill_patients(self):
+        """Patient code of every bill"""
+        return np.repeat(np.arange(self.n_patients), np.diff(self.offsets))
+
+    @property
+    def first_bills(self):
+        """Position of each patient's first bill"""
+        return self.offsets[:-1]
+
+    def _same_patient(self):
+        """Whether each bill is followed by a bill of the same patient"""
+        follows = np.zeros(self.n_bills, dtype=bool)
+        # Every row except each patient's last has a successor
+        follows[:-1] = True
+        follows[self.offsets[1:] - 1] = False
+        return follows
+
+    def _cohort_counts(self):
+        """Active patients per (first segment, cohort, age in months)
+
+        Returns the counts as a (segments, cohorts, ages) array and the
+        first cohort month number.
+        """
+        cohorts = self.months[self.first_bills]
+        first_month = int(cohorts.min()) if self.n_bills else 0
+        n_months = int(self.months.max()) - first_month + 1 if self.n_bills else 0
+
+        patient = self.bill_patients
+        # Rows are sorted by patient then month, so a change marks a new active month
+        active = np.ones(self.n_bills, dtype=bool)
+        active[1:] = (patient[1:] != patient[:-1]) | (self.months[1:] != self.months[:-1])
+        patient = patient[active]
+        cohort = cohorts[patient] - first_month
+        age = self.months[active] - cohorts[patient]
+        segment = self.segments[self.first_bills][patient].astype(np.int64)
+        codes = (segment * n_months + cohort) * n_months + age
+        counts = np.bincount(codes, minlength=len(SEGMENTS) * n_months * n_months)
+        return counts.reshape(len(SEGMENTS), n_months, n_months), first_month
+
+    def cohort_retention(self, max_age=RETENTION_MONTHS):
+        """Share of each monthly acquisition cohort active ``k`` months later
+
+        Indexed by cohort month, with the cohort size in ``patients`` and
+        one column per age 0..``max_age``; ages past the data's last month
+        are NaN.
+        """
+        counts, first_month = self._cohort_counts()
+        counts = counts.sum(axis=0)
+        n_months = counts.shape[0]
+        ages = min(max_age, n_months - 1) + 1 if n_months else 0
+        sizes = counts[:, 0] if n_months else np.zeros(0, dtype=np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = counts[:, :ages] / sizes[:, None]
+        # Cohort c is observable up to age n_months - 1 - c
+        shares[np.arange(ages)[None, :] > (n_months - 1 - np.arange(n_months))[:, None]] = np.nan
+        table = pd.DataFrame(shares, columns=pd.RangeIndex(ages, name='months_since_first'))
+        table.insert(0, 'patients', sizes)
+        table.index = pd.period_range(
+            pd.Period('1970-01', 'M') + int(first_month), periods=n_months, freq='M', name='cohort'
+        )
+        return table
+
+    def retention_by_segment(self, max_age=RETENTION_MONTHS):
+        """Retention curves by the segment of each patient's first bill
+
+        For age ``k`` only cohorts observed for at least ``k`` months count,
+        so recent cohorts do not drag the curve down. Indexed by months
+        since the first bill, one column per segment.
+        """
+        counts, _ = self._cohort_counts()
+        n_months = counts.shape[1]
+        ages = min(max_age, n_months - 1) + 1 if n_months else 0
+        observed = np.arange(ages)[None, :] <= (n_months - 1 - np.arange(n_months))[:, None]
+        active = (counts[:, :, :ages] * observed).sum(axis=1)
+        sizes = (counts[:, :, :1] * observed).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            curves = active / sizes
+        return pd.DataFrame(curves.T, index=pd.RangeIndex(ages, name='months_since_first'), columns=SEGMENTS)
+
+    def purchase_intervals(self):
+        """Return rate and days to the next bill, by the segment of the earlier bill
+
+        ``returned`` counts bills followed by another bill of the same
+        patient; the day statistics are over those gaps.
+        """
+        follows = self._same_patient()
+        gaps = (self.days[1:] - self.days[:-1])[follows[:-1]]
+        gap_segments = self.segments[:-1][follows[:-1]]
+        bills = np.bincount(self.segments, minlength=len(SEGMENTS))
+        returned = np.bincount(gap_segments, minlength=len(SEGMENTS))
+
+        order = np.argsort(gap_segments, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(returned)])
+        sorted_gaps = gaps[order]
+        rows = []
+        for code in range(len(SEGMENTS)):
+            segment_gaps = sorted_gaps[bounds[code]:bounds[code + 1]]
+            if len(segment_gaps):
+                p25, median, p75 = np.percentile(segment_gaps, [25, 50, 75])
+                mean = segment_gaps.mean()
+            else:
+                p25 = median = p75 = mean = np.nan
+            rows.append((bills[code], returned[code], returned[code] / bills[code] if bills[code] else np.nan,
+                         median, mean, p25, p75))
+        return pd.DataFrame(rows, index=pd.Index(SEGMENTS, name='user_segment'), columns=INTERVAL_COLUMNS)
+
+    def transitions(self):
+        """Counts of consecutive bills of one patient, from segment (rows) to segment (columns)"""
+        follows = self._same_patient()[:-1]
+        pairs = self.segments[:-1][follows].astype(np.int64) * len(SEGMENTS) + self.segments[1:][follows]
+        counts = np.bincount(pairs, minlength=len(SEGMENTS) ** 2).reshape(len(SEGMENTS), len(SEGMENTS))
+        return pd.DataFrame(
+            counts, index=pd.Index(SEGMENTS, name='from_segment'), columns=pd.Index(SEGMENTS, name='to_segment')
+        )
+
+    def holder_conversion(self):
+        """Patients who held coins and redeemed them on a later bill"""
+        if not self.n_bills:
+            return HolderConversion(0, 0, float('nan'), float('nan'))
+        n = self.n_bills
+        rows = np.arange(n)
+        starts = self.first_bills
+        first_holder = np.minimum.reduceat(np.where(self.segments == 1, rows, n), starts)
+        # First user bill after the patient's first holder bill
+        after = (self.segments == 2) & (rows > np.repeat(first_holder, np.diff(self.offsets)))
+        first_user = np.minimum.reduceat(np.where(after, rows, n), starts)
+        holders = first_holder < n
+        converted = first_user < n
+        days = self.days[first_user[converted]] - self.days[first_holder[converted]]
+        n_holders, n_converted = int(holders.sum()), int(converted.sum())
+        return HolderConversion(
+            n_holders, n_converted,
+            n_converted / n_holders if n_holders else float('nan'),
+            float(np.median(days)) if n_converted else float('nan'),
+        )
+
+    def repeat_rate(self):
+        """Share of patients with more than one bill"""
+        return float(np.mean(np.diff(self.offsets) > 1)) if self.n_patients else float('nan')
+
+
+@timed('cohorts.build_histories')
+def build_histories(bill_data):
+    """Sort the bill table once into per-patient, date-ordered histories"""
+    dates = bill_data['bill_date'].to_numpy(dtype='datetime64[ns]')
+    patient_ids = bill_data['patient-id']
+    segments = segment_codes(bill_data)
+    keep = patient_ids.notna().to_numpy() & ~np.isnat(dates)
+    if not keep.all():
+        patient_ids, dates, segments = patient_ids[keep], dates[keep], segments[keep]
+    patient_codes, patients = pd.factorize(patient_ids, sort=True)
+
+    seconds = dates.astype('datetime64[s]').astype(np.int64)
+    if len(seconds):
+        seconds -= seconds.min()
+    span = int(seconds.max(initial=0)) + 1
+    # Both sorts are stable: bills of a patient in the same second keep the table's (bill id) order
+    if len(patients) * span < 2**62:
+        # One argsort of a combined (patient, second) key beats a two-key lexsort
+        order = np.argsort(patient_codes.astype(np.int64) * span + seconds, kind='stable')
+    else:
+        order = np.lexsort((seconds, patient_codes))
+    counts = np.bincount(patient_codes, minlength=len(patients))
+    dates = dates[order]
+    return PatientHistories(
+        patients=np.asarray(patients),
+        offsets=np.concatenate([[0], np.cumsum(counts)]),
+        days=dates.astype('datetime64[D]').astype(np.int64),
+        months=_month_numbers(dates),
+        segments=segments[order],
+    )
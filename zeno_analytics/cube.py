@@ -0,0 +1,198 @@
+"""Pre-aggregated store × month × segment cube
+
+Every KPI the dashboard slices by store or month is a roll-up of a few
+thousand cells, so filter changes never rescan the bill table. Distinct
+patients are not additive; each cell keeps its sorted patient codes
+(CSR-style offsets into one array) so roll-ups de-duplicate across cells.
+
+``extend_cube`` adds a batch of new bills (e.g. a daily dump) to a cube:
+only the new bills are grouped, their cells are summed into the existing
+ones and patient codes are unioned per cell.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+from .segments import MEASURES, SEGMENTS, SegmentStats, sorted_unique
+
+DIMENSIONS = ['store-name', 'month', 'user_segment']
+ADDITIVE_MEASURES = ['bills', 'revenue_sum', 'revenue_sumsq', 'discount_sum', 'items']
+
+
+def csr_positions(offsets, rows):
+    """Flat positions of the given CSR rows, and each row's length
+
+    Gathers every selected row's slice in one vectorized step.
+    """
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return positions, lengths
+
+
+@dataclass(frozen=True)
+class SegmentCube:
+    """Measures per non-empty (store, month, segment) cell
+
+    ``cells`` has the dimension columns plus bills, revenue_sum,
+    revenue_sumsq (for variances), discount_sum, items and patients.
+    ``cell_patients[cell_offsets[i]:cell_offsets[i + 1]]`` are the patient
+    codes seen in cell ``i``; ``patient_ids[code]`` is the patient-id.
+    """
+    cells: pd.DataFrame
+    cell_patients: np.ndarray
+    cell_offsets: np.ndarray
+    patient_ids: np.ndarray
+
+    @property
+    def stores(self):
+        return sorted(self.cells['store-name'].unique())
+
+    @property
+    def months(self):
+        return sorted(self.cells['month'].unique())
+
+    def _select(self, stores=None, months=None, segments=None):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for column, values in (('store-name', stores), ('month', months), ('user_segment', segments)):
+            if values is not None:
+                mask &= self.cells[column].isin(list(values)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def _distinct(self, cell_ids, group_codes, n_groups):
+        """Distinct patients per group over the given cells"""
+        positions, lengths = csr_positions(self.cell_offsets, cell_ids)
+        patients = self.cell_patients[positions].astype(np.int64)
+        groups = np.repeat(group_codes, lengths).astype(np.int64)
+        n_patients = int(self.cell_patients.max()) + 1 if len(self.cell_patients) else 1
+        unique_keys = sorted_unique(groups * n_patients + patients)
+        return np.bincount(unique_keys // n_patients, minlength=n_groups)
+
+    def query(self, stores=None, months=None, segments=None, by=('user_segment',), patients=True):
+        """Roll the cube up to ``by`` over the cells matching the filters
+
+        ``None`` for a filter means no restriction. Returns one row per
+        group with the additive measures, distinct patients, revenue_mean
+        and items_mean; ``patients=False`` skips the distinct-patient
+        count, the only roll-up that touches per-cell patient codes.
+        """
+        by = list(by)
+        cell_ids = self._select(stores, months, segments)
+        selected = self.cells.iloc[cell_ids]
+        if by:
+            grouped = selected.groupby(by, observed=True, sort=True)
+            result = grouped[ADDITIVE_MEASURES].sum()
+            group_codes = grouped.ngroup().to_numpy()
+        else:
+            result = selected[ADDITIVE_MEASURES].sum().to_frame().T
+            group_codes = np.zeros(len(selected), dtype=np.int64)
+        if patients:
+            result['patients'] = self._distinct(cell_ids, group_codes, len(result))
+        result['revenue_mean'] = result['revenue_sum'] / result['bills']
+        result['items_mean'] = result['items'] / result['bills']
+        return result
+
+    def segment_stats(self, stores=None, months=None, patients=True):
+        """``SegmentStats`` for a store/month slice, answered from the cube
+
+        ``patients=False`` skips the distinct-patient counts (left NaN,
+        ``total_patients`` None) for callers that count them elsewhere.
+        """
+        by_segment = self.query(stores, months, patients=patients).reindex(SEGMENTS)
+        by_segment = by_segment.reindex(columns=MEASURES)
+        by_segment = by_segment.fillna({'bills': 0, 'revenue_sum': 0, **({'patients': 0} if patients else {})})
+        by_month = self.query(stores, months, by=('month', 'user_segment'), patients=patients)
+        total = self.query(stores, months, by=(), patients=patients)
+        return SegmentStats(
+            by_segment=by_segment,
+            by_month=by_month.reindex(columns=MEASURES),
+            total_bills=int(total['bills'].iloc[0]),
+            total_revenue=float(total['revenue_sum'].iloc[0]),
+            total_patients=int(total['patients'].iloc[0]) if patients else None,
+            months=by_month.index.get_level_values('month').nunique(),
+        )
+
+
+def _cells(bill_data, patient_codes):
+    """Cell measures of a bill table, and its (cell, patient code) pairs"""
+    keys = [
+        bill_data['store-name'],
+        bill_data['bill_date'].dt.to_period('M').rename('month'),
+        bill_data['user_segment'],
+    ]
+    grouped = bill_data.groupby(keys, observed=True, sort=True)
+    cells = grouped.agg(
+        bills=('revenue-value', 'size'),
+        revenue_sum=('revenue-value', 'sum'),
+        discount_sum=('zrd_promo_discount', 'sum'),
+        items=('items_per_bill', 'sum'),
+        patients=('patient-id', 'nunique'),
+    ).reset_index()
+
+    cell_ids = grouped.ngroup().to_numpy()
+    revenue = bill_data['revenue-value'].to_numpy(dtype=np.float64)
+    in_cell = cell_ids >= 0
+    cells.insert(cells.columns.get_loc('revenue_sum') + 1, 'revenue_sumsq', np.bincount(
+        cell_ids[in_cell], weights=revenue[in_cell] ** 2, minlength=len(cells)
+    ))
+
+    valid = (cell_ids >= 0) & (patient_codes >= 0)
+    return cells, cell_ids[valid].astype(np.int64), patient_codes[valid].astype(np.int64)
+
+
+def _csr_cube(cells, pair_cells, pair_patients, patient_ids):
+    """A cube from its cells and (cell, patient code) pairs, which may repeat"""
+    # Unique (cell, patient) pairs, sorted by cell, give the CSR layout
+    n_patients = max(len(patient_ids), 1)
+    pairs = sorted_unique(pair_cells * n_patients + pair_patients)
+    cell_patients = (pairs % n_patients).astype(np.int32)
+    cell_offsets = np.searchsorted(pairs // n_patients, np.arange(len(cells) + 1))
+    return SegmentCube(cells=cells, cell_patients=cell_patients, cell_offsets=cell_offsets,
+                       patient_ids=np.asarray(patient_ids))
+
+
+@timed('cube.build')
+def build_cube(bill_data):
+    """Build the store × month × segment cube from a segmented bill table"""
+    patient_codes, patient_ids = pd.factorize(bill_data['patient-id'])
+    cells, pair_cells, pair_patients = _cells(bill_data, patient_codes)
+    return _csr_cube(cells, pair_cells, pair_patients, patient_ids)
+
+
+@timed('cube.extend')
+def extend_cube(cube, bill_data):
+    """``cube`` with the bills of ``bill_data`` added; none of them may be in it already
+
+    Patients already in the cube keep their codes; new ones are numbered
+    after them.
+    """
+    patients = bill_data['patient-id']
+    known = pd.Index(cube.patient_ids)
+    patient_codes = known.get_indexer(patients)
+    unseen = (patient_codes < 0) & patients.notna().to_numpy()
+    added = pd.unique(patients[unseen])
+    patient_codes[unseen] = len(known) + pd.Index(added).get_indexer(patients[unseen])
+    patient_ids = np.concatenate([cube.patient_ids, np.asarray(added, dtype=cube.patient_ids.dtype)])
+    new_cells, pair_cells, pair_patients = _cells(bill_data, patient_codes)
+
+    # Number old and new cells in the combined, sorted cell order
+    stores = sorted(set(cube.cells['store-name']) | set(new_cells['store-name']))
+    both = pd.concat([
+        frame.assign(**{'store-name': pd.Categorical(frame['store-name'].astype(object), categories=stores)})
+        for frame in (cube.cells, new_cells)
+    ], ignore_index=True)
+    cell_ids = both.groupby(DIMENSIONS, observed=True, sort=True).ngroup().to_numpy()
+    grouped = both.groupby(cell_ids)
+    cells = grouped[DIMENSIONS].first().join(grouped[ADDITIVE_MEASURES].sum()).reset_index(drop=True)
+
+    old_cells, added_cells = cell_ids[:len(cube.cells)], cell_ids[len(cube.cells):]
+    extended = _csr_cube(
+        cells,
+        np.concatenate([np.repeat(old_cells, np.diff(cube.cell_offsets)), added_cells[pair_cells]]),
+        np.concatenate([cube.cell_patients.astype(np.int64), pair_patients]),
+        patient_ids,
+    )
+    extended.cells['patients'] = np.diff(extended.cell_offsets)
+    return extended
@@ -0,0 +1,131 @@
+"""Scenario math behind the Impact Calculator
+
+``project_impact`` is the calculator's projection for one slider value.
+``sweep_scenarios`` evaluates the calculator's projection for every
+combination of target coin usage, monthly bills and coin activation in a
+single NumPy broadcast. It needs only the per-segment averages and current
+shares, so nightly batch jobs can run it without Streamlit.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .segments import SEGMENTS
+
+
+@dataclass(frozen=True)
+class ImpactProjection:
+    """Monthly projection for a target coin usage; percentages are 0-100"""
+    new_direct_pct: float
+    new_holder_pct: float
+    new_user_pct: float
+    new_direct: float
+    new_holders: float
+    new_users: float
+    current_revenue: float
+    new_revenue: float
+    incremental_revenue: float
+    new_avg_basket: float
+    basket_delta: float
+    new_conversion: float
+    conversion_delta: float
+    additional_users: float
+    annual_impact: float
+
+
+def project_impact(kpis, target_use_pct, monthly_bills):
+    """Project a month at ``target_use_pct`` coin usage from ``SegmentKpis``
+
+    Coin activation is kept at its current level; holders convert to users.
+    """
+    # Calculate new distribution
+    target_have_coins = kpis.activation_rate
+    new_user_pct = target_use_pct
+    new_holder_pct = target_have_coins - new_user_pct
+    new_direct_pct = 100 - target_have_coins
+
+    # Calculate new counts
+    new_direct = monthly_bills * (new_direct_pct / 100)
+    new_holders = monthly_bills * (new_holder_pct / 100)
+    new_users = monthly_bills * (new_user_pct / 100)
+
+    # Calculate revenues
+    current_revenue = monthly_bills * kpis.avg_basket
+    new_revenue = (new_direct * kpis.direct_avg) + (new_holders * kpis.holder_avg) + (new_users * kpis.user_avg)
+    incremental_revenue = new_revenue - current_revenue
+    new_avg_basket = new_revenue / monthly_bills
+    new_conversion = (new_users / (new_holders + new_users) * 100) if (new_holders + new_users) > 0 else 0
+
+    return ImpactProjection(
+        new_direct_pct=new_direct_pct,
+        new_holder_pct=new_holder_pct,
+        new_user_pct=new_user_pct,
+        new_direct=new_direct,
+        new_holders=new_holders,
+        new_users=new_users,
+        current_revenue=current_revenue,
+        new_revenue=new_revenue,
+        incremental_revenue=incremental_revenue,
+        new_avg_basket=new_avg_basket,
+        basket_delta=new_avg_basket - kpis.avg_basket,
+        new_conversion=new_conversion,
+        conversion_delta=new_conversion - kpis.conversion_rate,
+        additional_users=new_users - (monthly_bills * kpis.overall_conversion / 100),
+        annual_impact=incremental_revenue * 12,
+    )
+
+
+def sweep_scenarios(segment_avgs, current_shares, target_use_pcts, monthly_bills, activation_pcts=None):
+    """Project revenue impact over a grid of scenarios
+
+    ``segment_avgs`` and ``current_shares`` (fractions of bills) are in
+    ``SEGMENTS`` order. ``target_use_pcts`` is the % of bills using coins,
+    ``activation_pcts`` the % holding coins; it defaults to the current
+    level, which is what the calculator keeps fixed. Returns one row per
+    grid point, in C order over (target use, monthly bills, activation).
+    Points where usage exceeds activation are left as NaN.
+    """
+    direct_avg, holder_avg, user_avg = np.asarray(segment_avgs, dtype=np.float64)
+    shares = np.asarray(current_shares, dtype=np.float64)
+    current_avg = shares @ np.asarray(segment_avgs, dtype=np.float64)
+    current_use_pct = shares[SEGMENTS.index('Coin Users')] * 100
+    if activation_pcts is None:
+        activation_pcts = [(1 - shares[SEGMENTS.index('Direct Users')]) * 100]
+
+    # Axes: (target use, monthly bills, activation)
+    use = np.asarray(target_use_pcts, dtype=np.float64)[:, None, None]
+    bills = np.asarray(monthly_bills, dtype=np.float64)[None, :, None]
+    activation = np.asarray(activation_pcts, dtype=np.float64)[None, None, :]
+    use, bills, activation = np.broadcast_arrays(use, bills, activation)
+
+    holder_pct = activation - use
+    direct_pct = 100 - activation
+    avg_basket = (direct_pct * direct_avg + holder_pct * holder_avg + use * user_avg) / 100
+    avg_basket = np.where(holder_pct >= 0, avg_basket, np.nan)
+
+    current_revenue = bills * current_avg
+    monthly_impact = bills * avg_basket - current_revenue
+    annual_impact = monthly_impact * 12
+    return pd.DataFrame({
+        'target_use_pct': use.ravel(),
+        'monthly_bills': bills.ravel(),
+        'activation_pct': activation.ravel(),
+        'avg_basket': avg_basket.ravel(),
+        'monthly_impact': monthly_impact.ravel(),
+        'annual_impact': annual_impact.ravel(),
+        'new_users': (bills * (use - current_use_pct) / 100).ravel(),
+        'roi_pct': (annual_impact / current_revenue * 100).ravel(),
+    })
+
+
+def sweep_from_stats(stats, target_use_pcts, monthly_bills, activation_pcts=None):
+    """``sweep_scenarios`` with averages and shares taken from ``SegmentStats``"""
+    by_segment = stats.by_segment.reindex(SEGMENTS)
+    return sweep_scenarios(
+        by_segment['revenue_mean'].to_numpy(),
+        by_segment['bills'].to_numpy() / stats.total_bills,
+        target_use_pcts,
+        monthly_bills,
+        activation_pcts,
+    )
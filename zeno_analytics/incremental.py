@@ -0,0 +1,117 @@
+"""Incremental ingest of daily bill dumps
+
+The base dump plus every daily drop matching ``DAILY_GLOB`` make up the
+dataset. Per-bill partial aggregates of everything ingested so far are
+persisted as ``bill_store.parquet`` with a manifest of the source files and
+their content hashes. A refresh only parses files missing from the manifest
+and merges their partials in, re-aggregating any bill ``id`` that shows up
+again. If a file already ingested has changed or disappeared, the store is
+rebuilt from scratch, since its old contribution cannot be subtracted.
+
+The app refreshes the store in its own process, one file after another.
+To parse a large backlog of files in parallel, run the batch job first:
+
+    python -m zeno_analytics.incremental --workers 8
+
+It brings the store (and each file's ingest cache) up to date with a
+process pool, so the app then finds nothing new to parse.
+"""
+import glob
+import json
+import os
+import sys
+
+import pandas as pd
+
+from .bills import INGEST_WORKERS, finish_bills, merge_partials, partial_bills_parallel
+from .cache import read_manifest, write_atomic
+from .ingest import CACHE_DIR, CHUNK_ROWS, DATA_FILE, source_fingerprint
+from .profiling import timed
+
+DAILY_GLOB = 'daily dumps/*.csv'
+
+
+def dump_files(pattern):
+    """Dump files in a directory (every ``*.csv``) or matching a glob, in name order"""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"No dump files match {pattern!r}")
+    return paths
+
+
+def list_sources(base=DATA_FILE, daily_glob=DAILY_GLOB):
+    """The base dump (or dumps) followed by the daily dumps in name (date) order"""
+    bases = [base] if isinstance(base, str) else list(base)
+    seen = {os.path.abspath(path) for path in bases}
+    daily = sorted(glob.glob(daily_glob)) if daily_glob else []
+    return bases + [path for path in daily if os.path.abspath(path) not in seen]
+
+
+def _store_paths(base):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(base)), CACHE_DIR)
+    return (
+        cache_dir,
+        os.path.join(cache_dir, 'bill_store.parquet'),
+        os.path.join(cache_dir, 'bill_store.manifest.json'),
+    )
+
+
+@timed('incremental.refresh_bill_store')
+def refresh_bill_store(sources, chunk_rows=CHUNK_ROWS, workers=1):
+    """Bring the persisted bill store up to date with ``sources``
+
+    ``sources`` are in ingest order, which decides 'first' for bills that
+    span files. New files are parsed by ``workers`` processes (see
+    ``partial_bills_parallel``). Returns the finished bill table (without
+    segments) and the list of files parsed by this refresh.
+    """
+    cache_dir, store_path, manifest_path = _store_paths(sources[0])
+    hashes = {os.path.abspath(path): source_fingerprint(path)['sha256'] for path in sources}
+    manifest = read_manifest(manifest_path) or {}
+    ingested = manifest.get('sources', {})
+
+    unchanged = all(hashes.get(path) == sha for path, sha in ingested.items())
+    order = list(hashes)
+    # Appends must come after everything already ingested to keep 'first' exact
+    appended_in_order = order[:len(ingested)] == list(ingested)
+    if ingested and unchanged and appended_in_order and os.path.exists(store_path):
+        stored = pd.read_parquet(store_path)
+        new_paths = [path for path in order if path not in ingested]
+    else:
+        stored = None
+        new_paths = order
+
+    if new_paths:
+        new = partial_bills_parallel(new_paths, chunk_rows, workers)
+        stored = new if stored is None else merge_partials(stored, new)
+        os.makedirs(cache_dir, exist_ok=True)
+        write_atomic(store_path, lambda tmp: stored.to_parquet(tmp, engine='pyarrow'))
+
+        def write_manifest(tmp):
+            with open(tmp, 'w') as fh:
+                json.dump({'sources': hashes}, fh)
+        write_atomic(manifest_path, write_manifest)
+
+    return finish_bills(stored), new_paths
+
+
+def main(argv=None):
+    """Ingest new dump files of the dataset on disk in parallel"""
+    import argparse
+
+    from .pipeline import data_sources
+
+    parser = argparse.ArgumentParser(description="Pre-aggregate new dump files into the bill store")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    _, new_paths = refresh_bill_store(data_sources(), args.chunk_rows, args.workers)
+    print(f"Ingested {len(new_paths)} new file(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
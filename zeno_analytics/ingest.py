@@ -0,0 +1,285 @@
+"""Columnar ingest cache for the line-item dumps
+
+The first read of a dump converts it to Parquet under ``CACHE_DIR``, keyed by
+the source file's size, mtime and content hash. Later reads memory-map the
+Parquet file and load only the columns the app uses.
+
+Line items are stored in a compact schema (see ``apply_schema``): IDs as
+int32 or categories, ``store-name`` as a category, ``eligibilty_flag`` as
+int8 and money as integer paise.
+
+The same pass runs the data-quality checks in ``quality``; their report is
+kept in the cache manifest next to the memory report.
+"""
+import glob
+import hashlib
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .cache import read_manifest, write_atomic
+from .profiling import Span, timed, timed_iter
+from .quality import CHECKS, QualityReport, QualityScan
+
+DATA_FILE = 'data dump for old pilot stores.csv'
+CACHE_DIR = '.zeno_cache'
+
+# Bump when the on-disk layout changes so stale caches are rebuilt
+CACHE_FORMAT = 3
+
+PAISE_PER_RUPEE = 100
+BILL_DATE_FORMAT = 'ISO8601'
+
+# Rows parsed per CSV chunk while building the cache; bounds conversion memory
+CHUNK_ROWS = 1_000_000
+
+USED_COLUMNS = [
+    'id',
+    'patient-id',
+    'bill_date',
+    'store-name',
+    'revenue-value',
+    'zrd_promo_discount',
+    'drug-id',
+    'eligibilty_flag',
+]
+
+# Columns of a line-item frame after ``apply_schema``
+LINE_ITEM_COLUMNS = USED_COLUMNS + ['has_zeno_discount']
+ID_COLUMNS = ['id', 'patient-id', 'drug-id']
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _content_hash(path, block_size=1 << 20):
+    """SHA-256 of the file contents, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    stem = os.path.basename(path)
+    return cache_dir, os.path.join(cache_dir, f"{stem}.manifest.json")
+
+
+def source_fingerprint(path):
+    """Return the size, mtime and content hash identifying a dump file
+
+    The content hash is only recomputed when size or mtime differ from the
+    last recorded manifest, so an unchanged file costs a single ``stat``.
+    """
+    stat = os.stat(path)
+    _, manifest_path = _cache_paths(path)
+    manifest = read_manifest(manifest_path)
+    if (manifest
+            and manifest.get('size') == stat.st_size
+            and manifest.get('mtime_ns') == stat.st_mtime_ns):
+        content_hash = manifest['sha256']
+    else:
+        content_hash = _content_hash(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': content_hash}
+
+
+def dataset_version(*paths):
+    """Short version string for one or more dumps, suitable as a cache key"""
+    paths = paths or (DATA_FILE,)
+    hashes = [source_fingerprint(path)['sha256'] for path in paths]
+    if len(hashes) > 1:
+        hashes = [hashlib.sha256(''.join(hashes).encode()).hexdigest()]
+    return f"{hashes[0][:16]}-v{CACHE_FORMAT}"
+
+
+def _compact_id(values):
+    """int32 when the IDs are integral and fit, otherwise a category"""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        valid = values.dropna()
+        if valid.empty or (
+            (valid % 1 == 0).all() and valid.min() >= _INT32.min and valid.max() <= _INT32.max
+        ):
+            return values.astype('int32' if len(valid) == len(values) else 'Int32')
+    return values.astype('category')
+
+
+def _to_paise(values):
+    """Rupee amounts as int32 paise; unparseable and missing values become 0"""
+    rupees = pd.to_numeric(values, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    return np.rint(rupees * PAISE_PER_RUPEE).astype(np.int32)
+
+
+@timed('ingest.parse_dates')
+def _parse_dates(values):
+    """Bill dates; unparseable ones become NaT (counted by the quality checks)"""
+    return pd.to_datetime(values, format=BILL_DATE_FORMAT, errors='coerce')
+
+
+@timed('ingest.apply_schema')
+def apply_schema(raw):
+    """Convert a raw line-item frame (as read from CSV) to the compact schema"""
+    return pd.DataFrame({
+        'id': _compact_id(raw['id']),
+        'patient-id': _compact_id(raw['patient-id']),
+        'bill_date': _parse_dates(raw['bill_date']),
+        'store-name': raw['store-name'].astype('category'),
+        'revenue-value': _to_paise(raw['revenue-value']),
+        'zrd_promo_discount': _to_paise(raw['zrd_promo_discount']),
+        'drug-id': _compact_id(raw['drug-id']),
+        'eligibilty_flag': raw['eligibilty_flag'].fillna(0).astype(np.int8),
+        # Any recorded promo value, even a non-numeric one, marks a coin redemption
+        'has_zeno_discount': raw['zrd_promo_discount'].notna(),
+    }, index=raw.index)
+
+
+def _column_bytes(frame):
+    return {column: int(size) for column, size in frame.memory_usage(index=False, deep=True).items()}
+
+
+def _writer_schema(table):
+    """Schema every chunk is cast to: dictionaries widened to int32 indices"""
+    import pyarrow as pa
+
+    fields = [
+        pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ]
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+def _build_cache(path, parquet_path, chunk_rows=CHUNK_ROWS):
+    """Parse the CSV once, chunk by chunk, and persist it as typed Parquet
+
+    Returns per-column memory before (CSV-inferred dtypes) and after the
+    schema is applied, summed over chunks, and the quality report.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    scan = QualityScan()
+    before, after = Counter(), Counter()
+
+    def write(tmp_path):
+        writer = None
+        try:
+            chunks = pd.read_csv(path, usecols=USED_COLUMNS, low_memory=False, chunksize=chunk_rows)
+            for raw in timed_iter('ingest.read_csv', chunks):
+                before.update(_column_bytes(raw.assign(has_zeno_discount=raw['zrd_promo_discount'].notna())))
+                df = apply_schema(raw)
+                after.update(_column_bytes(df))
+                with Span('ingest.quality_checks'):
+                    scan.update(raw, df)
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    schema = _writer_schema(table)
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                try:
+                    table = table.cast(schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as exc:
+                    raise ValueError(f"Inconsistent column types across chunks of {path!r}: {exc}") from exc
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    write_atomic(parquet_path, write)
+    return {'before': dict(before), 'after': dict(after)}, scan.report()
+
+
+def _restore_dtypes(df):
+    """Undo dtype drift from the Arrow round trip
+
+    Nullable IDs come back as float64 when the first chunk had no nulls, and
+    dictionaries are unified in encounter order; categories are sorted so
+    every read yields the same dtype.
+    """
+    for column in ID_COLUMNS + ['store-name']:
+        if column not in df:
+            continue
+        values = df[column]
+        if values.dtype.kind == 'f':
+            df[column] = values.astype('Int32')
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = values.cat.set_categories(values.cat.categories.sort_values())
+    return df
+
+
+def _ensure_cache(path):
+    """Build the Parquet cache for a dump if needed; return its path and manifest"""
+    fingerprint = source_fingerprint(path)
+    cache_dir, manifest_path = _cache_paths(path)
+    parquet_path = os.path.join(
+        cache_dir,
+        f"{os.path.basename(path)}.{fingerprint['sha256'][:16]}.v{CACHE_FORMAT}.parquet",
+    )
+
+    manifest = read_manifest(manifest_path) or {}
+    current = manifest.get('parquet') == os.path.basename(parquet_path)
+    memory, quality = (manifest.get('memory'), manifest.get('quality')) if current else (None, None)
+    if quality is not None and set(quality['counts']) != set(CHECKS):
+        # Reports from an earlier set of checks are recomputed
+        quality = None
+    if not os.path.exists(parquet_path) or memory is None or quality is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        memory, quality = _build_cache(path, parquet_path)
+        # Drop caches built from earlier versions of the same dump
+        for stale in glob.glob(os.path.join(cache_dir, f"{glob.escape(os.path.basename(path))}.*.parquet")):
+            if stale != parquet_path:
+                os.remove(stale)
+
+    updated = dict(
+        fingerprint, format=CACHE_FORMAT, parquet=os.path.basename(parquet_path), memory=memory, quality=quality,
+    )
+    if manifest != updated:
+        def write_manifest(tmp):
+            with open(tmp, 'w') as fh:
+                json.dump(updated, fh)
+        write_atomic(manifest_path, write_manifest)
+    return parquet_path, updated
+
+
+@timed('ingest.read_line_items')
+def read_line_items(*paths, columns=LINE_ITEM_COLUMNS):
+    """Read the typed line items of one or more dumps, in order, through the columnar cache"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tables = [
+        pq.read_table(_ensure_cache(path)[0], columns=list(columns), memory_map=True)
+        for path in paths or (DATA_FILE,)
+    ]
+    # Files differ in ID nullability and dictionaries; both are settled by _restore_dtypes
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    return _restore_dtypes(table.to_pandas())
+
+
+def iter_line_items(path=DATA_FILE, chunk_rows=CHUNK_ROWS, columns=LINE_ITEM_COLUMNS):
+    """Yield the typed line items of a dump in frames of at most ``chunk_rows``"""
+    import pyarrow.parquet as pq
+
+    parquet_path, _ = _ensure_cache(path)
+    parquet = pq.ParquetFile(parquet_path, memory_map=True)
+    for batch in timed_iter('ingest.read_cache_chunk', parquet.iter_batches(batch_size=chunk_rows, columns=list(columns))):
+        yield _restore_dtypes(batch.to_pandas())
+
+
+def memory_report(*paths):
+    """Per-column bytes of the line items with CSV-inferred vs compact dtypes, summed over dumps"""
+    reports = [pd.DataFrame(_ensure_cache(path)[1]['memory']) for path in paths or (DATA_FILE,)]
+    report = pd.concat(reports).groupby(level=0).sum().reindex(LINE_ITEM_COLUMNS)
+    report.index.name = 'column'
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['after'] / report['before']
+    return report
+
+
+def quality_report(*paths):
+    """Data-quality report of one or more dumps, from their cache manifests"""
+    paths = paths or (DATA_FILE,)
+    reports = [_ensure_cache(path)[1]['quality'] for path in paths]
+    return QualityReport.merge(reports, [os.path.basename(path) for path in paths] if len(paths) > 1 else None)
@@ -0,0 +1,66 @@
+"""Headline KPIs shown on the dashboard pages, derived from ``SegmentStats``"""
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SegmentKpis:
+    """Segment counts, shares, baskets and conversion rates
+
+    Percentages are 0-100. ``conversion_rate`` is users / (holders +
+    users); ``activation_rate`` is holders + users over all bills.
+    """
+    total_bills: int
+    total_revenue: float
+    avg_basket: float
+    direct_users: int
+    coin_holders: int
+    coin_users: int
+    direct_pct: float
+    holders_pct: float
+    users_pct: float
+    direct_avg: float
+    holder_avg: float
+    user_avg: float
+    eligible: int
+    activation_rate: float
+    conversion_rate: float
+    overall_conversion: float
+    holder_lift: float
+    user_lift: float
+    potential_revenue: float
+    monthly_potential: float
+
+
+def segment_kpis(stats):
+    """Compute ``SegmentKpis`` from ``SegmentStats`` (O(1), no table scans)"""
+    total_bills = stats.total_bills
+    direct_users = stats.bills('Direct Users')
+    coin_holders = stats.bills('Coin Holders')
+    coin_users = stats.bills('Coin Users')
+    direct_avg = stats.revenue_mean('Direct Users')
+    holder_avg = stats.revenue_mean('Coin Holders')
+    user_avg = stats.revenue_mean('Coin Users')
+    eligible = coin_holders + coin_users
+    potential_revenue = coin_holders * (user_avg - holder_avg)
+    return SegmentKpis(
+        total_bills=total_bills,
+        total_revenue=stats.total_revenue,
+        avg_basket=stats.avg_basket,
+        direct_users=direct_users,
+        coin_holders=coin_holders,
+        coin_users=coin_users,
+        direct_pct=direct_users / total_bills * 100,
+        holders_pct=coin_holders / total_bills * 100,
+        users_pct=coin_users / total_bills * 100,
+        direct_avg=direct_avg,
+        holder_avg=holder_avg,
+        user_avg=user_avg,
+        eligible=eligible,
+        activation_rate=eligible / total_bills * 100,
+        conversion_rate=(coin_users / eligible * 100) if eligible > 0 else 0,
+        overall_conversion=coin_users / total_bills * 100,
+        holder_lift=(holder_avg / direct_avg - 1) * 100,
+        user_lift=(user_avg / direct_avg - 1) * 100,
+        potential_revenue=potential_revenue,
+        monthly_potential=potential_revenue / stats.months,
+    )
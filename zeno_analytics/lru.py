@@ -0,0 +1,64 @@
+"""Least-recently-used cache bounded by the size of its entries
+
+Used by the app for built Plotly figures: entries are weighed by an
+estimate of their size (their data arrays), and the least recently used
+ones are evicted once the total exceeds ``max_bytes``.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+
+class SizedLRUCache:
+    """Thread-safe LRU cache with a byte budget
+
+    ``sizeof(value)`` weighs an entry when it is stored. Values larger than
+    the whole budget are returned but not cached. Cached values are shared
+    between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes, sizeof=sys.getsizeof):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        """The cached value for ``key``, calling ``build()`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Built outside the lock; concurrent misses on one key just build twice
+        value = build()
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
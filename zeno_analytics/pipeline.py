@@ -0,0 +1,215 @@
+"""Dataset loading shared by the Streamlit app and batch jobs
+
+Configuration comes from the environment so every consumer reads the same
+dataset:
+
+* ``ZENO_STREAM_CHUNK_ROWS`` aggregates bills chunk by chunk, so dumps that
+  do not fit in memory never hold all line items at once.
+* ``ZENO_DAILY_GLOB`` is where daily bill dumps are picked up and appended
+  incrementally to the base dump.
+* ``ZENO_DUMP_GLOB`` replaces the single base dump with a directory or glob
+  of dump files (e.g. one per store). The app parses new files one by
+  one; ``python -m zeno_analytics.incremental`` ingests them ahead of time
+  with ``ZENO_INGEST_WORKERS`` processes.
+* ``ZENO_KPI_PORT`` serves each version's KPI snapshot (see ``snapshots``)
+  as JSON on localhost.
+* ``ZENO_BACKEND=sql`` answers the segment statistics, store/month
+  filters and basket-lift tests with aggregate queries over an embedded
+  database (see ``sqlstore``) and never loads the bill table; cohorts,
+  trends and the impact uncertainty bands need the pandas backend.
+
+``prepare_dataset`` is given the version it replaces: when the new bill
+table only adds bills to it (new daily dumps), the cube, daily series and
+segment sums are extended with the new bills instead of rebuilt.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .bills import aggregate_bills, aggregate_bills_streaming
+from .cache import build_lock
+from .cohorts import PatientHistories, build_histories
+from .incremental import DAILY_GLOB, dump_files, list_sources, refresh_bill_store
+from .ingest import CHUNK_ROWS, DATA_FILE, dataset_version, quality_report, read_line_items
+from .profiling import timed
+from .quality import QualityReport
+from .cube import SegmentCube, build_cube, extend_cube
+from .segments import SegmentStats, assign_segments, compute_segment_stats
+from .shared import load_shared_bills, shared_store_path
+from .simulation import SegmentBootstrap, bootstrap_segments
+from .sketches import PatientSketches, build_sketches
+from .snapshots import KpiSnapshot, build_snapshot, kpi_snapshot_path, write_snapshot
+from .sqlstore import SqlStore, build_sql_store, sql_store_path
+from .timeseries import DailySeries, build_daily_series, extend_daily_series
+
+STREAM_CHUNK_ROWS = int(os.environ.get('ZENO_STREAM_CHUNK_ROWS', 0))
+DAILY_DUMPS = os.environ.get('ZENO_DAILY_GLOB', DAILY_GLOB)
+DUMP_GLOB = os.environ.get('ZENO_DUMP_GLOB')
+BACKEND = os.environ.get('ZENO_BACKEND', 'pandas')
+
+
+def data_sources():
+    """The base dump (or every dump under ``ZENO_DUMP_GLOB``) followed by any daily dumps"""
+    return list_sources(dump_files(DUMP_GLOB) if DUMP_GLOB else DATA_FILE, DAILY_DUMPS)
+
+
+def current_version():
+    """Version string of the dataset currently on disk"""
+    return dataset_version(*data_sources())
+
+
+@timed('pipeline.load_bill_data')
+def load_bill_data(stream_chunk_rows=STREAM_CHUNK_ROWS):
+    """Load the segmented bill table for the dataset on disk
+
+    Line items arrive typed (dates parsed, money in integer paise) and are
+    released as soon as they are aggregated.
+    """
+    sources = data_sources()
+    if len(sources) > 1:
+        # Only daily dumps not yet in the persisted bill store are parsed
+        bill_data, _ = refresh_bill_store(sources, stream_chunk_rows or CHUNK_ROWS)
+    elif stream_chunk_rows:
+        bill_data = aggregate_bills_streaming(sources[0], chunk_rows=stream_chunk_rows)
+    else:
+        bill_data = aggregate_bills(read_line_items(sources[0]))
+    return assign_segments(bill_data)
+
+
+def load_shared_bill_data(version):
+    """The bill table of ``version``, memory-mapped from the host-wide shared store
+
+    The first process to ask for a version aggregates and publishes it;
+    every other process attaches to the same file without a copy.
+    """
+    def build():
+        if current_version() != version:
+            raise RuntimeError(f"Dataset version {version} is no longer on disk")
+        return load_bill_data()
+    return load_shared_bills(shared_store_path(version, DATA_FILE), build)
+
+
+def load_sql_store(version):
+    """The SQL store of ``version``, ingested from the sources by the first caller"""
+    path = sql_store_path(version, DATA_FILE)
+    if not os.path.exists(path):
+        with build_lock(path):
+            if not os.path.exists(path):
+                if current_version() != version:
+                    raise RuntimeError(f"Dataset version {version} is no longer on disk")
+                build_sql_store(data_sources(), path)
+    return SqlStore(path)
+
+
+@dataclass(frozen=True)
+class PreparedDataset:
+    """A dataset version with every derived structure the pages read
+
+    With ``ZENO_BACKEND=sql`` the ``SqlStore`` stands in for the cube and
+    the structures built from individual bills are None.
+    """
+    version: str
+    bill_data: Optional[pd.DataFrame]
+    stats: SegmentStats
+    cube: Union[SegmentCube, SqlStore]
+    sketches: Optional[PatientSketches]
+    bootstrap: Optional[SegmentBootstrap]
+    histories: Optional[PatientHistories]
+    daily: Optional[DailySeries]
+    snapshot: KpiSnapshot
+    # None for a version restored after its sources changed
+    quality: Optional[QualityReport]
+
+
+def _same_values(old, new):
+    if isinstance(new.dtype, pd.CategoricalDtype) and isinstance(old.dtype, pd.CategoricalDtype):
+        # Categories grow as stores appear; compare under the new ones
+        old = old.cat.set_categories(new.cat.categories)
+    return old.equals(new)
+
+
+@timed('pipeline.appended_bills')
+def _appended_bills(old, new):
+    """The bills of ``new`` that are not in ``old``, or None unless ``new`` only adds bills
+
+    Both tables are sorted by bill id; every bill of ``old`` must be in
+    ``new`` unchanged. IDs that cannot be compared are never an append.
+    """
+    old_ids, ids = pd.Index(old['id']), pd.Index(new['id'])
+    try:
+        if len(old_ids) > len(ids) or not (
+            ids.is_unique and ids.is_monotonic_increasing and old_ids.is_monotonic_increasing
+        ):
+            return None
+        positions = ids.get_indexer(old_ids)
+    except TypeError:
+        return None
+    if (positions < 0).any() or list(old.columns) != list(new.columns):
+        return None
+    carried = new.iloc[positions].reset_index(drop=True)
+    old = old.reset_index(drop=True)
+    if not all(_same_values(old[column], carried[column]) for column in new.columns):
+        return None
+    added = np.ones(len(ids), dtype=bool)
+    added[positions] = False
+    return new[added]
+
+
+def _extended(previous, bill_data):
+    """Cube, daily series and stats of ``bill_data`` from ``previous``'s, or None"""
+    if previous is None or previous.bill_data is None or previous.daily is None:
+        return None
+    added = _appended_bills(previous.bill_data, bill_data)
+    if added is None:
+        return None
+    cube = extend_cube(previous.cube, added)
+    # The cube leaves out bills without a store or date; only then are its sums the totals
+    complete = int(cube.cells['bills'].sum()) == len(bill_data)
+    stats = cube.segment_stats() if complete else compute_segment_stats(bill_data)
+    return cube, extend_daily_series(previous.daily, added), stats
+
+
+@timed('pipeline.prepare_dataset')
+def prepare_dataset(version, previous=None):
+    """Load ``version`` and build every derived structure the pages read
+
+    ``previous`` is the ``PreparedDataset`` being replaced, if any; the
+    additive structures are extended from it when ``version`` only adds
+    bills. Sketches, histories and the bootstrap are always rebuilt.
+    """
+    daily = None
+    if BACKEND == 'sql':
+        cube = load_sql_store(version)
+        stats = cube.segment_stats()
+        bill_data = None
+    else:
+        bill_data = load_shared_bill_data(version)
+        extended = _extended(previous, bill_data)
+        if extended is None:
+            stats = compute_segment_stats(bill_data)
+            cube = build_cube(bill_data)
+            daily = build_daily_series(bill_data)
+        else:
+            cube, daily, stats = extended
+    snapshot = build_snapshot(version, stats, cube)
+    snapshot_path = kpi_snapshot_path(version, DATA_FILE)
+    if not os.path.exists(snapshot_path):
+        write_snapshot(snapshot, snapshot_path)
+    sources = data_sources()
+    # Read from the ingest cache manifests, written by the same pass that parsed the dumps
+    quality = quality_report(*sources) if dataset_version(*sources) == version else None
+    return PreparedDataset(
+        version=version,
+        bill_data=bill_data,
+        stats=stats,
+        cube=cube,
+        sketches=None if bill_data is None else build_sketches(bill_data),
+        bootstrap=None if bill_data is None else bootstrap_segments(bill_data),
+        histories=None if bill_data is None else build_histories(bill_data),
+        daily=daily,
+        snapshot=snapshot,
+        quality=quality,
+    )
@@ -0,0 +1,235 @@
+"""Named spans around the pipeline's hot paths
+
+Wrap a stage in ``Span`` (or decorate it with ``timed``) to record its
+wall time, CPU time of the calling thread and the change in resident
+memory. With ``ZENO_TRACE_MEMORY=1`` spans also record net Python/NumPy
+allocations via ``tracemalloc``, at a noticeable cost.
+
+Finished spans are aggregated per name in ``RECORDER``, logged as JSON on
+the ``zeno_analytics.spans`` logger at DEBUG level and, once
+``serve_metrics`` has been called (``ZENO_METRICS_PORT``), exported in
+the Prometheus text format on ``/metrics`` with recent spans as JSON on
+``/spans``.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get('ZENO_METRICS_PORT', 0))
+RECENT_SPANS = 500
+
+if os.environ.get('ZENO_TRACE_MEMORY') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+logger = logging.getLogger(__name__.rsplit('.', 1)[0] + '.spans')
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def _rss_bytes():
+    """Resident set size from /proc, or None where it is unavailable"""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+class SpanRecorder:
+    """Thread-safe per-name totals plus a window of recent spans"""
+
+    def __init__(self, recent=RECENT_SPANS):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._recent = deque(maxlen=recent)
+
+    def record(self, span):
+        with self._lock:
+            totals = self._totals.setdefault(span['name'], {
+                'count': 0, 'seconds': 0.0, 'cpu_seconds': 0.0, 'max_seconds': 0.0, 'last_seconds': 0.0,
+            })
+            totals['count'] += 1
+            totals['seconds'] += span['seconds']
+            totals['cpu_seconds'] += span['cpu_seconds']
+            totals['max_seconds'] = max(totals['max_seconds'], span['seconds'])
+            totals['last_seconds'] = span['seconds']
+            self._recent.append(span)
+
+    def totals(self):
+        """Per-name totals, keyed by span name"""
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._totals.items()}
+
+    def recent(self):
+        """Recently finished spans, oldest first"""
+        with self._lock:
+            return list(self._recent)
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+
+RECORDER = SpanRecorder()
+
+_local = threading.local()
+
+
+class Span:
+    """Time a named stage; use as a context manager or via ``start``/``stop``
+
+    Spans opened inside another span on the same thread record it as
+    their ``parent``.
+    """
+
+    def __init__(self, name, recorder=RECORDER):
+        self.name = name
+        self.recorder = recorder
+        self.record = None
+
+    def start(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self._parent = stack[-1].name if stack else None
+        stack.append(self)
+        self._rss = _rss_bytes()
+        self._traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def stop(self):
+        seconds = time.perf_counter() - self._wall
+        cpu_seconds = time.thread_time() - self._cpu
+        stack = _local.stack
+        if self in stack:
+            stack.remove(self)
+        rss = _rss_bytes()
+        self.record = {
+            'name': self.name,
+            'parent': self._parent,
+            'thread': threading.current_thread().name,
+            'started': time.time() - seconds,
+            'seconds': seconds,
+            'cpu_seconds': cpu_seconds,
+            'rss_delta_bytes': rss - self._rss if rss is not None and self._rss is not None else None,
+            'allocated_bytes': (
+                tracemalloc.get_traced_memory()[0] - self._traced
+                if self._traced is not None and tracemalloc.is_tracing() else None
+            ),
+        }
+        self.recorder.record(self.record)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(self.record))
+        return self.record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def timed(name):
+    """Decorator recording every call of a function as a ``Span``"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    """Yield from ``iterable``, recording the time to produce each item as a span"""
+    iterator = iter(iterable)
+    while True:
+        with Span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_metrics(recorder=RECORDER):
+    """Span totals in the Prometheus text exposition format"""
+    totals = recorder.totals()
+    lines = [
+        '# HELP zeno_span_seconds Wall time spent in named spans',
+        '# TYPE zeno_span_seconds summary',
+    ]
+    for name, span in sorted(totals.items()):
+        lines.append(f'zeno_span_seconds_sum{{span="{_label(name)}"}} {span["seconds"]:.6f}')
+        lines.append(f'zeno_span_seconds_count{{span="{_label(name)}"}} {span["count"]}')
+    lines += [
+        '# HELP zeno_span_cpu_seconds_total CPU time of the calling thread in named spans',
+        '# TYPE zeno_span_cpu_seconds_total counter',
+    ]
+    lines += [f'zeno_span_cpu_seconds_total{{span="{_label(name)}"}} {span["cpu_seconds"]:.6f}'
+              for name, span in sorted(totals.items())]
+    lines += [
+        '# HELP zeno_span_max_seconds Slowest single span per name',
+        '# TYPE zeno_span_max_seconds gauge',
+    ]
+    lines += [f'zeno_span_max_seconds{{span="{_label(name)}"}} {span["max_seconds"]:.6f}'
+              for name, span in sorted(totals.items())]
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    recorder = RECORDER
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = prometheus_metrics(self.recorder).encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/spans':
+            body = json.dumps(self.recorder.recent()).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics request: " + format, *args)
+
+
+def serve_metrics(port=METRICS_PORT, host='127.0.0.1'):
+    """Serve ``/metrics`` and ``/spans`` from a daemon thread; return the server
+
+    Returns None when ``port`` is 0 or already taken (e.g. by another
+    worker on the same host).
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as exc:
+        logging.getLogger(__name__).warning("Metrics endpoint not started on %s:%s: %s", host, port, exc)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='zeno-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,221 @@
+"""Data-quality checks run while a dump is parsed
+
+The ingest schema coerces bad values instead of failing: unparseable
+dates become NaT, non-numeric amounts become 0, and a bill's lines that
+disagree on patient, date or store collapse to the first line's values.
+``QualityScan`` sees every CSV chunk once, raw and typed, on its way into
+the columnar cache and counts (with a few sample rows) what was coerced or
+looks wrong:
+
+* ``unparseable_dates``: a bill_date that is present but not a date
+* ``unparseable_amounts``: a revenue or discount that is present but not
+  a number
+* ``negative_revenue``: a line with revenue below zero
+* ``discount_over_revenue``: a line whose coin discount exceeds its revenue
+* ``identical_lines``: a line identical to an earlier line of its bill on
+  every column read (``USED_COLUMNS``); columns the app ignores, such as
+  drug-name, are not compared
+* ``inconsistent_bills``: a bill whose lines disagree on patient-id,
+  bill_date or store-name (counted per bill)
+
+The report is stored in the dump's cache manifest, so it is computed once
+per dump file. Duplicates and inconsistencies are found within each file.
+
+Memory stays bounded by the chunk size plus one row per bill, like the
+streaming bill aggregation: per-bill attribute ranges are folded across
+chunks, and duplicates are looked for among the lines of a bill within a
+chunk and across a chunk boundary (dumps list a bill's lines together), so
+no per-line state is kept for the whole file.
+"""
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+SAMPLE_ROWS = 5
+
+CHECKS = {
+    'unparseable_dates': "Lines whose bill_date is not a date (read as missing)",
+    'unparseable_amounts': "Lines whose revenue or discount is not a number (read as 0)",
+    'negative_revenue': "Lines with negative revenue",
+    'discount_over_revenue': "Lines whose coin discount exceeds their revenue",
+    'identical_lines': "Lines identical to an earlier line of the same bill on the columns read",
+    'inconsistent_bills': "Bills whose lines disagree on patient, date or store (first line wins)",
+}
+
+_AMOUNTS = ['revenue-value', 'zrd_promo_discount']
+# Bill attributes taken from the first line; their min and max per bill differ on a conflict
+_ATTRIBUTES = ['patient-id', 'bill_date', 'store-name']
+
+
+def _records(frame):
+    """JSON-safe sample records"""
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+class QualityScan:
+    """Check counters and samples, updated chunk by chunk
+
+    ``update`` takes each raw CSV chunk with its typed counterpart (same
+    index); ``report`` returns the JSON-serializable result.
+    """
+
+    def __init__(self, samples=SAMPLE_ROWS):
+        self.n_samples = samples
+        self.lines = 0
+        self.counts = dict.fromkeys(CHECKS, 0)
+        self.samples = {check: [] for check in CHECKS}
+        # Line hashes of the last bill of the previous chunk, which may continue
+        self._open_bill = np.array([], dtype=np.uint64)
+        self._ranges = None
+        self._pending, self._pending_rows = [], 0
+        self._names = {}
+
+    def _sample(self, check, mask, raw):
+        wanted = self.n_samples - len(self.samples[check])
+        if wanted > 0 and mask.any():
+            # CSV line numbers: one header line, rows counted from 1
+            rows = raw[mask].head(wanted)
+            self.samples[check] += _records(rows.assign(line=rows.index + 2).astype(str))
+
+    def _flag(self, check, mask, raw):
+        self.counts[check] += int(mask.sum())
+        self._sample(check, mask, raw)
+
+    def update(self, raw, typed):
+        self.lines += len(raw)
+        self._flag('unparseable_dates', raw['bill_date'].notna() & typed['bill_date'].isna(), raw)
+        unparseable = pd.Series(False, index=raw.index)
+        for column in _AMOUNTS:
+            # Columns read as numbers cannot hold text
+            if not pd.api.types.is_numeric_dtype(raw[column]):
+                unparseable |= raw[column].notna() & pd.to_numeric(raw[column], errors='coerce').isna()
+        self._flag('unparseable_amounts', unparseable, raw)
+        self._flag('negative_revenue', typed['revenue-value'] < 0, raw)
+        discount = typed['zrd_promo_discount']
+        self._flag('discount_over_revenue', (discount > 0) & (discount > typed['revenue-value']), raw)
+
+        # Typed columns hash much faster than raw strings; the bill id is one of them,
+        # so equal hashes only occur within a bill
+        hashes = pd.util.hash_pandas_object(typed, index=False).to_numpy()
+        seen = pd.Series(np.concatenate([self._open_bill, hashes])).duplicated().to_numpy()
+        self._flag('identical_lines', seen[len(self._open_bill):], raw)
+        if len(typed):
+            ids = typed['id'].to_numpy()
+            self._open_bill = hashes[ids == ids[-1]]
+
+        self._fold(self._bill_ranges(typed))
+
+    def _stable_codes(self, column, values):
+        """Numbers that compare the same in every chunk: categories map to fixed codes"""
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            return values if column == 'bill_date' else values.astype('float64')
+        names = self._names.setdefault(column, {})
+        for name in values.cat.categories:
+            names.setdefault(name, len(names))
+        mapping = np.array([names[name] for name in values.cat.categories] + [np.nan])
+        return mapping[values.cat.codes.to_numpy()]
+
+    def _bill_ranges(self, typed):
+        """Min and max of each bill attribute per bill id, nulls skipped"""
+        values = pd.DataFrame({'id': typed['id']})
+        for column in _ATTRIBUTES:
+            values[column] = self._stable_codes(column, typed[column])
+        return values.groupby('id', observed=True)[_ATTRIBUTES].agg(['min', 'max'])
+
+    def _display(self, column, value):
+        if pd.isna(value):
+            return 'nan'
+        if column in self._names:
+            return str(list(self._names[column])[int(value)])
+        return f"{value:.0f}" if column == 'patient-id' else str(value)
+
+    @staticmethod
+    def _combine(frames):
+        """Ranges of bills spanning several frames, combined"""
+        ranges = pd.concat(frames)
+        shared = ranges.index.duplicated(keep=False)
+        if not shared.any():
+            return ranges
+        folded = ranges[shared].groupby(level=0).agg(
+            {(column, how): how for column in _ATTRIBUTES for how in ['min', 'max']}
+        )
+        return pd.concat([ranges[~shared], folded])
+
+    def _fold(self, ranges):
+        """Fold a chunk's ranges into the running table once the pending ones outgrow it"""
+        if self._ranges is None:
+            self._ranges = ranges
+            return
+        self._pending.append(ranges)
+        self._pending_rows += len(ranges)
+        if self._pending_rows >= len(self._ranges):
+            self._ranges = self._combine([self._ranges] + self._pending)
+            self._pending, self._pending_rows = [], 0
+
+    def _inconsistent_bills(self):
+        ranges = self._combine([self._ranges] + self._pending)
+        conflict = np.zeros(len(ranges), dtype=bool)
+        for column in _ATTRIBUTES:
+            low, high = ranges[(column, 'min')], ranges[(column, 'max')]
+            conflict |= (low.notna() & (low != high)).to_numpy()
+        return len(ranges), ranges[conflict]
+
+    def report(self):
+        bills, conflicts = self._inconsistent_bills() if self._ranges is not None else (0, None)
+        counts, samples = dict(self.counts), {check: list(rows) for check, rows in self.samples.items()}
+        if conflicts is not None and len(conflicts):
+            counts['inconsistent_bills'] = len(conflicts)
+            samples['inconsistent_bills'] = [
+                dict(id=str(bill), **{
+                    column: ' / '.join(self._display(column, row[(column, how)]) for how in ['min', 'max'])
+                    for column in _ATTRIBUTES
+                })
+                for bill, row in conflicts.head(self.n_samples).iterrows()
+            ]
+        return {'lines': self.lines, 'bills': bills, 'counts': counts, 'samples': samples}
+
+
+@dataclass(frozen=True)
+class QualityReport:
+    """Check results over one or more dumps
+
+    ``counts`` and ``samples`` are keyed by the names in ``CHECKS``; samples
+    are raw CSV values with the file and line they came from.
+    """
+    lines: int
+    bills: int
+    counts: dict
+    samples: dict
+
+    @classmethod
+    def merge(cls, reports, names=None):
+        """Add up the per-dump reports (as stored), tagging samples with ``names``"""
+        names = names or [None] * len(reports)
+        counts, samples = dict.fromkeys(CHECKS, 0), {check: [] for check in CHECKS}
+        for report, name in zip(reports, names):
+            for check in CHECKS:
+                counts[check] += report['counts'].get(check, 0)
+                samples[check] += [dict(row, file=name) if name else row for row in report['samples'].get(check, [])]
+        return cls(
+            lines=sum(report['lines'] for report in reports),
+            bills=sum(report['bills'] for report in reports),
+            counts=counts,
+            samples=samples,
+        )
+
+    @property
+    def issues(self):
+        return sum(self.counts.values())
+
+    def summary(self):
+        """One row per check: count, share of lines (or bills) and description"""
+        table = pd.DataFrame({
+            'count': pd.Series(self.counts),
+            'check': pd.Series(CHECKS),
+        }).reindex(list(CHECKS))
+        totals = np.where(table.index == 'inconsistent_bills', self.bills, self.lines)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['share'] = table['count'] / totals
+        return table[['check', 'count', 'share']]
@@ -0,0 +1,151 @@
+"""Background refresh of the dataset
+
+``BackgroundRefresher`` runs a daemon thread that watches the data sources
+and prepares each new dataset version (ingest, bill table, derived stats)
+off the request path. Only once the preparation has finished is the new
+version published, by swapping a single attribute, so readers always see
+a complete version and never block on a rebuild.
+
+Set ``ZENO_REFRESH_SECONDS`` to change how often the sources are polled; 0
+loads the data once and stops watching.
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from .ingest import dataset_version
+from .pipeline import data_sources, prepare_dataset
+from .shared import shared_store_path
+
+REFRESH_SECONDS = float(os.environ.get('ZENO_REFRESH_SECONDS', 30))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DatasetState:
+    """A published dataset version
+
+    ``data`` is whatever ``prepare`` built for the version. ``as_of`` is the
+    newest modification time of the files it was built from (for a version
+    restored from an earlier run, when it was published); ``loaded_at`` is
+    when it went live in this process.
+    """
+    version: str
+    data: object
+    as_of: datetime
+    loaded_at: datetime
+
+
+def _signature(paths):
+    """Cheap change detector: name, size and mtime of every source"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append((path, None, None))
+        else:
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+class BackgroundRefresher:
+    """Prepare new dataset versions in a background thread
+
+    ``prepare(version, previous)`` builds everything readers need for
+    ``version`` and runs on the watcher thread only; ``previous`` is the
+    live version's result (``state.data``, None before the first), which
+    it may build on. ``restore`` is a
+    version left on disk by an earlier run, served while the current one
+    is still being prepared.
+    """
+
+    def __init__(self, prepare=prepare_dataset, sources=data_sources, refresh_seconds=REFRESH_SECONDS, restore=None):
+        self._prepare = prepare
+        self._sources = sources
+        self.refresh_seconds = refresh_seconds
+        self._restore = restore
+        self._state = None
+        self._signature = None
+        self.building = None
+        self.last_error = None
+        self._settled = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def state(self):
+        """The live ``DatasetState``, or None before the first version is ready"""
+        return self._state
+
+    def _publish(self, version, data, as_of):
+        self._state = DatasetState(version, data, as_of, datetime.now())
+        logger.info("Dataset version %s is live (data as of %s)", version, as_of)
+
+    def check(self):
+        """Prepare and publish the sources' version if it changed; True if it did"""
+        with self._lock:
+            paths = self._sources()
+            signature = _signature(paths)
+            if signature == self._signature:
+                return False
+            version = dataset_version(*paths)
+            changed = self._state is None or version != self._state.version
+            if changed:
+                self.building = version
+                try:
+                    data = self._prepare(version, None if self._state is None else self._state.data)
+                finally:
+                    self.building = None
+                mtimes = [mtime for _, _, mtime in signature if mtime is not None]
+                self._publish(version, data, datetime.fromtimestamp(max(mtimes) / 1e9))
+            self._signature = signature
+            return changed
+
+    def _restore_previous(self):
+        version = self._restore
+        self.building = version
+        try:
+            data = self._prepare(version, None)
+        finally:
+            self.building = None
+        self._publish(version, data, datetime.fromtimestamp(os.path.getmtime(shared_store_path(version))))
+
+    def _run(self):
+        if self._restore is not None:
+            try:
+                self._restore_previous()
+                self._settled.set()
+            except Exception as exc:
+                # The current version is built next, so a stale restore may fail
+                logger.warning("Could not restore dataset version %s: %s", self._restore, exc)
+        while not self._stop.is_set():
+            try:
+                self.check()
+                self.last_error = None
+            except Exception as exc:
+                # Keep serving the live version; retried on the next poll
+                self.last_error = exc
+                logger.exception("Dataset refresh failed")
+            self._settled.set()
+            if self.refresh_seconds <= 0 or self._stop.wait(self.refresh_seconds):
+                break
+
+    def start(self):
+        """Start the watcher thread; returns self"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='zeno-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Block until a version is live or the first attempt failed; return the state"""
+        self._settled.wait(timeout)
+        return self._state
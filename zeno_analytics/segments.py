@@ -0,0 +1,127 @@
+"""Customer segments and the per-segment statistics shared by all pages"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+
+SEGMENTS = ['Direct Users', 'Coin Holders', 'Coin Users']
+# Codes follow the funnel: 0 direct, 1 holder (eligible), 2 user (eligible and redeemed)
+SEGMENT_DTYPE = pd.CategoricalDtype(SEGMENTS, ordered=True)
+
+MEASURES = ['bills', 'revenue_sum', 'revenue_mean', 'items_mean', 'patients']
+
+
+@timed('segments.assign')
+def assign_segments(bill_data):
+    """Label each bill Direct Users, Coin Holders or Coin Users in place
+
+    The int8 code is eligibility plus redemption by an eligible bill, so
+    one vectorized pass yields the category codes directly.
+    """
+    eligible = bill_data['eligibilty_flag'].to_numpy() == 1
+    redeemed = eligible & bill_data['has_zeno_discount'].to_numpy(dtype=bool)
+    codes = eligible.astype(np.int8) + redeemed.astype(np.int8)
+    bill_data['user_segment'] = pd.Categorical.from_codes(codes, dtype=SEGMENT_DTYPE)
+    return bill_data
+
+
+def sorted_unique(values):
+    """``np.unique`` for integer keys via one sort, without the hash path"""
+    values = np.sort(values)
+    return values[np.append(True, np.diff(values) != 0)] if len(values) else values
+
+
+def segment_codes(bill_data):
+    """The int8 segment code of every bill (positions in ``SEGMENTS``)"""
+    return bill_data['user_segment'].cat.codes.to_numpy()
+
+
+def _group_measures(groups, n_groups, revenue, items, patient_codes, n_patients):
+    """Bills, revenue, basket, items and distinct patients per group code
+
+    Every measure is one ``np.bincount`` over the group codes; distinct
+    patients count the unique (group, patient) pairs. Patient codes of -1
+    (missing IDs) are not counted as patients.
+    """
+    bills = np.bincount(groups, minlength=n_groups)
+    revenue_sum = np.bincount(groups, weights=revenue, minlength=n_groups)
+    items_sum = np.bincount(groups, weights=items, minlength=n_groups)
+    known = patient_codes >= 0
+    pairs = sorted_unique(groups[known] * max(n_patients, 1) + patient_codes[known])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            'bills': bills,
+            'revenue_sum': revenue_sum,
+            'revenue_mean': revenue_sum / bills,
+            'items_mean': items_sum / bills,
+            'patients': np.bincount(pairs // max(n_patients, 1), minlength=n_groups),
+        }, columns=MEASURES)
+
+
+@dataclass(frozen=True)
+class SegmentStats:
+    """Bill counts, revenue, basket and distinct patients per segment
+
+    ``by_segment`` is indexed by segment; ``by_month`` by (month, segment).
+    Both have the columns bills, revenue_sum, revenue_mean, items_mean and
+    patients.
+    """
+    by_segment: pd.DataFrame
+    by_month: pd.DataFrame
+    total_bills: int
+    total_revenue: float
+    # None when the distinct patients were not counted
+    total_patients: Optional[int]
+    months: int
+
+    @property
+    def avg_basket(self):
+        return self.total_revenue / self.total_bills if self.total_bills else float('nan')
+
+    def bills(self, segment):
+        return int(self.by_segment.loc[segment, 'bills'])
+
+    def revenue_mean(self, segment):
+        return float(self.by_segment.loc[segment, 'revenue_mean'])
+
+
+@timed('segments.stats')
+def compute_segment_stats(bill_data):
+    """Compute ``SegmentStats`` from a segmented bill table with bincount passes"""
+    codes = segment_codes(bill_data).astype(np.int64)
+    revenue = bill_data['revenue-value'].to_numpy(dtype=np.float64)
+    items = bill_data['items_per_bill'].to_numpy(dtype=np.float64)
+    patient_codes, patients = pd.factorize(bill_data['patient-id'])
+    patient_codes = patient_codes.astype(np.int64)
+
+    by_segment = _group_measures(codes, len(SEGMENTS), revenue, items, patient_codes, len(patients))
+    by_segment.index = pd.Index(SEGMENTS, name='user_segment')
+
+    # Months as a dense offset from the first month, so (month, segment) is one code
+    dates = bill_data['bill_date'].to_numpy()
+    dated = ~np.isnat(dates)
+    month_numbers = dates[dated].astype('datetime64[M]').astype(np.int64)
+    first_month = month_numbers.min() if len(month_numbers) else 0
+    n_cells = (month_numbers.max() - first_month + 1) * len(SEGMENTS) if len(month_numbers) else 0
+    by_month = _group_measures(
+        (month_numbers - first_month) * len(SEGMENTS) + codes[dated], n_cells,
+        revenue[dated], items[dated], patient_codes[dated], len(patients),
+    )
+    observed = np.flatnonzero(by_month['bills'].to_numpy())
+    by_month = by_month.iloc[observed]
+    by_month.index = pd.MultiIndex.from_arrays([
+        pd.PeriodIndex((first_month + observed // len(SEGMENTS)).astype('datetime64[M]'), freq='M'),
+        pd.Categorical.from_codes(observed % len(SEGMENTS), dtype=SEGMENT_DTYPE),
+    ], names=['month', 'user_segment'])
+
+    return SegmentStats(
+        by_segment=by_segment,
+        by_month=by_month,
+        total_bills=len(bill_data),
+        total_revenue=float(by_segment['revenue_sum'].sum()),
+        total_patients=len(patients),
+        months=len(set(observed // len(SEGMENTS))),
+    )
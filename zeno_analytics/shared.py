@@ -0,0 +1,97 @@
+"""Bill table shared by every server process on a host
+
+The segmented bill table is published once per dataset version as an
+uncompressed Arrow IPC file under ``CACHE_DIR``. Each process memory-maps
+that file and wraps the Arrow buffers in a DataFrame without copying, so
+the pages of all workers are backed by the same OS page cache and memory
+per host stays flat as workers are added.
+
+Attached frames are read-only: writing to a column raises ``ValueError``.
+Derive new frames (``assign``, ``copy``) instead of mutating in place.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import build_lock, write_atomic
+from .ingest import CACHE_DIR, DATA_FILE
+from .profiling import timed
+
+# Arrow packs booleans into bits, which cannot be viewed as NumPy bools;
+# they are stored as one byte per value and listed in the schema metadata
+_BOOL_COLUMNS_KEY = b'zeno.bool_columns'
+
+
+def shared_store_path(version, base=DATA_FILE):
+    """Arrow file holding the bill table of ``version``"""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(base)), CACHE_DIR)
+    return os.path.join(cache_dir, f"bills.{version}.arrow")
+
+
+def published_versions(base=DATA_FILE):
+    """Versions with a bill table on disk, most recently published first"""
+    cache_dir = os.path.dirname(shared_store_path('', base))
+    published = []
+    for path in glob.glob(os.path.join(cache_dir, 'bills.*.arrow')):
+        try:
+            published.append((os.path.getmtime(path), os.path.basename(path)[len('bills.'):-len('.arrow')]))
+        except OSError:
+            # Removed by a concurrent publish
+            continue
+    return [version for _, version in sorted(published, reverse=True)]
+
+
+@timed('shared.publish_bills')
+def publish_bills(bill_data, path):
+    """Write ``bill_data`` as a single-batch Arrow file and drop older versions"""
+    import pyarrow as pa
+
+    bool_columns = [column for column in bill_data if bill_data[column].dtype == bool]
+    frame = bill_data.astype({column: np.uint8 for column in bool_columns})
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_BOOL_COLUMNS_KEY] = json.dumps(bool_columns).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    def write(tmp_path):
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                # One record batch keeps every column contiguous for zero-copy views
+                writer.write_table(table, max_chunksize=max(len(table), 1))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, write)
+    # Processes still mapping an old version keep reading it until they refresh
+    for stale in glob.glob(os.path.join(os.path.dirname(path), 'bills.*.arrow')):
+        if stale != path:
+            os.remove(stale)
+
+
+@timed('shared.attach_bills')
+def attach_bills(path):
+    """Memory-map a published bill table as a read-only DataFrame"""
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    bool_columns = json.loads(table.schema.metadata.get(_BOOL_COLUMNS_KEY, b'[]'))
+    # split_blocks keeps one block per column instead of consolidating (copying)
+    frame = table.to_pandas(split_blocks=True)
+    columns = {
+        column: pd.Series(frame[column].to_numpy().view(bool), index=frame.index, name=column, copy=False)
+        if column in bool_columns else frame[column]
+        for column in frame
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_shared_bills(path, build):
+    """Attach the bill table at ``path``, calling ``build()`` to publish it first if missing"""
+    if not os.path.exists(path):
+        with build_lock(path):
+            if not os.path.exists(path):
+                publish_bills(build(), path)
+    return attach_bills(path)
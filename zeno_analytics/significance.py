@@ -0,0 +1,247 @@
+"""Basket lift between segments with confidence intervals and p-values
+
+Lift is ``mean(segment) / mean(baseline) - 1``. Every test works from
+per-group bill counts, revenue sums and sums of squares, which the cube
+already holds per (store, month, segment) cell, so thousands of store ×
+month comparisons are array arithmetic over one roll-up:
+
+* Welch's t-test on the difference of means (unequal variances), with a
+  delta-method confidence interval for the lift.
+* A parametric bootstrap of the two means from their sampling
+  distributions, giving a percentile interval and a two-sided p-value
+  for the lift. It needs no bill-level data, so it runs on every load.
+
+The Student t distribution is evaluated here (regularized incomplete
+beta by continued fraction) to avoid a SciPy dependency.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+from .segments import SEGMENTS
+
+# (segment, baseline) pairs, following the funnel
+PAIRS = [
+    ('Coin Holders', 'Direct Users'),
+    ('Coin Users', 'Direct Users'),
+    ('Coin Users', 'Coin Holders'),
+]
+CONFIDENCE = 0.95
+N_BOOTSTRAP = 1_000
+LIFT_COLUMNS = [
+    'segment_bills', 'baseline_bills', 'segment_mean', 'baseline_mean', 'lift', 'lift_low', 'lift_high',
+    't_stat', 'df', 'p_value', 'boot_low', 'boot_high', 'boot_p_value',
+]
+
+_SUMS = ['bills', 'revenue_sum', 'revenue_sumsq']
+
+# Above this many degrees of freedom the t distribution is taken as normal
+_NORMAL_DF = 1_000
+_CF_ITERATIONS = 300
+# Below this many degrees of freedom the Cornish-Fisher quantile is refined
+_REFINE_DF = 30
+_NEWTON_STEPS = 20
+
+_lgamma = np.frompyfunc(math.lgamma, 1, 1)
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def _betainc(a, b, x):
+    """Regularized incomplete beta I_x(a, b), elementwise (modified Lentz)"""
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (a, b, x)))
+    # The continued fraction converges fast below the mean; use symmetry above it
+    flip = x > (a + 1) / (a + b + 2)
+    a, b, x = np.where(flip, b, a), np.where(flip, a, b), np.where(flip, 1 - x, x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_front = (np.asarray(_lgamma(a + b) - _lgamma(a) - _lgamma(b), dtype=np.float64)
+                     + a * np.log(x) + b * np.log1p(-x))
+    tiny = 1e-300
+    c = np.ones_like(x)
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+    fraction = d.copy()
+    for m in range(1, _CF_ITERATIONS + 1):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1 + numerator * d
+            d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1 + numerator / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            step = c * d
+            fraction *= step
+        if np.all(np.abs(step - 1) < 1e-12):
+            break
+    with np.errstate(invalid='ignore', over='ignore'):
+        result = np.exp(log_front) * fraction / a
+    result = np.where(x <= 0, 0.0, np.where(x >= 1, 1.0, result))
+    return np.where(flip, 1 - result, result)
+
+
+def t_two_sided_p(t, df):
+    """Two-sided p-value of Student's t statistic ``t`` with ``df`` degrees of freedom"""
+    t, df = np.broadcast_arrays(np.abs(np.asarray(t, dtype=np.float64)), np.asarray(df, dtype=np.float64))
+    p = np.full(t.shape, np.nan)
+    valid = np.isfinite(t) & (df > 0)
+    normal = valid & (df > _NORMAL_DF)
+    p[normal] = _erfc(t[normal] / math.sqrt(2)).astype(np.float64)
+    exact = valid & ~normal
+    p[exact] = _betainc(df[exact] / 2, 0.5, df[exact] / (df[exact] + t[exact] ** 2))
+    return p
+
+
+def _t_density(t, df):
+    log_norm = np.asarray(_lgamma((df + 1) / 2) - _lgamma(df / 2), dtype=np.float64) - 0.5 * np.log(df * math.pi)
+    return np.exp(log_norm - (df + 1) / 2 * np.log1p(t ** 2 / df))
+
+
+def t_quantile(probability, df):
+    """Student t quantile via the Cornish-Fisher expansion around the normal one
+
+    The expansion is within 1e-5 from 30 degrees of freedom up; below that
+    it is refined by Newton steps on the exact distribution function.
+    """
+    z = _normal_quantile(probability)
+    df = np.asarray(df, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+             + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+    t, df = np.broadcast_arrays(np.abs(t), df)
+    shape = t.shape
+    t, df = t.ravel().copy(), df.ravel()
+    refine = np.isfinite(t) & (df > 0) & (df < _REFINE_DF)
+    # Upper-tail probability: convex in t, so Newton converges from below
+    tail = min(probability, 1 - probability)
+    for _ in range(_NEWTON_STEPS):
+        if not refine.any():
+            break
+        excess = t_two_sided_p(t[refine], df[refine]) / 2 - tail
+        t[refine] += excess / _t_density(t[refine], df[refine])
+        refine[refine] = np.abs(excess) > 1e-12 * tail
+    return np.copysign(t, probability - 0.5).reshape(shape)
+
+
+def _normal_quantile(probability):
+    """Standard normal quantile by bisection on ``erfc`` (scalar, once per call)"""
+    low, high = -40.0, 40.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if 0.5 * math.erfc(-middle / math.sqrt(2)) < probability:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def _moments(n, total, sumsq):
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        var = np.maximum(sumsq - total * mean, 0) / (n - 1)
+    return n, mean, var
+
+
+def welch_lift(n_a, sum_a, sumsq_a, n_b, sum_b, sumsq_b, confidence=CONFIDENCE):
+    """Welch t-test of ``mean(b) - mean(a)`` and a CI for ``mean(b) / mean(a) - 1``
+
+    Inputs are bill counts, revenue sums and sums of squares of the
+    baseline (a) and segment (b), as arrays of any matching shape. Returns
+    a dict of arrays: lift, lift_low, lift_high, t_stat, df, p_value.
+    """
+    n_a, mean_a, var_a = _moments(n_a, sum_a, sumsq_a)
+    n_b, mean_b, var_b = _moments(n_b, sum_b, sumsq_b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se2_a, se2_b = var_a / n_a, var_b / n_b
+        t_stat = (mean_b - mean_a) / np.sqrt(se2_a + se2_b)
+        df = (se2_a + se2_b) ** 2 / (se2_a ** 2 / (n_a - 1) + se2_b ** 2 / (n_b - 1))
+        lift = mean_b / mean_a - 1
+        # Delta method for the ratio of two independent means
+        lift_se = np.sqrt(se2_b / mean_a ** 2 + mean_b ** 2 * se2_a / mean_a ** 4)
+        margin = t_quantile(1 - (1 - confidence) / 2, df) * lift_se
+    return {
+        'lift': lift,
+        'lift_low': lift - margin,
+        'lift_high': lift + margin,
+        't_stat': t_stat,
+        'df': df,
+        'p_value': t_two_sided_p(t_stat, df),
+    }
+
+
+def bootstrap_lift(n_a, sum_a, sumsq_a, n_b, sum_b, sumsq_b, confidence=CONFIDENCE, n_bootstrap=N_BOOTSTRAP, seed=0):
+    """Percentile interval and p-value of the lift from resampled means
+
+    Each replicate draws both means from their normal sampling
+    distribution (mean, std / sqrt(n)). The standard normal draws are
+    shared by all comparisons (common random numbers), so generating them
+    costs the same for one comparison or thousands. Returns a dict of
+    arrays: boot_low, boot_high, boot_p_value.
+    """
+    n_a, mean_a, var_a = _moments(n_a, sum_a, sumsq_a)
+    n_b, mean_b, var_b = _moments(n_b, sum_b, sumsq_b)
+    ndim = max(np.ndim(mean_a), np.ndim(mean_b))
+    normals = np.random.default_rng(seed).standard_normal((2, n_bootstrap) + (1,) * ndim)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        draws_a = mean_a + np.sqrt(var_a / n_a) * normals[0]
+        draws_b = mean_b + np.sqrt(var_b / n_b) * normals[1]
+        lifts = draws_b / draws_a - 1
+    tail = (1 - confidence) / 2
+    low, high = np.percentile(lifts, [100 * tail, 100 * (1 - tail)], axis=0)
+    p_value = np.minimum(2 * np.minimum((lifts <= 0).mean(axis=0), (lifts >= 0).mean(axis=0)), 1.0)
+    undefined = ~np.isfinite(lifts).all(axis=0)
+    return {
+        'boot_low': np.where(undefined, np.nan, low),
+        'boot_high': np.where(undefined, np.nan, high),
+        'boot_p_value': np.where(undefined, np.nan, p_value),
+    }
+
+
+@timed('significance.segment_lift')
+def segment_lift(cube, stores=None, months=None, by=(), pairs=PAIRS, confidence=CONFIDENCE,
+                 n_bootstrap=N_BOOTSTRAP, seed=0):
+    """Lift, Welch and bootstrap statistics for every segment pair per group
+
+    Rolls the cube up to ``by`` (e.g. ``('store-name', 'month')``) and
+    segment for the store/month filters, then tests all groups and pairs
+    together. Indexed by the ``by`` columns plus segment and baseline,
+    with ``LIFT_COLUMNS``.
+    """
+    by = list(by)
+    sums = cube.query(stores, months, by=by + ['user_segment'], patients=False)[_SUMS]
+    # One row per group, one (measure, segment) column per side of a test
+    wide = sums.unstack('user_segment', fill_value=0) if by else sums.unstack().to_frame().T
+    wide.columns = pd.MultiIndex.from_arrays(
+        [wide.columns.get_level_values(0), wide.columns.get_level_values(1).astype(str)]
+    )
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([_SUMS, SEGMENTS]), fill_value=0)
+
+    def measure(name, segments):
+        return wide[name][segments].to_numpy(dtype=np.float64)
+
+    segments = [segment for segment, _ in pairs]
+    baselines = [baseline for _, baseline in pairs]
+    # (groups, pairs) arrays of each side's counts and sums
+    args = (
+        measure('bills', baselines), measure('revenue_sum', baselines), measure('revenue_sumsq', baselines),
+        measure('bills', segments), measure('revenue_sum', segments), measure('revenue_sumsq', segments),
+    )
+    results = welch_lift(*args, confidence=confidence)
+    results.update(bootstrap_lift(*args, confidence=confidence, n_bootstrap=n_bootstrap, seed=seed))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results.update({
+            'segment_bills': args[3],
+            'baseline_bills': args[0],
+            'segment_mean': args[4] / args[3],
+            'baseline_mean': args[1] / args[0],
+        })
+
+    groups = wide.index if by else pd.RangeIndex(1)
+    index = pd.MultiIndex.from_arrays([
+        *([groups.get_level_values(level).repeat(len(pairs)) for level in range(groups.nlevels)] if by else []),
+        np.tile(segments, len(groups)),
+        np.tile(baselines, len(groups)),
+    ], names=by + ['segment', 'baseline'])
+    return pd.DataFrame({column: np.ravel(results[column]) for column in LIFT_COLUMNS}, index=index)
@@ -0,0 +1,112 @@
+"""Monte Carlo uncertainty bands for the Impact Calculator
+
+Two sources of uncertainty are simulated:
+
+* Parameter uncertainty in each segment's basket, from bootstrap
+  replicates of the segment's mean and standard deviation. These depend
+  only on the data, so ``bootstrap_segments`` runs once per dataset.
+* Month-to-month sampling noise of a month with ``monthly_bills`` bills.
+  Per segment that is a sum of thousands of bills, drawn from its normal
+  (CLT) limit around the replicate's mean and standard deviation.
+
+``simulate_impact`` is fully vectorized over scenarios. It has no Python
+loop over draws and reuses a few preallocated arrays, so tens of
+thousands of scenarios take a few milliseconds per slider value.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+from .segments import SEGMENTS, segment_codes
+
+N_REPLICATES = 256
+N_SCENARIOS = 20_000
+PERCENTILES = (5, 50, 95)
+
+# Bootstrap resamples are capped at this many bills per segment and the
+# replicate means rescaled to the full sample size (m-out-of-n bootstrap).
+# That keeps the one-off cost bounded on multi-million-bill tables.
+MAX_RESAMPLE = 50_000
+_BLOCK_DRAWS = 4_000_000
+
+
+@dataclass(frozen=True)
+class SegmentBootstrap:
+    """Bootstrap replicates of each segment's basket mean and std
+
+    ``means`` and ``stds`` have shape (replicates, segments), with
+    segments in ``SEGMENTS`` order.
+    """
+    means: np.ndarray
+    stds: np.ndarray
+
+
+@timed('simulation.bootstrap')
+def bootstrap_segments(bill_data, n_replicates=N_REPLICATES, max_resample=MAX_RESAMPLE, seed=0):
+    """Bootstrap the per-segment revenue distributions of a bill table"""
+    rng = np.random.default_rng(seed)
+    means = np.full((n_replicates, len(SEGMENTS)), np.nan)
+    stds = np.full((n_replicates, len(SEGMENTS)), np.nan)
+    # One stable sort by segment code replaces a string mask per segment
+    codes = segment_codes(bill_data)
+    revenue = bill_data['revenue-value'].to_numpy(dtype=np.float64)[np.argsort(codes, kind='stable')]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(SEGMENTS)))])
+    for column in range(len(SEGMENTS)):
+        values = revenue[bounds[column]:bounds[column + 1]]
+        n = len(values)
+        if n == 0:
+            continue
+        draws = min(n, max_resample)
+        block = max(1, _BLOCK_DRAWS // draws)
+        for start in range(0, n_replicates, block):
+            sample = values[rng.integers(0, n, size=(min(block, n_replicates - start), draws))]
+            means[start:start + len(sample), column] = sample.mean(axis=1)
+            stds[start:start + len(sample), column] = sample.std(axis=1)
+        centre = values.mean()
+        means[:, column] = centre + (means[:, column] - centre) * np.sqrt(draws / n)
+    return SegmentBootstrap(means=means, stds=stds)
+
+
+@timed('simulation.simulate_impact')
+def simulate_impact(bootstrap, current_shares, target_shares, monthly_bills,
+                    n_scenarios=N_SCENARIOS, percentiles=PERCENTILES, seed=0):
+    """Percentiles of monthly new, incremental and annual incremental revenue
+
+    ``current_shares`` and ``target_shares`` are per-segment fractions of
+    bills in ``SEGMENTS`` order. Incremental revenue is measured against the
+    current mix under the same bootstrap replicate, so parameter
+    uncertainty is paired. Annual impact adds twelve independent months of
+    sampling noise. Returns a frame indexed by percentile.
+    """
+    rng = np.random.default_rng(seed)
+    current_counts = monthly_bills * np.asarray(current_shares, dtype=np.float64)
+    target_counts = monthly_bills * np.asarray(target_shares, dtype=np.float64)
+    # Empty segments contribute nothing rather than NaN
+    bootstrap_means = np.nan_to_num(bootstrap.means)
+    bootstrap_stds = np.nan_to_num(bootstrap.stds)
+
+    replicate = rng.integers(0, len(bootstrap_means), size=n_scenarios)
+    means = bootstrap_means[replicate]
+    stds = bootstrap_stds[replicate]
+
+    expected_delta = means @ (target_counts - current_counts)
+    new_revenue = means @ target_counts
+
+    # Sampling noise: sum over segments of sqrt(count) * std * z
+    noise = np.empty((n_scenarios, len(SEGMENTS)))
+    scaled_stds = np.multiply(stds, np.sqrt(target_counts), out=stds)
+    month_noise = np.einsum('ij,ij->i', scaled_stds, rng.standard_normal(out=noise))
+    year_noise = np.einsum('ij,ij->i', scaled_stds, rng.standard_normal(out=noise)) * np.sqrt(12)
+
+    new_revenue += month_noise
+    incremental = expected_delta + month_noise
+    annual = 12 * expected_delta + year_noise
+
+    q = np.asarray(percentiles, dtype=np.float64)
+    return pd.DataFrame({
+        'new_revenue': np.percentile(new_revenue, q),
+        'incremental': np.percentile(incremental, q),
+        'annual': np.percentile(annual, q),
+    }, index=pd.Index(percentiles, name='percentile'))
@@ -0,0 +1,152 @@
+"""Mergeable distinct-patient sketches per store, day and segment
+
+Each (store, day, segment) slice gets a HyperLogLog sketch of its patient
+IDs. Distinct patients for any date range, store set or segment set then
+come from merging the matching sketches (register-wise max), never from
+re-hashing ``patient-id`` over the bill table.
+
+Error bounds: with ``PRECISION`` p the sketch has m = 2**p registers and a
+relative standard error of about 1.04 / sqrt(m) (1.6% for p = 12); about
+95% of estimates fall within twice that. Small cardinalities use linear
+counting, which is tighter. Slices covering at most ``EXACT_MAX_BILLS``
+bills are answered exactly from the per-sketch patient codes instead.
+
+Day-level sketches are usually small, so registers are stored sparsely as
+(register, rank) pairs in one CSR-style array, at most m pairs per sketch.
+"""
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .cube import csr_positions
+from .profiling import timed
+from .segments import sorted_unique
+
+PRECISION = 12
+EXACT_MAX_BILLS = 50_000
+
+
+class DistinctCount(NamedTuple):
+    value: int
+    exact: bool
+    # Relative standard error of ``value``; 0 when exact
+    relative_error: float
+
+
+def _register_ranks(hashes, precision):
+    """HLL register index and rank (leading zeros + 1) of 64-bit hashes"""
+    remaining = 64 - precision
+    registers = (hashes >> np.uint64(remaining)).astype(np.uint16)
+    # remaining <= 52 bits, so the float conversion is exact
+    tail = (hashes & np.uint64((1 << remaining) - 1)).astype(np.float64)
+    ranks = remaining + 1 - np.frexp(tail)[1]
+    return registers, ranks.astype(np.uint8)
+
+
+def _estimate(registers):
+    """HyperLogLog estimate with linear counting for the small range"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+
+def _csr(row_ids, n_rows):
+    """Offsets for values already sorted by row id"""
+    return np.searchsorted(row_ids, np.arange(n_rows + 1))
+
+
+@dataclass(frozen=True)
+class PatientSketches:
+    """Sparse HLL sketches plus exact patient codes per (store, day, segment)
+
+    ``index`` has store-name, day, user_segment and bills per sketch.
+    """
+    index: pd.DataFrame
+    precision: int
+    register_ids: np.ndarray
+    register_ranks: np.ndarray
+    register_offsets: np.ndarray
+    patient_codes: np.ndarray
+    patient_offsets: np.ndarray
+
+    def _select(self, stores=None, start=None, end=None, segments=None):
+        mask = np.ones(len(self.index), dtype=bool)
+        if stores is not None:
+            mask &= self.index['store-name'].isin(list(stores)).to_numpy()
+        if segments is not None:
+            mask &= self.index['user_segment'].isin(list(segments)).to_numpy()
+        if start is not None:
+            mask &= (self.index['day'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (self.index['day'] <= pd.Timestamp(end)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def merge(self, sketch_ids):
+        """Dense registers of the union of the given sketches"""
+        positions, _ = csr_positions(self.register_offsets, sketch_ids)
+        registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        np.maximum.at(registers, self.register_ids[positions], self.register_ranks[positions])
+        return registers
+
+    def distinct_patients(self, stores=None, start=None, end=None, segments=None,
+                          exact_max_bills=EXACT_MAX_BILLS):
+        """Distinct patients over stores, an inclusive day range and segments
+
+        ``None`` means no restriction. Exact when the slice has at most
+        ``exact_max_bills`` bills, otherwise a merged HLL estimate.
+        """
+        sketch_ids = self._select(stores, start, end, segments)
+        if self.index['bills'].to_numpy()[sketch_ids].sum() <= exact_max_bills:
+            positions, _ = csr_positions(self.patient_offsets, sketch_ids)
+            return DistinctCount(len(sorted_unique(self.patient_codes[positions])), True, 0.0)
+        estimate = _estimate(self.merge(sketch_ids))
+        return DistinctCount(int(round(estimate)), False, 1.04 / float(np.sqrt(1 << self.precision)))
+
+
+@timed('sketches.build')
+def build_sketches(bill_data, precision=PRECISION):
+    """Build per store/day/segment patient sketches from a segmented bill table"""
+    if not 12 <= precision <= 16:
+        raise ValueError("precision must be between 12 and 16")
+    keys = [
+        bill_data['store-name'],
+        bill_data['bill_date'].dt.normalize().rename('day'),
+        bill_data['user_segment'],
+    ]
+    grouped = bill_data.groupby(keys, observed=True, sort=True)
+    index = grouped.size().rename('bills').reset_index()
+    n_sketches = len(index)
+
+    sketch_ids = grouped.ngroup().to_numpy()
+    patients = bill_data['patient-id']
+    valid = (sketch_ids >= 0) & patients.notna().to_numpy()
+    sketch_ids = sketch_ids[valid].astype(np.int64)
+    hashes = pd.util.hash_pandas_object(patients[valid], index=False).to_numpy()
+
+    # Sparse registers: keep the max rank per (sketch, register). Ranks fit
+    # in 6 bits, so packing them below the key lets one sort do the max.
+    registers, ranks = _register_ranks(hashes, precision)
+    keys = np.sort(((sketch_ids << precision) | registers) << 6 | ranks)
+    keys = keys[np.append(np.diff(keys >> 6) != 0, True)]
+    register_sketch = keys >> (precision + 6)
+
+    # Exact layer: unique patient codes per sketch
+    codes, _ = pd.factorize(patients[valid])
+    n_codes = int(codes.max()) + 1 if len(codes) else 1
+    pairs = sorted_unique(sketch_ids * n_codes + codes)
+
+    return PatientSketches(
+        index=index,
+        precision=precision,
+        register_ids=((keys >> 6) & ((1 << precision) - 1)).astype(np.uint16),
+        register_ranks=(keys & 0x3F).astype(np.uint8),
+        register_offsets=_csr(register_sketch, n_sketches),
+        patient_codes=(pairs % n_codes).astype(np.int32),
+        patient_offsets=_csr(pairs // n_codes, n_sketches),
+    )
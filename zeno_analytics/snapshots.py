@@ -0,0 +1,295 @@
+"""KPI snapshots per dataset version, and a read-only JSON endpoint
+
+The Executive Dashboard numbers (``SegmentKpis``) are computed once per
+dataset version, overall and per store, month and store × month, from the
+cube's per-cell sums. ``prepare_dataset`` writes them to a compact JSON
+file next to the ingest cache, so other tools can read the file or ask the
+endpoint instead of running a Streamlit session each:
+
+    GET /kpis                         overall
+    GET /kpis?store=<name>            one store, all months
+    GET /kpis?month=YYYY-MM           one month, all stores
+    GET /kpis?store=<name>&month=...  one store and month
+    GET /snapshot                     every slice, as stored on disk
+
+Responses are encoded once per version and served from memory; the ETag is
+the dataset version. The app serves them on ``ZENO_KPI_PORT``, and
+``python -m zeno_analytics.snapshots --port <port>`` runs the endpoint on
+its own, loading each new version's snapshot file (or building it once).
+
+KPIs that are undefined for a slice (e.g. the lift of a store without
+direct bills) are null.
+"""
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from dataclasses import asdict, dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .cache import write_atomic
+from .ingest import CACHE_DIR, DATA_FILE
+from .kpis import SegmentKpis, segment_kpis
+from .profiling import timed
+from .segments import SEGMENTS
+
+KPI_PORT = int(os.environ.get('ZENO_KPI_PORT', 0))
+KPI_COLUMNS = [field.name for field in fields(SegmentKpis)]
+# A snapshot row is (store, month, *KPI_COLUMNS); None for "all"
+SNAPSHOT_COLUMNS = ['store', 'month'] + KPI_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class _SliceStats:
+    """The part of ``SegmentStats`` that ``segment_kpis`` reads, for one slice"""
+
+    def __init__(self, bills, revenue, months):
+        self._bills = bills
+        self.total_bills = int(bills.sum())
+        self.total_revenue = float(revenue.sum())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._means = revenue / bills
+        self.months = months
+
+    @property
+    def avg_basket(self):
+        return self.total_revenue / self.total_bills
+
+    def bills(self, segment):
+        return int(self._bills[SEGMENTS.index(segment)])
+
+    def revenue_mean(self, segment):
+        return float(self._means[SEGMENTS.index(segment)])
+
+
+def _kpi_values(kpis):
+    """``SegmentKpis`` as plain Python numbers in ``KPI_COLUMNS`` order"""
+    return tuple(value.item() if isinstance(value, np.generic) else value for value in asdict(kpis).values())
+
+
+def _json_value(value):
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+@dataclass(frozen=True)
+class KpiSnapshot:
+    """``SegmentKpis`` of one dataset version, per slice
+
+    ``rows`` maps (store, month) to the KPI values in ``KPI_COLUMNS``
+    order; store and month are None for "all", months are 'YYYY-MM'.
+    """
+    version: str
+    rows: dict
+
+    def kpis(self, store=None, month=None):
+        """``SegmentKpis`` of a slice, or None if it has no bills"""
+        values = self.rows.get((store, month))
+        return None if values is None else SegmentKpis(*values)
+
+    def to_json(self):
+        """The compact on-disk form: one list per row"""
+        return json.dumps({
+            'version': self.version,
+            'columns': SNAPSHOT_COLUMNS,
+            'rows': [[store, month, *map(_json_value, values)] for (store, month), values in self.rows.items()],
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        rows = {
+            (row[0], row[1]): tuple(float('nan') if value is None else value for value in row[2:])
+            for row in data['rows']
+        }
+        return cls(version=data['version'], rows=rows)
+
+    @functools.cached_property
+    def responses(self):
+        """Encoded ``/kpis`` bodies by (store, month), plus ``/snapshot`` under None"""
+        responses = {
+            key: json.dumps(
+                {'version': self.version, 'store': key[0], 'month': key[1],
+                 **dict(zip(KPI_COLUMNS, map(_json_value, values)))},
+                separators=(',', ':'),
+            ).encode()
+            for key, values in self.rows.items()
+        }
+        responses[None] = self.to_json().encode()
+        return responses
+
+
+@timed('snapshots.build')
+def build_snapshot(version, stats, cube):
+    """KPIs of ``version``: overall from ``stats``, every slice from ``cube``
+
+    Slices only count bills with a store and bill date. Monthly opportunity
+    divides by the months a slice has bills in, as the dashboard does for
+    the whole dataset.
+    """
+    rows = {(None, None): _kpi_values(segment_kpis(stats))}
+    cells = cube.query(by=('store-name', 'month', 'user_segment'), patients=False)[['bills', 'revenue_sum']]
+    cells = cells.reset_index()
+    cells['month'] = cells['month'].astype(str)
+    store_months = cells.groupby('store-name', observed=True)['month'].nunique()
+
+    for level in (['store-name'], ['month'], ['store-name', 'month']):
+        sums = cells.groupby(level + ['user_segment'], observed=True)[['bills', 'revenue_sum']].sum()
+        wide = sums.unstack('user_segment', fill_value=0).reindex(
+            columns=[(measure, segment) for measure in ['bills', 'revenue_sum'] for segment in SEGMENTS],
+            fill_value=0,
+        )
+        bills = wide['bills'].to_numpy(dtype=np.int64)
+        revenue = wide['revenue_sum'].to_numpy(dtype=np.float64)
+        for i, key in enumerate(wide.index):
+            key = dict(zip(level, key if len(level) > 1 else (key,)))
+            store, month = key.get('store-name'), key.get('month')
+            months = int(store_months[store]) if month is None else 1
+            rows[(store, month)] = _kpi_values(segment_kpis(_SliceStats(bills[i], revenue[i], months)))
+    return KpiSnapshot(version=version, rows=rows)
+
+
+def kpi_snapshot_path(version, base=DATA_FILE):
+    """Snapshot file of ``version``"""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(base)), CACHE_DIR)
+    return os.path.join(cache_dir, f"kpis.{version}.json")
+
+
+def write_snapshot(snapshot, path):
+    """Publish ``snapshot`` at ``path`` and remove other versions' snapshots"""
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write(snapshot.to_json())
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, write)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), "kpis.*.json")):
+        if stale != path:
+            os.remove(stale)
+
+
+def read_snapshot(path):
+    with open(path) as f:
+        return KpiSnapshot.from_json(f.read())
+
+
+def load_snapshot(version, previous=None):
+    """The snapshot of ``version`` from disk, building and writing it if missing
+
+    ``previous`` (the snapshot being replaced) is not needed: each version's
+    file is built once.
+    """
+    from .cube import build_cube
+    from .pipeline import BACKEND, load_shared_bill_data, load_sql_store
+    from .segments import compute_segment_stats
+
+    path = kpi_snapshot_path(version)
+    if os.path.exists(path):
+        return read_snapshot(path)
+    if BACKEND == 'sql':
+        store = load_sql_store(version)
+        snapshot = build_snapshot(version, store.segment_stats(), store)
+    else:
+        bill_data = load_shared_bill_data(version)
+        snapshot = build_snapshot(version, compute_segment_stats(bill_data), build_cube(bill_data))
+    write_snapshot(snapshot, path)
+    return snapshot
+
+
+class _KpiHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        snapshot = self.server.current()
+        if url.path not in ('/kpis', '/snapshot'):
+            self.send_error(404)
+            return
+        if snapshot is None:
+            self.send_error(503, "No dataset version is live yet")
+            return
+        if url.path == '/snapshot':
+            key = None
+        else:
+            query = parse_qs(url.query)
+            key = (query.get('store', [None])[0], query.get('month', [None])[0])
+        body = snapshot.responses.get(key)
+        if body is None:
+            self.send_error(404, "No bills for this store and month")
+            return
+        etag = f'"{snapshot.version}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("kpi request: " + format, *args)
+
+
+def _kpi_server(current, port, host):
+    server = ThreadingHTTPServer((host, port), _KpiHandler)
+    server.daemon_threads = True
+    server.current = current
+    return server
+
+
+def serve_kpis(current, port=KPI_PORT, host='127.0.0.1'):
+    """Serve ``/kpis`` and ``/snapshot`` from a daemon thread; return the server
+
+    ``current()`` returns the live ``KpiSnapshot`` (or None while none is
+    ready). Returns None when ``port`` is 0 or already taken.
+    """
+    if not port:
+        return None
+    try:
+        server = _kpi_server(current, port, host)
+    except OSError as exc:
+        logger.warning("KPI endpoint not started on %s:%s: %s", host, port, exc)
+        return None
+    threading.Thread(target=server.serve_forever, name='zeno-kpis', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    """Serve the KPI snapshots of the dataset on disk, following new versions"""
+    import argparse
+
+    from .refresh import BackgroundRefresher
+
+    parser = argparse.ArgumentParser(description="Serve KPI snapshots as JSON")
+    parser.add_argument('--port', type=int, default=KPI_PORT or 8502)
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    refresher = BackgroundRefresher(prepare=load_snapshot).start()
+
+    def current():
+        state = refresher.state
+        return None if state is None else state.data
+
+    server = _kpi_server(current, args.port, args.host)
+    logger.info("Serving KPI snapshots on http://%s:%s/kpis", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""Embedded SQL backend for the segment statistics
+
+The pandas pipeline is the reference implementation. With
+``ZENO_BACKEND=sql`` the bill table is never loaded into memory: the
+segment statistics, the store/month filters of the Executive Dashboard,
+the basket-lift tests and the KPI snapshot come from aggregate queries over
+a local database file. ``SqlStore.query`` answers the same roll-ups as
+``SegmentCube.query``, so it stands in for the cube. Views that need
+individual bills (cohorts, daily trends, the impact uncertainty bands) are
+not available on this backend.
+
+* DuckDB, when installed (``pip install duckdb``): a columnar file with
+  multithreaded scans that spill to disk on datasets larger than RAM.
+* SQLite from the standard library otherwise.
+
+``ZENO_SQL_ENGINE`` picks one explicitly. Each chunk of the columnar ingest
+cache is reduced to per-bill partials in pandas and appended; the database
+folds bills spanning chunks or files, so ingest never holds a whole dump in
+memory.
+
+Bill-level attributes (patient, date, store) repeat on every line of a
+bill. The database takes their MIN per bill where pandas takes the first
+line's value; the two agree whenever a bill's lines do. ``check_parity``
+compares the KPIs of both backends:
+
+    python -m zeno_analytics.sqlstore
+"""
+import contextlib
+import functools
+import glob
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from .cache import write_atomic
+from .ingest import CACHE_DIR, CHUNK_ROWS, DATA_FILE, PAISE_PER_RUPEE, iter_line_items
+from .profiling import timed
+from .segments import MEASURES, SEGMENT_DTYPE, SEGMENTS, SegmentStats
+
+
+SQL_ENGINE = os.environ.get('ZENO_SQL_ENGINE') or ('duckdb' if importlib.util.find_spec('duckdb') else 'sqlite')
+ENGINES = {'duckdb': '.duckdb', 'sqlite': '.sqlite'}
+
+# Per-bill partial columns as stored, and how each chunk's lines reduce to them
+_PART_AGGREGATION = {
+    'patient_id': ('patient_code', 'min'),
+    'bill_month': ('bill_month', 'min'),
+    'store_name': ('store_code', 'min'),
+    'revenue': ('revenue-value', 'sum'),
+    'discount': ('zrd_promo_discount', 'sum'),
+    'items': ('drug-id', 'count'),
+    'eligible': ('eligibilty_flag', 'max'),
+    'redeemed': ('has_zeno_discount', 'max'),
+}
+
+_BILLS_SQL = """
+CREATE TABLE bills AS
+SELECT
+    id,
+    MIN(patient_id) AS patient_id,
+    MIN(bill_month) AS bill_month,
+    MIN(store_name) AS store_name,
+    SUM(revenue) AS revenue,
+    SUM(discount) AS discount,
+    SUM(items) AS items,
+    CASE WHEN MAX(eligible) = 1 THEN 1 + MAX(redeemed) ELSE 0 END AS segment
+FROM bill_parts
+GROUP BY id
+"""
+
+# Measures per group; revenue in paise
+_MEASURES_SQL = "COUNT(*), SUM(revenue), SUM(items), COUNT(DISTINCT patient_id)"
+# The cube's additive measures per group, in paise (squares in paise squared)
+_CELL_SQL = "COUNT(*), SUM(revenue), SUM(CAST(revenue AS DOUBLE) * revenue), SUM(discount), SUM(items)"
+# Cube dimensions as stored
+_DIMENSIONS = {'store-name': 'store_name', 'month': 'bill_month', 'user_segment': 'segment'}
+
+
+def sql_store_path(version, base=DATA_FILE, engine=SQL_ENGINE):
+    """Database file holding the bills of ``version`` for ``engine``"""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(base)), CACHE_DIR)
+    return os.path.join(cache_dir, f"bills.{version}{ENGINES[engine]}")
+
+
+def _connect(path, engine, read_only=True):
+    if engine == 'duckdb':
+        import duckdb
+
+        return duckdb.connect(path, read_only=read_only)
+    import sqlite3
+
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(path)
+
+
+def _month_numbers(dates):
+    """Months since 1970-01 as nullable integers"""
+    values = dates.to_numpy(dtype='datetime64[ns]')
+    months = pd.Series(values.astype('datetime64[M]').astype(np.int64), index=dates.index)
+    return months.mask(np.isnat(values)).astype('Int64')
+
+
+def _category_names(values, codes):
+    """The categories of ``values`` at ``codes``; missing codes become None"""
+    names = np.append(values.cat.categories.to_numpy(dtype=object), None)
+    return names[codes.fillna(-1).to_numpy(dtype=np.int64)]
+
+
+def _bill_parts(line_items):
+    """A typed line-item chunk reduced to per-bill partials with the stored column names
+
+    Store names, and patient IDs read as a category, are compared by
+    category code (categories are sorted, so the smallest code is the
+    smallest name) and restored after the groupby.
+    """
+    stores, patients = line_items['store-name'], line_items['patient-id']
+    categorical_patients = isinstance(patients.dtype, pd.CategoricalDtype)
+    lines = pd.DataFrame({
+        'id': line_items['id'],
+        'patient_code': patients.cat.codes.where(patients.notna()) if categorical_patients else patients,
+        'bill_month': _month_numbers(line_items['bill_date']),
+        'store_code': stores.cat.codes.where(stores.notna()),
+        'revenue-value': line_items['revenue-value'].astype(np.int64),
+        'zrd_promo_discount': line_items['zrd_promo_discount'].astype(np.int64),
+        'drug-id': line_items['drug-id'],
+        'eligibilty_flag': line_items['eligibilty_flag'],
+        'has_zeno_discount': line_items['has_zeno_discount'].astype(np.int8),
+    })
+    parts = lines.groupby('id', sort=False).agg(**_PART_AGGREGATION).reset_index()
+    parts['store_name'] = _category_names(stores, parts['store_name'])
+    if categorical_patients:
+        parts['patient_id'] = _category_names(patients, parts['patient_id'])
+    return parts
+
+
+def _column_type(values):
+    return 'BIGINT' if pd.api.types.is_integer_dtype(values) else 'VARCHAR'
+
+
+def _append(connection, engine, frame, created):
+    """Append a chunk of bill partials to the temporary bill_parts table, creating it first"""
+    if not created:
+        columns = ', '.join(f"{name} {_column_type(frame[name])}" for name in frame)
+        connection.execute(f"CREATE TEMP TABLE bill_parts ({columns})")
+    if engine == 'duckdb':
+        connection.register('chunk', frame)
+        connection.execute("INSERT INTO bill_parts SELECT * FROM chunk")
+        connection.unregister('chunk')
+    else:
+        # Object columns turn NA into None and numpy ints into Python ints in one pass
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+        placeholders = ', '.join('?' * len(frame.columns))
+        connection.executemany(f"INSERT INTO bill_parts VALUES ({placeholders})", rows)
+
+
+@timed('sqlstore.build')
+def build_sql_store(sources, path, engine=SQL_ENGINE, chunk_rows=CHUNK_ROWS):
+    """Ingest the line items of ``sources`` into a new database file at ``path``
+
+    Older versions of the same engine are removed once it is published.
+    """
+    def write(tmp_path):
+        connection = _connect(tmp_path, engine, read_only=False)
+        try:
+            created = False
+            for source in sources:
+                for line_items in iter_line_items(source, chunk_rows):
+                    _append(connection, engine, _bill_parts(line_items), created)
+                    created = True
+            connection.execute(_BILLS_SQL)
+            connection.execute("CREATE INDEX bills_store_month ON bills (store_name, bill_month)")
+            connection.commit()
+        finally:
+            connection.close()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, write)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f"bills.*{ENGINES[engine]}")):
+        if stale != path:
+            os.remove(stale)
+
+
+class SqlStore:
+    """Segment statistics answered by aggregate queries over a database file
+
+    Every query opens its own read-only connection, so one store can be
+    shared by the refresh thread and all sessions. ``stores``, ``months``,
+    ``query`` and ``segment_stats`` match ``SegmentCube``.
+    """
+
+    def __init__(self, path, engine=SQL_ENGINE):
+        self.path = path
+        self.engine = engine
+
+    @contextlib.contextmanager
+    def _connection(self):
+        connection = _connect(self.path, self.engine)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _column(self, sql):
+        with self._connection() as connection:
+            return [row[0] for row in connection.execute(sql).fetchall()]
+
+    @functools.cached_property
+    def stores(self):
+        return self._column(
+            "SELECT DISTINCT store_name FROM bills WHERE store_name IS NOT NULL "
+            "AND bill_month IS NOT NULL ORDER BY store_name"
+        )
+
+    @functools.cached_property
+    def months(self):
+        numbers = self._column(
+            "SELECT DISTINCT bill_month FROM bills WHERE store_name IS NOT NULL "
+            "AND bill_month IS NOT NULL ORDER BY bill_month"
+        )
+        return [pd.Period(np.datetime64(int(number), 'M'), 'M') for number in numbers]
+
+    @staticmethod
+    def _where(stores, months, extra=()):
+        clauses, params = list(extra), []
+        if stores is not None:
+            stores = list(stores)
+            clauses.append(f"store_name IN ({', '.join('?' * len(stores))})" if stores else "0 = 1")
+            params += stores
+        if months is not None:
+            numbers = [(pd.Period(month, 'M') - pd.Period('1970-01', 'M')).n for month in months]
+            clauses.append(f"bill_month IN ({', '.join('?' * len(numbers))})" if numbers else "0 = 1")
+            params += numbers
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _measures(rows, n_keys):
+        """MEASURES from (keys..., bills, revenue paise, items, patients) rows"""
+        rows = list(rows)
+        columns = [f"key{i}" for i in range(n_keys)] + ['bills', 'revenue_paise', 'items', 'patients']
+        table = pd.DataFrame(rows, columns=columns)
+        for column in ['bills', 'revenue_paise', 'items', 'patients']:
+            table[column] = pd.to_numeric(table[column]).fillna(0)
+        table['bills'] = table['bills'].astype(np.int64)
+        table['patients'] = table['patients'].astype(np.int64)
+        table['revenue_sum'] = table['revenue_paise'] / PAISE_PER_RUPEE
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['revenue_mean'] = table['revenue_sum'] / table['bills']
+            table['items_mean'] = table['items'] / table['bills']
+        return table
+
+    @timed('sqlstore.query')
+    def query(self, stores=None, months=None, segments=None, by=('user_segment',), patients=True):
+        """Roll bills up to ``by``, like ``SegmentCube.query``
+
+        Only bills with a store and bill date count, as in the cube's cells.
+        """
+        by = list(by)
+        keys = [_DIMENSIONS[column] for column in by]
+        extra = ["store_name IS NOT NULL", "bill_month IS NOT NULL"]
+        if segments is not None:
+            codes = [SEGMENTS.index(segment) for segment in segments]
+            extra.append(f"segment IN ({', '.join(map(str, codes))})" if codes else "0 = 1")
+        where, params = self._where(stores, months, extra)
+        measures = _CELL_SQL + (", COUNT(DISTINCT patient_id)" if patients else "")
+        sql = f"SELECT {', '.join(keys + [measures])} FROM bills{where}"
+        if keys:
+            sql += f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+        with self._connection() as connection:
+            rows = connection.execute(sql, params).fetchall()
+
+        names = ['bills', 'revenue_sum', 'revenue_sumsq', 'discount_sum', 'items'] + (['patients'] if patients else [])
+        table = pd.DataFrame(rows, columns=by + names)
+        for name in names:
+            table[name] = pd.to_numeric(table[name]).fillna(0)
+        table = table.astype({name: np.int64 for name in ['bills', 'items', 'patients'] if name in table})
+        table['revenue_sum'] /= PAISE_PER_RUPEE
+        table['revenue_sumsq'] /= PAISE_PER_RUPEE ** 2
+        table['discount_sum'] /= PAISE_PER_RUPEE
+        if 'month' in by:
+            table['month'] = pd.PeriodIndex(table['month'].to_numpy(dtype=np.int64).astype('datetime64[M]'), freq='M')
+        if 'user_segment' in by:
+            table['user_segment'] = pd.Categorical.from_codes(table['user_segment'].to_numpy(dtype=np.int64), dtype=SEGMENT_DTYPE)
+        if by:
+            table = table.set_index(by)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['revenue_mean'] = table['revenue_sum'] / table['bills']
+            table['items_mean'] = table['items'] / table['bills']
+        return table
+
+    @timed('sqlstore.segment_stats')
+    def segment_stats(self, stores=None, months=None):
+        """``SegmentStats`` for a store/month slice, from three aggregate queries"""
+        where, params = self._where(stores, months)
+        dated, dated_params = self._where(stores, months, extra=["bill_month IS NOT NULL"])
+        with self._connection() as connection:
+            by_segment = self._measures(connection.execute(
+                f"SELECT segment, {_MEASURES_SQL} FROM bills{where} GROUP BY segment", params
+            ).fetchall(), 1)
+            by_month = self._measures(connection.execute(
+                f"SELECT bill_month, segment, {_MEASURES_SQL} FROM bills{dated} "
+                "GROUP BY bill_month, segment ORDER BY bill_month, segment", dated_params
+            ).fetchall(), 2)
+            bills, revenue, patients = connection.execute(
+                f"SELECT COUNT(*), SUM(revenue), COUNT(DISTINCT patient_id) FROM bills{where}", params
+            ).fetchone()
+
+        by_segment = by_segment.set_index(by_segment['key0'].astype(np.int64)).reindex(range(len(SEGMENTS)))
+        by_segment = by_segment.fillna({'bills': 0, 'revenue_sum': 0, 'patients': 0})
+        by_segment = by_segment.astype({'bills': np.int64, 'patients': np.int64})
+        by_segment.index = pd.Index(SEGMENTS, name='user_segment')
+        by_month.index = pd.MultiIndex.from_arrays([
+            pd.PeriodIndex(by_month['key0'].to_numpy(dtype=np.int64).astype('datetime64[M]'), freq='M'),
+            pd.Categorical.from_codes(by_month['key1'].to_numpy(dtype=np.int64), dtype=SEGMENT_DTYPE),
+        ], names=['month', 'user_segment'])
+        return SegmentStats(
+            by_segment=by_segment[MEASURES],
+            by_month=by_month[MEASURES],
+            total_bills=int(bills),
+            total_revenue=float(revenue or 0) / PAISE_PER_RUPEE,
+            total_patients=int(patients),
+            months=by_month.index.get_level_values('month').nunique(),
+        )
+
+
+def check_parity(reference, candidate, rtol=1e-9):
+    """Compare the KPIs of two ``SegmentStats``; returns one row per KPI
+
+    Counts must match exactly; money and rates within ``rtol`` (SQL sums
+    integer paise, pandas sums rupee floats).
+    """
+    from dataclasses import asdict
+
+    from .kpis import segment_kpis
+
+    expected, actual = asdict(segment_kpis(reference)), asdict(segment_kpis(candidate))
+    rows = []
+    for name, value in expected.items():
+        other = actual[name]
+        if isinstance(value, int):
+            match = value == other
+        else:
+            match = bool(np.isclose(value, other, rtol=rtol, atol=0, equal_nan=True))
+        rows.append((name, value, other, match))
+    return pd.DataFrame(rows, columns=['kpi', 'reference', 'candidate', 'match']).set_index('kpi')
+
+
+def main(argv=None):
+    """Build the SQL store for the dataset on disk and check it against pandas"""
+    import argparse
+
+    from .pipeline import current_version, data_sources, load_bill_data
+    from .segments import compute_segment_stats
+
+    parser = argparse.ArgumentParser(description="Check SQL backend KPIs against the pandas reference")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default=SQL_ENGINE)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    reference = compute_segment_stats(load_bill_data())
+    pandas_seconds = time.perf_counter() - start
+    path = sql_store_path(current_version(), engine=args.engine)
+    start = time.perf_counter()
+    if not os.path.exists(path):
+        build_sql_store(data_sources(), path, args.engine)
+    candidate = SqlStore(path, args.engine).segment_stats()
+    sql_seconds = time.perf_counter() - start
+
+    parity = check_parity(reference, candidate)
+    print(parity.to_string())
+    print(f"pandas {pandas_seconds:.2f} s, {args.engine} {sql_seconds:.2f} s ({path})")
+    mismatches = int((~parity['match']).sum())
+    print("KPIs match" if not mismatches else f"{mismatches} KPIs differ")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Daily time series per store and segment
+
+Bills, revenue and coin discount are summed once into a dense
+day × store × segment array and kept as running totals along the day
+axis. Any window's total for any store/segment selection is then the
+difference of two rows, so rolling averages, week-over-week deltas and
+seasonality-adjusted trends never rescan the bill table, and a single
+window costs the same however many bills it covers.
+
+Ratios (average basket, coin usage rate) are ratios of window totals,
+never averages of daily ratios.
+
+Running totals are additive, so ``extend_daily_series`` adds a batch of
+new bills by summing only them and adding their running totals in.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .profiling import timed
+from .segments import SEGMENTS, segment_codes
+
+SUMS = ['bills', 'revenue', 'discount']
+TREND_MEASURES = ['bills', 'revenue', 'discount', 'avg_basket', 'coin_usage_rate']
+WINDOWS = [7, 28]
+
+_HOLDERS, _USERS = SEGMENTS.index('Coin Holders'), SEGMENTS.index('Coin Users')
+
+
+def _measure(name, sums, segments):
+    """``name`` from window totals shaped (..., segments, SUMS)"""
+    if name in SUMS:
+        return sums[..., SUMS.index(name)].sum(axis=-1)
+    bills = sums[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if name == 'avg_basket':
+            return sums[..., 1].sum(axis=-1) / bills.sum(axis=-1)
+        if name == 'coin_usage_rate':
+            # Share of eligible bills (holders + users) that redeemed coins
+            users = bills[..., segments == _USERS].sum(axis=-1)
+            eligible = bills[..., (segments == _HOLDERS) | (segments == _USERS)].sum(axis=-1)
+            return users / eligible
+    raise ValueError(f"Unknown measure {name!r}; expected one of {TREND_MEASURES}")
+
+
+def _per_day(name, values, days):
+    """Daily average over a window of ``days`` for additive measures"""
+    return values / days if name in SUMS else values
+
+
+@dataclass(frozen=True)
+class DailySeries:
+    """Running totals per (day, store, segment)
+
+    ``cumulative[d]`` holds the totals of the days before ``dates[d]``,
+    so it has one more row than ``dates``; the last axis follows ``SUMS``.
+    """
+    dates: pd.DatetimeIndex
+    stores: list
+    cumulative: np.ndarray
+
+    def _totals(self, stores=None, segments=None, by_store=False):
+        """Running totals for the selection, shaped (days + 1, [stores,] segments, SUMS)"""
+        store_ids = (np.arange(len(self.stores)) if stores is None
+                     else np.flatnonzero(np.isin(self.stores, list(stores))))
+        segment_ids = (np.arange(len(SEGMENTS)) if segments is None
+                       else np.flatnonzero(np.isin(SEGMENTS, list(segments))))
+        totals = self.cumulative[:, store_ids][:, :, segment_ids]
+        return (totals if by_store else totals.sum(axis=1)), segment_ids
+
+    def _window(self, day):
+        """Position of ``day`` in ``dates`` (the last day when None), clipped to the range"""
+        if day is None:
+            return len(self.dates) - 1
+        return int(np.clip(self.dates.searchsorted(pd.Timestamp(day).normalize()), 0, len(self.dates) - 1))
+
+    def rolling(self, measure, window=1, stores=None, segments=None):
+        """Trailing ``window``-day average of ``measure`` for every full window
+
+        Indexed by the window's last day; ``window=1`` gives the daily values.
+        """
+        totals, segment_ids = self._totals(stores, segments)
+        values = _measure(measure, totals[window:] - totals[:-window], segment_ids)
+        return pd.Series(_per_day(measure, values, window), index=self.dates[window - 1:], name=measure)
+
+    def window_total(self, measure, days=7, end=None, stores=None, segments=None, by_store=False):
+        """``measure`` over the ``days`` days ending on ``end`` (default the last day)
+
+        Per-day average for additive measures; a Series by store when
+        ``by_store`` is set.
+        """
+        last = self._window(end) + 1
+        first = max(last - days, 0)
+        totals, segment_ids = self._totals(stores, segments, by_store)
+        value = _per_day(measure, _measure(measure, totals[last] - totals[first], segment_ids), max(last - first, 1))
+        if by_store:
+            names = self.stores if stores is None else [s for s in self.stores if s in set(stores)]
+            return pd.Series(value, index=pd.Index(names, name='store-name'), name=measure)
+        return float(value)
+
+    def week_over_week(self, measure, end=None, stores=None, segments=None, by_store=False):
+        """``measure`` over the last 7 days, the 7 before, and the relative change
+
+        Returns a DataFrame with ``current``, ``previous`` and ``change``
+        (one row per store when ``by_store`` is set, otherwise one row).
+        """
+        last = self.dates[self._window(end)]
+        current = self.window_total(measure, 7, last, stores, segments, by_store)
+        previous = self.window_total(measure, 7, last - pd.Timedelta(days=7), stores, segments, by_store)
+        if last - pd.Timedelta(days=7) < self.dates[0]:
+            previous = previous * np.nan
+        table = pd.DataFrame({'current': current, 'previous': previous}, index=None if by_store else [last])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['change'] = table['current'] / table['previous'] - 1
+        return table
+
+    def seasonal_trend(self, measure, window=28, stores=None, segments=None):
+        """Daily ``measure``, its day-of-week adjusted value and trailing trend
+
+        Each running total is divided by its day-of-week factor (the
+        weekday's mean over its overall mean) before the measure is taken,
+        so ratios are adjusted through their numerator and denominator.
+        ``trend`` is the trailing ``window``-day average of the adjusted
+        daily totals.
+        """
+        totals, segment_ids = self._totals(stores, segments)
+        daily = np.diff(totals, axis=0)
+        weekdays = self.dates.dayofweek.to_numpy()
+        day_counts = np.bincount(weekdays, minlength=7)
+        weekday_means = np.stack([daily[weekdays == day].sum(axis=0) for day in range(7)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weekday_means /= np.maximum(day_counts, 1).reshape(7, *[1] * (daily.ndim - 1))
+            factors = weekday_means / daily.mean(axis=0)
+        factors[~np.isfinite(factors) | (factors == 0)] = 1.0
+        adjusted = daily / factors[weekdays]
+        running = np.concatenate([np.zeros_like(adjusted[:1]), np.cumsum(adjusted, axis=0)])
+        trend = np.full(len(self.dates), np.nan)
+        if len(self.dates) >= window:
+            trend[window - 1:] = _per_day(
+                measure, _measure(measure, running[window:] - running[:-window], segment_ids), window
+            )
+        return pd.DataFrame({
+            'value': _measure(measure, daily, segment_ids),
+            'adjusted': _measure(measure, adjusted, segment_ids),
+            'trend': trend,
+        }, index=self.dates)
+
+
+@timed('timeseries.build')
+def build_daily_series(bill_data):
+    """Sum a segmented bill table into running day × store × segment totals
+
+    Bills without a bill date or store are left out.
+    """
+    days = bill_data['bill_date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    store_codes, stores = pd.factorize(bill_data['store-name'], sort=True)
+    keep = (store_codes >= 0) & ~np.isnat(days)
+    days, store_codes = days[keep], store_codes[keep]
+    segments = segment_codes(bill_data)[keep].astype(np.int64)
+    first = days.min() if len(days) else np.datetime64('1970-01-01')
+    n_days = int((days.max() - first).astype(np.int64)) + 1 if len(days) else 0
+    day_codes = (days - first).astype(np.int64)
+
+    cells = (day_codes * len(stores) + store_codes) * len(SEGMENTS) + segments
+    n_cells = n_days * len(stores) * len(SEGMENTS)
+    weights = [
+        None,
+        bill_data['revenue-value'].to_numpy(dtype=np.float64)[keep],
+        np.nan_to_num(bill_data['zrd_promo_discount'].to_numpy(dtype=np.float64)[keep]),
+    ]
+    daily = np.stack([np.bincount(cells, weights=w, minlength=n_cells) for w in weights], axis=-1)
+    daily = daily.astype(np.float64).reshape(n_days, len(stores), len(SEGMENTS), len(SUMS))
+    cumulative = np.concatenate([np.zeros_like(daily[:1]), np.cumsum(daily, axis=0)])
+    return DailySeries(
+        dates=pd.date_range(pd.Timestamp(first), periods=n_days, freq='D'),
+        stores=list(stores),
+        cumulative=cumulative,
+    )
+
+
+def _on_grid(series, first, n_days, stores):
+    """``series.cumulative`` on a wider day range and store list"""
+    cumulative = np.zeros((n_days + 1, len(stores), len(SEGMENTS), len(SUMS)))
+    if not len(series.dates):
+        return cumulative
+    offset = (series.dates[0] - first).days
+    # Before the series' first day nothing has accumulated; after its last day the totals hold
+    rows = np.clip(np.arange(n_days + 1) - offset, 0, len(series.dates))
+    cumulative[:, [stores.index(store) for store in series.stores]] = series.cumulative[rows]
+    return cumulative
+
+
+@timed('timeseries.extend')
+def extend_daily_series(series, bill_data):
+    """``series`` with the bills of ``bill_data`` added; none of them may be in it already"""
+    added = build_daily_series(bill_data)
+    parts = [part for part in (series, added) if len(part.dates)]
+    if len(parts) < 2:
+        return parts[0] if parts else series
+    first = min(part.dates[0] for part in parts)
+    n_days = (max(part.dates[-1] for part in parts) - first).days + 1
+    stores = sorted(set(series.stores) | set(added.stores))
+    return DailySeries(
+        dates=pd.date_range(first, periods=n_days, freq='D'),
+        stores=stores,
+        cumulative=_on_grid(series, first, n_days, stores) + _on_grid(added, first, n_days, stores),
+    )
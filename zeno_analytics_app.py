@@ -1,9 +1,31 @@
+"""Streamlit view for the Zeno Coin Analytics Platform
+
+All data loading and KPI math lives in the headless ``zeno_analytics``
+package; this script only caches its results and renders the pages.
+"""
+import os
+
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime
+
+from zeno_analytics.impact import project_impact, sweep_from_stats
+from zeno_analytics.ingest import memory_report
+from zeno_analytics.kpis import segment_kpis
+from zeno_analytics.lru import SizedLRUCache
+from zeno_analytics.pipeline import data_sources
+from zeno_analytics.profiling import RECORDER, Span, serve_metrics, timed
+from zeno_analytics.refresh import BackgroundRefresher
+from zeno_analytics.segments import SEGMENTS
+from zeno_analytics.shared import published_versions
+from zeno_analytics.significance import CONFIDENCE, segment_lift
+from zeno_analytics.simulation import N_SCENARIOS, simulate_impact
+from zeno_analytics.sketches import DistinctCount
+from zeno_analytics.snapshots import serve_kpis
+from zeno_analytics.timeseries import WINDOWS
+
+# Budget for built figures kept across reruns and sessions
+FIGURE_CACHE_MB = float(os.environ.get('ZENO_FIGURE_CACHE_MB', 32))
 
 # Page configuration
 st.set_page_config(
@@ -64,45 +86,75 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 @st.cache_data
-def load_data():
-    """Load and process the CSV data"""
-    df = pd.read_csv('data dump for old pilot stores.csv', low_memory=False)
-    
-    # Data preprocessing
-    df['bill_date'] = pd.to_datetime(df['bill_date'])
-    df['has_zeno_discount'] = df['zrd_promo_discount'].notna()
-    df['zrd_promo_discount'] = pd.to_numeric(df['zrd_promo_discount'], errors='coerce').fillna(0)
-    
-    # Create bill-level aggregation
-    bill_data = df.groupby('id').agg({
-        'patient-id': 'first',
-        'bill_date': 'first',
-        'store-name': 'first',
-        'revenue-value': 'sum',
-        'zrd_promo_discount': 'sum',
-        'drug-id': 'count',
-        'eligibilty_flag': 'max',
-        'has_zeno_discount': 'max'
-    }).reset_index()
-    
-    bill_data.rename(columns={'drug-id': 'items_per_bill'}, inplace=True)
-    
-    # Create customer segments based on actual data
-    bill_data['user_segment'] = 'Direct Users'
-    bill_data.loc[bill_data['eligibilty_flag'] == 1, 'user_segment'] = 'Coin Holders'
-    bill_data.loc[(bill_data['eligibilty_flag'] == 1) & (bill_data['has_zeno_discount']), 'user_segment'] = 'Coin Users'
-    
-    return df, bill_data
+def load_memory_report(version):
+    """Per-column line-item memory before and after the ingest schema"""
+    return memory_report(*data_sources())
 
-# Load data
-df, bill_data = load_data()
+@st.cache_resource(max_entries=2)
+def load_journeys(version, _histories):
+    """Cohort retention, revisit intervals and segment transitions of a version"""
+    return {
+        'cohorts': _histories.cohort_retention(),
+        'curves': _histories.retention_by_segment(),
+        'intervals': _histories.purchase_intervals(),
+        'transitions': _histories.transitions(),
+        'conversion': _histories.holder_conversion(),
+        'repeat_rate': _histories.repeat_rate(),
+    }
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Prometheus-style span metrics on localhost when ZENO_METRICS_PORT is set"""
+    return serve_metrics()
+
+@st.cache_resource
+def get_refresher():
+    """One background refresher per server process, watching the data files"""
+    previous = published_versions()
+    return BackgroundRefresher(restore=previous[0] if previous else None).start()
+
+@st.cache_resource
+def start_kpi_endpoint(_refresher):
+    """KPI snapshots of the live version as JSON on localhost when ZENO_KPI_PORT is set"""
+    def current():
+        state = _refresher.state
+        return None if state is None else state.data.snapshot
+    return serve_kpis(current)
+
+start_metrics_endpoint()
+
+# Load data: sessions read the live version while newer ones build in the background
+refresher = get_refresher()
+start_kpi_endpoint(refresher)
+state = refresher.state
+if state is None:
+    with st.spinner("Loading data for the first time..."):
+        state = refresher.wait()
+    if state is None:
+        st.error(f"Could not load the data: {refresher.last_error}")
+        st.stop()
+version = state.version
+dataset = state.data
+stats = dataset.stats
 
 # Sidebar navigation
 st.sidebar.title("🎯 Navigation")
 page = st.sidebar.selectbox(
     "Select Page",
-    ["📊 Executive Dashboard", "🔬 Funnel Analysis", "💡 Impact Calculator", "📖 Documentation"]
+    ["📊 Executive Dashboard", "🔬 Funnel Analysis", "📈 Trends", "💡 Impact Calculator", "📖 Documentation"]
 )
+funnel_view = None
+if page == "🔬 Funnel Analysis":
+    funnel_view = st.sidebar.radio("Funnel View", ["🔄 Conversion Funnel", "👥 Cohorts & Retention"])
+st.sidebar.caption(
+    f"Data as of {state.as_of:%d %b %Y %H:%M}"
+    + (" · refreshing…" if refresher.building else "")
+)
+if dataset.quality is not None and dataset.quality.issues:
+    st.sidebar.warning(
+        f"⚠️ {dataset.quality.issues:,} data-quality findings in the dumps "
+        "(Documentation → Data Processing)"
+    )
 
 # Main title with better contrast
 st.markdown("""
@@ -114,270 +166,50 @@ st.markdown("""
 """, unsafe_allow_html=True)
 st.markdown("<p style='text-align: center; font-size: 18px; opacity: 0.8;'>Data-Driven Insights from Real Customer Behavior</p>", unsafe_allow_html=True)
 
-if page == "📊 Executive Dashboard":
-    st.header("Executive Dashboard")
-    
-    # Calculate key metrics from actual data
-    total_bills = len(bill_data)
-    total_revenue = bill_data['revenue-value'].sum()
-    avg_basket = bill_data['revenue-value'].mean()
-    
-    # Segment counts
-    direct_users = len(bill_data[bill_data['user_segment'] == 'Direct Users'])
-    coin_holders = len(bill_data[bill_data['user_segment'] == 'Coin Holders'])
-    coin_users = len(bill_data[bill_data['user_segment'] == 'Coin Users'])
-    
-    # Percentages
-    direct_pct = (direct_users / total_bills) * 100
-    holders_pct = (coin_holders / total_bills) * 100
-    users_pct = (coin_users / total_bills) * 100
-    
-    # Segment averages
-    direct_avg = bill_data[bill_data['user_segment'] == 'Direct Users']['revenue-value'].mean()
-    holder_avg = bill_data[bill_data['user_segment'] == 'Coin Holders']['revenue-value'].mean()
-    user_avg = bill_data[bill_data['user_segment'] == 'Coin Users']['revenue-value'].mean()
-    
-    # Key Metrics Row
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("Total Bills", f"{total_bills:,}", "Actual transactions")
-    with col2:
-        st.metric("Total Revenue", f"₹{total_revenue/1000000:.1f}M", "From all segments")
-    with col3:
-        st.metric("Avg Basket Size", f"₹{avg_basket:.0f}", "Overall average")
-    with col4:
-        eligible_pct = holders_pct + users_pct
-        st.metric("Have Coins", f"{eligible_pct:.1f}%", "Eligible customers")
-    
-    st.markdown("---")
-    
-    # Segment Distribution
-    col1, col2 = st.columns([2, 1])
-    
-    with col1:
-        st.subheader("📈 Customer Segment Distribution")
-        
-        # Pie chart
-        fig_pie = go.Figure(data=[go.Pie(
-            labels=['Direct Users', 'Coin Holders', 'Coin Users'],
-            values=[direct_users, coin_holders, coin_users],
-            hole=.3,
-            marker_colors=['#e74c3c', '#f39c12', '#27ae60'],
-            textfont=dict(size=14)
-        )])
-        fig_pie.update_layout(
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            showlegend=True,
-            legend=dict(font=dict(size=12))
-        )
-        st.plotly_chart(fig_pie, use_container_width=True)
-    
-    with col2:
-        st.subheader("💰 Basket Size by Segment")
-        
-        # Bar chart for basket sizes
-        fig_basket = go.Figure()
-        fig_basket.add_trace(go.Bar(
-            x=['Direct', 'Holders', 'Users'],
-            y=[direct_avg, holder_avg, user_avg],
-            text=[f"₹{direct_avg:.0f}", f"₹{holder_avg:.0f}", f"₹{user_avg:.0f}"],
-            textposition='outside',
-            marker_color=['#e74c3c', '#f39c12', '#27ae60'],
-            textfont=dict(size=12)
-        ))
-        fig_basket.update_layout(
-            showlegend=False,
-            yaxis_title="Average Basket (₹)",
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(gridcolor='rgba(128,128,128,0.2)'),
-            yaxis=dict(gridcolor='rgba(128,128,128,0.2)')
-        )
-        st.plotly_chart(fig_basket, use_container_width=True)
-    
-    # Conversion Funnel
-    st.markdown("---")
-    st.subheader("🔄 Conversion Funnel")
-    
-    eligible_customers = coin_holders + coin_users
-    conversion_rate = (coin_users / eligible_customers * 100) if eligible_customers > 0 else 0
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.info(f"""
-        **Stage 1: Direct Users**
-        - Count: {direct_users:,}
-        - Percentage: {direct_pct:.1f}%
-        - Avg Basket: ₹{direct_avg:.0f}
-        """)
-    
-    with col2:
-        st.warning(f"""
-        **Stage 2: Coin Holders**
-        - Count: {coin_holders:,}
-        - Percentage: {holders_pct:.1f}%
-        - Avg Basket: ₹{holder_avg:.0f}
-        - Lift: +{(holder_avg/direct_avg-1)*100:.1f}%
-        """)
-    
-    with col3:
-        st.success(f"""
-        **Stage 3: Coin Users**
-        - Count: {coin_users:,}
-        - Percentage: {users_pct:.1f}%
-        - Avg Basket: ₹{user_avg:.0f}
-        - Lift: +{(user_avg/direct_avg-1)*100:.1f}%
-        """)
-    
-    # Revenue Opportunity
-    st.markdown("---")
-    st.subheader("💡 Revenue Opportunity")
-    
-    potential_revenue = coin_holders * (user_avg - holder_avg)
-    monthly_potential = potential_revenue / (len(bill_data['bill_date'].dt.to_period('M').unique()))
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        st.metric(
-            "Untapped Revenue from Coin Holders",
-            f"₹{potential_revenue:,.0f}",
-            f"If all holders became users"
-        )
-    with col2:
-        st.metric(
-            "Monthly Opportunity",
-            f"₹{monthly_potential:,.0f}",
-            f"Average per month"
-        )
+# Trace properties that hold the data arrays, and rough fixed costs of a figure and a trace
+FIGURE_ARRAYS = ('x', 'y', 'z', 'labels', 'values', 'text', 'customdata')
+FIGURE_BYTES, TRACE_BYTES = 8 * 2**10, 512
 
-elif page == "🔬 Funnel Analysis":
-    st.header("Customer Journey Funnel Analysis")
-    
-    # Calculate funnel metrics
-    total_customers = len(bill_data['patient-id'].unique())
-    total_bills = len(bill_data)
-    
-    # Segment data
-    direct_bills = bill_data[bill_data['user_segment'] == 'Direct Users']
-    holder_bills = bill_data[bill_data['user_segment'] == 'Coin Holders']
-    user_bills = bill_data[bill_data['user_segment'] == 'Coin Users']
-    
-    # Create funnel visualization
-    funnel_data = pd.DataFrame({
-        'Stage': ['All Customers', 'Have Coins', 'Use Coins'],
-        'Count': [
-            total_bills,
-            len(holder_bills) + len(user_bills),
-            len(user_bills)
-        ],
-        'Percentage': [
-            100,
-            ((len(holder_bills) + len(user_bills)) / total_bills) * 100,
-            (len(user_bills) / total_bills) * 100
-        ]
-    })
-    
-    # Funnel chart
-    fig_funnel = go.Figure(go.Funnel(
-        y=funnel_data['Stage'],
-        x=funnel_data['Count'],
-        textposition="inside",
-        textinfo="value+percent initial",
-        marker={"color": ["#3498db", "#f39c12", "#27ae60"]},
-        textfont=dict(size=14, color='white')
-    ))
-    
-    fig_funnel.update_layout(
-        height=400,
-        title="Customer Conversion Funnel",
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)'
-    )
-    st.plotly_chart(fig_funnel, use_container_width=True)
-    
-    # Conversion metrics
-    st.markdown("---")
-    st.subheader("📊 Conversion Metrics")
-    
-    col1, col2, col3 = st.columns(3)
-    
-    eligible = len(holder_bills) + len(user_bills)
-    activation_rate = (eligible / total_bills * 100)
-    usage_rate = (len(user_bills) / eligible * 100) if eligible > 0 else 0
-    
-    with col1:
-        st.metric("Coin Activation Rate", f"{activation_rate:.1f}%", 
-                 "Have coins / Total customers")
-    
-    with col2:
-        st.metric("Coin Usage Rate", f"{usage_rate:.1f}%",
-                 "Use coins / Have coins")
-    
-    with col3:
-        st.metric("Overall Conversion", f"{len(user_bills)/total_bills*100:.1f}%",
-                 "Use coins / Total customers")
-    
-    # Segment behavior analysis
-    st.markdown("---")
-    st.subheader("🎯 Segment Behavior Analysis")
-    
-    segment_stats = []
-    for segment in ['Direct Users', 'Coin Holders', 'Coin Users']:
-        segment_data = bill_data[bill_data['user_segment'] == segment]
-        segment_stats.append({
-            'Segment': segment,
-            'Bills': len(segment_data),
-            'Avg Basket': f"₹{segment_data['revenue-value'].mean():.0f}",
-            'Avg Items': f"{segment_data['items_per_bill'].mean():.1f}",
-            'Total Revenue': f"₹{segment_data['revenue-value'].sum()/1000000:.1f}M"
-        })
-    
-    st.dataframe(pd.DataFrame(segment_stats), use_container_width=True)
-    
-    # Drop-off analysis
-    st.markdown("---")
-    st.subheader("🔍 Drop-off Analysis")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.error(f"""
-        **Major Drop-off: Coin Holders → Coin Users**
-        - Holders not using: {len(holder_bills):,}
-        - Drop-off rate: {(len(holder_bills)/(len(holder_bills)+len(user_bills))*100):.1f}%
-        - Revenue loss: ₹{len(holder_bills) * (user_bills['revenue-value'].mean() - holder_bills['revenue-value'].mean()):,.0f}
-        """)
-    
-    with col2:
-        st.info(f"""
-        **Focus Areas for Improvement:**
-        1. **Activation**: Convert {(100-activation_rate):.1f}% without coins
-        2. **Usage**: Convert {len(holder_bills):,} holders to users
-        3. **Retention**: Keep {len(user_bills):,} active users engaged
-        """)
+def figure_size(fig):
+    """Estimated size of a figure from its trace arrays, without serializing it"""
+    size = FIGURE_BYTES
+    for trace in fig.data:
+        size += TRACE_BYTES
+        for name in FIGURE_ARRAYS:
+            value = trace[name] if name in trace else None
+            if value is not None and not isinstance(value, str):
+                size += getattr(value, 'nbytes', None) or 16 * len(value)
+    return size
 
-elif page == "💡 Impact Calculator":
-    st.header("Revenue Impact Calculator")
-    st.markdown("Simulate the impact of improving coin holder conversion")
-    
-    # Current state metrics
-    total_bills = len(bill_data)
-    current_direct = len(bill_data[bill_data['user_segment'] == 'Direct Users'])
-    current_holders = len(bill_data[bill_data['user_segment'] == 'Coin Holders'])
-    current_users = len(bill_data[bill_data['user_segment'] == 'Coin Users'])
-    
-    # Percentages
-    current_have_coins_pct = ((current_holders + current_users) / total_bills) * 100
-    current_use_coins_pct = (current_users / total_bills) * 100
-    current_conversion = (current_users / (current_holders + current_users) * 100) if (current_holders + current_users) > 0 else 0
-    
-    # Basket sizes from actual data
-    direct_avg = bill_data[bill_data['user_segment'] == 'Direct Users']['revenue-value'].mean()
-    holder_avg = bill_data[bill_data['user_segment'] == 'Coin Holders']['revenue-value'].mean()
-    user_avg = bill_data[bill_data['user_segment'] == 'Coin Users']['revenue-value'].mean()
+@st.cache_resource
+def get_figure_cache():
+    """Built figures shared by all sessions, weighed by their estimated size"""
+    return SizedLRUCache(FIGURE_CACHE_MB * 2**20, sizeof=figure_size)
+
+def format_lift(lift):
+    """A lift row as '+x% (95% CI a% to b%, p = ...)'"""
+    p_value = "p < 0.001" if lift['p_value'] < 0.001 else f"p = {lift['p_value']:.3f}"
+    return (f"{lift['lift']*100:+.1f}% ({CONFIDENCE*100:.0f}% CI {lift['lift_low']*100:+.1f}% "
+            f"to {lift['lift_high']*100:+.1f}%, {p_value})")
+
+def plotly_chart(name, params, build):
+    """Render the figure ``build()`` returns, reusing it for the same version, page and params"""
+    key = (version, page, name, params)
+    with Span(f"{page_span.name}.plotly_chart"):
+        st.plotly_chart(get_figure_cache().get_or_build(key, build), use_container_width=True)
+
+@st.fragment
+@timed("page.impact_calculator.fragment")
+def impact_calculator(kpis, bootstrap):
+    """Scenario controls and projections, rerun on their own when a control changes
+
+    Depends only on the precomputed KPIs and segment bootstrap, so a slider
+    tick skips the rest of the script.
+    """
+    current_have_coins_pct = kpis.activation_rate
+    current_use_coins_pct = kpis.overall_conversion
+    current_conversion = kpis.conversion_rate
+    overall_avg = kpis.avg_basket
     
     # Input controls
     col1, col2 = st.columns([1, 2])
@@ -408,31 +240,14 @@ elif page == "💡 Impact Calculator":
         - Have Coins: {current_have_coins_pct:.1f}%
         - Use Coins: {current_use_coins_pct:.1f}%
         - Conversion: {current_conversion:.1f}%
-        - Avg Basket: ₹{bill_data['revenue-value'].mean():.0f}
+        - Avg Basket: ₹{overall_avg:.0f}
         """)
     
     with col2:
         st.markdown("### 📈 Impact Projections")
         
-        # Calculate new distribution
-        target_have_coins = current_have_coins_pct  # Keep this constant
-        new_user_pct = target_use_coins
-        new_holder_pct = target_have_coins - new_user_pct
-        new_direct_pct = 100 - target_have_coins
-        
-        # Calculate new counts
-        new_direct = monthly_bills * (new_direct_pct / 100)
-        new_holders = monthly_bills * (new_holder_pct / 100)
-        new_users = monthly_bills * (new_user_pct / 100)
-        
-        # Calculate revenues
-        current_revenue = monthly_bills * bill_data['revenue-value'].mean()
-        new_revenue = (new_direct * direct_avg) + (new_holders * holder_avg) + (new_users * user_avg)
-        incremental_revenue = new_revenue - current_revenue
-        
-        # Calculate new average basket
-        new_avg_basket = new_revenue / monthly_bills
-        basket_increase = new_avg_basket - bill_data['revenue-value'].mean()
+        # Project the target month from the current segment baskets
+        impact = project_impact(kpis, target_use_coins, monthly_bills)
         
         # Display KPIs
         st.markdown("### 🎯 Key Performance Indicators")
@@ -440,80 +255,598 @@ elif page == "💡 Impact Calculator":
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            delta = new_avg_basket - bill_data['revenue-value'].mean()
             st.metric("Average Bucket Size", 
-                     f"₹{new_avg_basket:.0f}",
-                     f"₹{delta:+.0f} ({delta/bill_data['revenue-value'].mean()*100:+.1f}%)")
+                     f"₹{impact.new_avg_basket:.0f}",
+                     f"₹{impact.basket_delta:+.0f} ({impact.basket_delta/overall_avg*100:+.1f}%)")
         
         with col2:
-            new_conversion = (new_users / (new_holders + new_users) * 100) if (new_holders + new_users) > 0 else 0
-            delta_conv = new_conversion - current_conversion
             st.metric("Conversion Rate",
-                     f"{new_conversion:.1f}%",
-                     f"{delta_conv:+.1f}%")
+                     f"{impact.new_conversion:.1f}%",
+                     f"{impact.conversion_delta:+.1f}%")
         
         with col3:
-            additional_users = new_users - (monthly_bills * current_use_coins_pct / 100)
             st.metric("New Coin Users",
-                     f"{int(additional_users):,}",
-                     f"+{additional_users/monthly_bills*100:.1f}%")
+                     f"{int(impact.additional_users):,}",
+                     f"+{impact.additional_users/monthly_bills*100:.1f}%")
         
         col1, col2, col3 = st.columns(3)
         
         with col1:
             st.metric("Incremental Revenue",
-                     f"₹{incremental_revenue:,.0f}",
-                     f"{incremental_revenue/current_revenue*100:+.1f}% increase")
+                     f"₹{impact.incremental_revenue:,.0f}",
+                     f"{impact.incremental_revenue/impact.current_revenue*100:+.1f}% increase")
         
         with col2:
             st.metric("Net Monthly Impact",
-                     f"₹{incremental_revenue:,.0f}",
+                     f"₹{impact.incremental_revenue:,.0f}",
                      "After all costs")
         
         with col3:
-            annual_impact = incremental_revenue * 12
             st.metric("Annual Impact",
-                     f"₹{annual_impact/1000000:.1f}M",
-                     f"ROI: {annual_impact/current_revenue*100:.0f}%")
+                     f"₹{impact.annual_impact/1000000:.1f}M",
+                     f"ROI: {impact.annual_impact/impact.current_revenue*100:.0f}%")
+        
+        # Uncertainty bands
+        st.markdown("### 📉 Uncertainty Range")
+        if bootstrap is None:
+            st.caption("Uncertainty ranges resample individual bills and need the pandas backend.")
+        else:
+            bands = simulate_impact(
+                bootstrap,
+                [kpis.direct_pct / 100, kpis.holders_pct / 100, kpis.users_pct / 100],
+                [impact.new_direct_pct / 100, impact.new_holder_pct / 100, impact.new_user_pct / 100],
+                monthly_bills
+            )
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Incremental Revenue (P5 – P95)",
+                         f"₹{bands.loc[5, 'incremental']:,.0f} – ₹{bands.loc[95, 'incremental']:,.0f}",
+                         f"Median ₹{bands.loc[50, 'incremental']:,.0f}", delta_color="off")
+            with col2:
+                st.metric("Annual Impact (P5 – P95)",
+                         f"₹{bands.loc[5, 'annual']/1000000:.2f}M – ₹{bands.loc[95, 'annual']/1000000:.2f}M",
+                         f"Median ₹{bands.loc[50, 'annual']/1000000:.2f}M", delta_color="off")
+            with col3:
+                st.metric("Monthly Revenue (P5 – P95)",
+                         f"₹{bands.loc[5, 'new_revenue']/1000000:.2f}M – ₹{bands.loc[95, 'new_revenue']/1000000:.2f}M",
+                         f"Median ₹{bands.loc[50, 'new_revenue']/1000000:.2f}M", delta_color="off")
+            st.caption(f"90% intervals from {N_SCENARIOS:,} Monte Carlo scenarios: segment baskets "
+                       "bootstrapped from actual bills plus month-to-month sampling noise.")
         
         # Visualization
         st.markdown("### 📊 Impact Visualization")
         
         # Create comparison chart
-        comparison_data = pd.DataFrame({
-            'Scenario': ['Current', 'Target'] * 3,
-            'Segment': ['Direct'] * 2 + ['Holders'] * 2 + ['Users'] * 2,
+        def build_comparison():
+            # Plain traces: plotly express costs tens of ms per slider tick here
+            fig = go.Figure([
+                go.Bar(name=segment, x=['Current', 'Target'], y=[current, target], marker_color=color)
+                for segment, current, target, color in [
+                    ('Direct', kpis.direct_pct, impact.new_direct_pct, '#e74c3c'),
+                    ('Holders', kpis.holders_pct, impact.new_holder_pct, '#f39c12'),
+                    ('Users', kpis.users_pct, impact.new_user_pct, '#27ae60'),
+                ]
+            ])
+            fig.update_layout(
+                barmode='stack',
+                height=400,
+                xaxis_title='Scenario',
+                yaxis_title='Percentage',
+                legend_title_text='Segment',
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                xaxis=dict(gridcolor='rgba(128,128,128,0.2)'),
+                yaxis=dict(gridcolor='rgba(128,128,128,0.2)')
+            )
+            return fig
+        # The mix only depends on the slider; monthly bills scale revenue, not shares
+        plotly_chart("segment_mix", (target_use_coins,), build_comparison)
+
+# Each page's compute and rendering is recorded as one span, also when it stops early
+with Span("page." + page.split(" ", 1)[1].lower().replace(" ", "_")) as page_span:
+    if page == "📊 Executive Dashboard":
+        st.header("Executive Dashboard")
+        
+        # Store and month filters are answered from the pre-aggregated cube
+        cube = dataset.cube
+        st.sidebar.markdown("### 🔎 Filters")
+        selected_stores = st.sidebar.multiselect("Stores", cube.stores, placeholder="All stores")
+        month_labels = [str(month) for month in cube.months]
+        if len(month_labels) > 1:
+            start_month, end_month = st.sidebar.select_slider(
+                "Months", options=month_labels, value=(month_labels[0], month_labels[-1])
+            )
+        else:
+            start_month, end_month = month_labels[0], month_labels[-1]
+        selected_months = [m for m in cube.months if start_month <= str(m) <= end_month]
+        filters = (tuple(selected_stores), start_month, end_month)
+        
+        filtered = bool(selected_stores) or len(selected_months) < len(cube.months)
+        sketched = filtered and dataset.sketches is not None
+        if filtered:
+            if sketched:
+                # Distinct patients of the slice come from the sketches, so the cube skips them
+                stats = cube.segment_stats(selected_stores or None, selected_months, patients=False)
+            else:
+                stats = cube.segment_stats(selected_stores or None, selected_months)
+            if stats.total_bills == 0:
+                st.warning("No bills match the selected filters")
+                st.stop()
+        
+        # Key metrics from the precomputed segment statistics
+        kpis = segment_kpis(stats)
+        
+        # Distinct customers come from merged sketches, not a rehash of patient-id
+        if sketched:
+            customers = dataset.sketches.distinct_patients(
+                selected_stores or None,
+                selected_months[0].start_time if selected_months else None,
+                selected_months[-1].end_time if selected_months else None
+            )
+        else:
+            # Exact for the whole dataset, and for every slice on the SQL backend
+            customers = DistinctCount(stats.total_patients, True, 0.0)
+        
+        # Key Metrics Row
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            st.metric("Total Bills", f"{kpis.total_bills:,}", "Actual transactions")
+        with col2:
+            st.metric("Total Revenue", f"₹{kpis.total_revenue/1000000:.1f}M", "From all segments")
+        with col3:
+            st.metric("Avg Basket Size", f"₹{kpis.avg_basket:.0f}", "Overall average")
+        with col4:
+            st.metric("Have Coins", f"{kpis.activation_rate:.1f}%", "Eligible customers")
+        with col5:
+            st.metric("Unique Customers",
+                      f"{customers.value:,}" if customers.exact else f"≈{customers.value:,}",
+                      "Exact count" if customers.exact else f"±{customers.relative_error*100:.1f}% (HyperLogLog)")
+        
+        st.markdown("---")
+        
+        # Segment Distribution
+        col1, col2 = st.columns([2, 1])
+        
+        with col1:
+            st.subheader("📈 Customer Segment Distribution")
+            
+            # Pie chart
+            def build_pie():
+                fig_pie = go.Figure(data=[go.Pie(
+                    labels=['Direct Users', 'Coin Holders', 'Coin Users'],
+                    values=[kpis.direct_users, kpis.coin_holders, kpis.coin_users],
+                    hole=.3,
+                    marker_colors=['#e74c3c', '#f39c12', '#27ae60'],
+                    textfont=dict(size=14)
+                )])
+                fig_pie.update_layout(
+                    height=400,
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    showlegend=True,
+                    legend=dict(font=dict(size=12))
+                )
+                return fig_pie
+            plotly_chart("segment_pie", filters, build_pie)
+        
+        with col2:
+            st.subheader("💰 Basket Size by Segment")
+            
+            # Bar chart for basket sizes
+            def build_basket():
+                fig_basket = go.Figure()
+                fig_basket.add_trace(go.Bar(
+                    x=['Direct', 'Holders', 'Users'],
+                    y=[kpis.direct_avg, kpis.holder_avg, kpis.user_avg],
+                    text=[f"₹{kpis.direct_avg:.0f}", f"₹{kpis.holder_avg:.0f}", f"₹{kpis.user_avg:.0f}"],
+                    textposition='outside',
+                    marker_color=['#e74c3c', '#f39c12', '#27ae60'],
+                    textfont=dict(size=12)
+                ))
+                fig_basket.update_layout(
+                    showlegend=False,
+                    yaxis_title="Average Basket (₹)",
+                    height=400,
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    xaxis=dict(gridcolor='rgba(128,128,128,0.2)'),
+                    yaxis=dict(gridcolor='rgba(128,128,128,0.2)')
+                )
+                return fig_basket
+            plotly_chart("basket_bar", filters, build_basket)
+        
+        # Conversion Funnel
+        st.markdown("---")
+        st.subheader("🔄 Conversion Funnel")
+        
+        # Lift against Direct Users with Welch CIs, from the cube's sums and sums of squares
+        lift = segment_lift(cube, selected_stores or None, selected_months)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.info(f"""
+        **Stage 1: Direct Users**
+        - Count: {kpis.direct_users:,}
+        - Percentage: {kpis.direct_pct:.1f}%
+        - Avg Basket: ₹{kpis.direct_avg:.0f}
+        """)
+        
+        with col2:
+            st.warning(f"""
+        **Stage 2: Coin Holders**
+        - Count: {kpis.coin_holders:,}
+        - Percentage: {kpis.holders_pct:.1f}%
+        - Avg Basket: ₹{kpis.holder_avg:.0f}
+        - Lift: {format_lift(lift.loc[('Coin Holders', 'Direct Users')])}
+        """)
+        
+        with col3:
+            st.success(f"""
+        **Stage 3: Coin Users**
+        - Count: {kpis.coin_users:,}
+        - Percentage: {kpis.users_pct:.1f}%
+        - Avg Basket: ₹{kpis.user_avg:.0f}
+        - Lift: {format_lift(lift.loc[('Coin Users', 'Direct Users')])}
+        """)
+        
+        # Revenue Opportunity
+        st.markdown("---")
+        st.subheader("💡 Revenue Opportunity")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric(
+                "Untapped Revenue from Coin Holders",
+                f"₹{kpis.potential_revenue:,.0f}",
+                f"If all holders became users"
+            )
+        with col2:
+            st.metric(
+                "Monthly Opportunity",
+                f"₹{kpis.monthly_potential:,.0f}",
+                f"Average per month"
+            )
+
+    elif page == "🔬 Funnel Analysis" and funnel_view == "🔄 Conversion Funnel":
+        st.header("Customer Journey Funnel Analysis")
+        
+        # Calculate funnel metrics
+        kpis = segment_kpis(stats)
+        total_bills = kpis.total_bills
+        
+        # Segment counts
+        holder_count = kpis.coin_holders
+        user_count = kpis.coin_users
+        
+        # Create funnel visualization
+        funnel_data = pd.DataFrame({
+            'Stage': ['All Customers', 'Have Coins', 'Use Coins'],
+            'Count': [
+                total_bills,
+                kpis.eligible,
+                user_count
+            ],
             'Percentage': [
-                current_direct/total_bills*100, new_direct_pct,
-                current_holders/total_bills*100, new_holder_pct,
-                current_users/total_bills*100, new_user_pct
+                100,
+                kpis.activation_rate,
+                kpis.overall_conversion
             ]
         })
         
-        fig = px.bar(comparison_data, x='Scenario', y='Percentage', 
-                    color='Segment', barmode='stack',
-                    color_discrete_map={'Direct': '#e74c3c', 'Holders': '#f39c12', 'Users': '#27ae60'})
-        fig.update_layout(
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(gridcolor='rgba(128,128,128,0.2)'),
-            yaxis=dict(gridcolor='rgba(128,128,128,0.2)')
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        # Funnel chart
+        def build_funnel():
+            fig_funnel = go.Figure(go.Funnel(
+                y=funnel_data['Stage'],
+                x=funnel_data['Count'],
+                textposition="inside",
+                textinfo="value+percent initial",
+                marker={"color": ["#3498db", "#f39c12", "#27ae60"]},
+                textfont=dict(size=14, color='white')
+            ))
+            
+            fig_funnel.update_layout(
+                height=400,
+                title="Customer Conversion Funnel",
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)'
+            )
+            return fig_funnel
+        plotly_chart("conversion_funnel", (), build_funnel)
+        
+        # Conversion metrics
+        st.markdown("---")
+        st.subheader("📊 Conversion Metrics")
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("Coin Activation Rate", f"{kpis.activation_rate:.1f}%", 
+                     "Have coins / Total customers")
+        
+        with col2:
+            st.metric("Coin Usage Rate", f"{kpis.conversion_rate:.1f}%",
+                     "Use coins / Have coins")
+        
+        with col3:
+            st.metric("Overall Conversion", f"{kpis.overall_conversion:.1f}%",
+                     "Use coins / Total customers")
+        
+        # Segment behavior analysis
+        st.markdown("---")
+        st.subheader("🎯 Segment Behavior Analysis")
+        
+        segment_stats = []
+        for segment, row in stats.by_segment.iterrows():
+            segment_stats.append({
+                'Segment': segment,
+                'Bills': int(row['bills']),
+                'Avg Basket': f"₹{row['revenue_mean']:.0f}",
+                'Avg Items': f"{row['items_mean']:.1f}",
+                'Total Revenue': f"₹{row['revenue_sum']/1000000:.1f}M"
+            })
+        
+        st.dataframe(pd.DataFrame(segment_stats), use_container_width=True)
+        
+        # Basket lift significance, overall and per store and month
+        st.markdown("---")
+        st.subheader("📐 Is the Basket Lift Significant?")
+        
+        lift = segment_lift(dataset.cube)
+        st.dataframe(pd.DataFrame({
+            'Comparison': [f"{segment} vs {baseline}" for segment, baseline in lift.index],
+            'Avg Basket': [f"₹{segment:.0f} vs ₹{baseline:.0f}"
+                           for segment, baseline in zip(lift['segment_mean'], lift['baseline_mean'])],
+            'Lift (Welch)': [format_lift(row) for row in lift.to_dict('records')],
+            'Bootstrap CI': [f"{low*100:+.1f}% to {high*100:+.1f}%"
+                             for low, high in zip(lift['boot_low'], lift['boot_high'])],
+            'Bootstrap p': lift['boot_p_value'].map(lambda p: "< 0.001" if p < 0.001 else f"{p:.3f}")
+        }), use_container_width=True, hide_index=True)
+        
+        by_store_month = segment_lift(dataset.cube, by=('store-name', 'month'))
+        significant = (by_store_month['p_value'] < 1 - CONFIDENCE).groupby(level=['segment', 'baseline']).agg(['sum', 'size'])
+        with st.expander("Per store and month"):
+            st.caption(" · ".join(
+                f"{segment} vs {baseline}: {int(row['sum'])} of {int(row['size'])} store-months significant at {(1 - CONFIDENCE)*100:.0f}%"
+                for (segment, baseline), row in significant.iterrows()
+            ))
+            users = by_store_month.xs(('Coin Users', 'Direct Users'), level=['segment', 'baseline'])
+            st.dataframe(pd.DataFrame({
+                'Store': users.index.get_level_values('store-name'),
+                'Month': users.index.get_level_values('month').astype(str),
+                'User Bills': users['segment_bills'].astype(int),
+                'Direct Bills': users['baseline_bills'].astype(int),
+                'Coin Users vs Direct': [format_lift(row) for row in users.to_dict('records')]
+            }), use_container_width=True, hide_index=True)
+        
+        # Drop-off analysis
+        st.markdown("---")
+        st.subheader("🔍 Drop-off Analysis")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.error(f"""
+        **Major Drop-off: Coin Holders → Coin Users**
+        - Holders not using: {holder_count:,}
+        - Drop-off rate: {100 - kpis.conversion_rate:.1f}%
+        - Revenue loss: ₹{kpis.potential_revenue:,.0f}
+        """)
+        
+        with col2:
+            st.info(f"""
+        **Focus Areas for Improvement:**
+        1. **Activation**: Convert {(100-kpis.activation_rate):.1f}% without coins
+        2. **Usage**: Convert {holder_count:,} holders to users
+        3. **Retention**: Keep {user_count:,} active users engaged
+        """)
 
-elif page == "📖 Documentation":
-    st.header("📖 Platform Documentation")
-    st.markdown("Complete guide to understanding metrics, KPIs, and calculation logic")
-    
-    # Create tabs for different sections
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 KPI Definitions", "🧮 Calculation Logic", "📈 Data Processing", "💡 Impact Calculator"])
-    
-    with tab1:
-        st.subheader("Key Performance Indicators (KPIs)")
+    elif page in ("🔬 Funnel Analysis", "📈 Trends") and dataset.bill_data is None:
+        st.header("Customer Journeys: Cohorts & Retention" if page == "🔬 Funnel Analysis" else "Daily Trends by Store and Segment")
+        st.info("This view follows individual bills, which the SQL backend (ZENO_BACKEND=sql) "
+                "does not load. Run with the pandas backend to see it.")
+
+    elif page == "🔬 Funnel Analysis":
+        st.header("Customer Journeys: Cohorts & Retention")
+        
+        # Per-patient histories are sorted once per version; these are cheap passes over them
+        histories = dataset.histories
+        journeys = load_journeys(version, histories)
+        conversion = journeys['conversion']
+        segment_colors = ['#e74c3c', '#f39c12', '#27ae60']
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Patients Tracked", f"{histories.n_patients:,}", f"{histories.n_bills:,} bills")
+        with col2:
+            st.metric("Repeat Patients", f"{journeys['repeat_rate']*100:.1f}%", "More than one bill")
+        with col3:
+            st.metric("Holder → User", f"{conversion.rate*100:.1f}%",
+                      f"{conversion.converted:,} of {conversion.holders:,} holders")
+        with col4:
+            st.metric("Days to First Redemption", f"{conversion.median_days:.0f}",
+                      "Median, from first holder bill")
+        
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📉 Retention by First Segment")
+            
+            def build_curves():
+                curves = journeys['curves']
+                fig_curves = go.Figure()
+                for segment, color in zip(curves.columns, segment_colors):
+                    fig_curves.add_trace(go.Scatter(
+                        x=curves.index[1:], y=curves[segment].iloc[1:] * 100,
+                        mode='lines+markers', name=segment, line=dict(color=color, width=3)
+                    ))
+                fig_curves.update_layout(
+                    height=400,
+                    xaxis_title="Months Since First Bill",
+                    yaxis_title="Patients Active (%)",
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)'
+                )
+                return fig_curves
+            plotly_chart("retention_curves", (), build_curves)
+            st.caption("Share of patients billed again k months after their first bill, "
+                       "grouped by the segment of that first bill")
+        
+        with col2:
+            st.subheader("🗓️ Monthly Acquisition Cohorts")
+            
+            def build_cohorts():
+                cohorts = journeys['cohorts']
+                shares = cohorts.drop(columns='patients') * 100
+                fig_cohorts = go.Figure(go.Heatmap(
+                    z=shares.to_numpy(),
+                    x=[str(age) for age in shares.columns],
+                    y=[f"{month} ({size:,})" for month, size in zip(cohorts.index, cohorts['patients'])],
+                    colorscale='Greens',
+                    text=shares.round(0).to_numpy(),
+                    texttemplate="%{text:.0f}%",
+                    hovertemplate="Cohort %{y}<br>Month %{x}: %{z:.1f}%<extra></extra>"
+                ))
+                fig_cohorts.update_layout(
+                    height=400,
+                    xaxis_title="Months Since First Bill",
+                    yaxis=dict(autorange='reversed'),
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    plot_bgcolor='rgba(0,0,0,0)'
+                )
+                return fig_cohorts
+            plotly_chart("cohort_heatmap", (), build_cohorts)
+            st.caption("Patients by month of first bill (cohort size in brackets), active in each later month")
+        
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("⏱️ Time to Next Visit")
+            intervals = journeys['intervals']
+            st.dataframe(pd.DataFrame({
+                'Segment': intervals.index,
+                'Bills': intervals['bills'].map('{:,}'.format),
+                'Came Back': (intervals['return_rate'] * 100).map('{:.1f}%'.format),
+                'Median Days': intervals['median_days'].map('{:.0f}'.format),
+                'Middle 50%': [f"{p25:.0f}–{p75:.0f} days"
+                               for p25, p75 in zip(intervals['p25_days'], intervals['p75_days'])]
+            }), use_container_width=True, hide_index=True)
+            st.caption("By the segment of the earlier bill")
+        
+        with col2:
+            st.subheader("🔀 Segment of the Next Bill")
+            transitions = journeys['transitions']
+            shares = transitions.div(transitions.sum(axis=1).replace(0, float('nan')), axis=0) * 100
+            st.dataframe(shares.rename_axis(index='From', columns='To').map('{:.1f}%'.format),
+                         use_container_width=True)
+            st.caption("Row: segment of a bill; column: segment of the same patient's next bill")
+        
+        st.info(f"""
+    **Journey Insights:**
+    - {conversion.rate*100:.1f}% of patients who held coins later redeemed them, after a median of {conversion.median_days:.0f} days
+    - {shares.loc['Coin Holders', 'Coin Users']:.1f}% of Coin Holders bills are followed by a Coin Users bill
+    - Coin Users come back after a median of {intervals.loc['Coin Users', 'median_days']:.0f} days, Direct Users after {intervals.loc['Direct Users', 'median_days']:.0f}
+    """)
+
+    elif page == "📈 Trends":
+        st.header("Daily Trends by Store and Segment")
         
-        st.markdown("### 1️⃣ Average Basket Size")
-        st.info("""
+        # Every view is a difference of running day × store × segment totals
+        daily = dataset.daily
+        st.sidebar.markdown("### 🔎 Filters")
+        selected_stores = st.sidebar.multiselect("Stores", daily.stores, placeholder="All stores")
+        selected_segments = st.sidebar.multiselect("Segments", SEGMENTS, placeholder="All segments")
+        measure_labels = {
+            "Revenue per Day": 'revenue',
+            "Bills per Day": 'bills',
+            "Avg Basket Size": 'avg_basket',
+            "Coin Usage Rate": 'coin_usage_rate',
+            "Coin Discount per Day": 'discount',
+        }
+        measure_label = st.sidebar.selectbox("Measure", list(measure_labels))
+        measure = measure_labels[measure_label]
+        window = st.sidebar.radio("Rolling Window", WINDOWS, format_func=lambda days: f"{days} days", horizontal=True)
+        stores = selected_stores or None
+        segments = selected_segments or None
+        filters = (tuple(selected_stores), tuple(selected_segments), measure, window)
+        
+        def fmt(name, value):
+            if name in ('revenue', 'discount', 'avg_basket'):
+                return f"₹{value:,.0f}"
+            if name == 'coin_usage_rate':
+                return f"{value*100:.1f}%"
+            return f"{value:,.0f}"
+        
+        # Last 7 days against the 7 before
+        st.subheader(f"📅 Last 7 Days (to {daily.dates[-1]:%d %b %Y})")
+        cols = st.columns(4)
+        for col, (label, name) in zip(cols, [("Revenue per Day", 'revenue'), ("Bills per Day", 'bills'),
+                                             ("Avg Basket Size", 'avg_basket'), ("Coin Usage Rate", 'coin_usage_rate')]):
+            wow = daily.week_over_week(name, stores=stores, segments=segments).iloc[0]
+            with col:
+                st.metric(label, fmt(name, wow['current']),
+                          f"{wow['change']*100:+.1f}% WoW" if pd.notna(wow['change']) else "No prior week")
+        
+        st.markdown("---")
+        st.subheader(f"📈 {measure_label}")
+        
+        def build_trend():
+            trend = daily.seasonal_trend(measure, window, stores, segments)
+            scale = 100 if measure == 'coin_usage_rate' else 1
+            fig_trend = go.Figure()
+            fig_trend.add_trace(go.Scatter(
+                x=trend.index, y=trend['value'] * scale, mode='lines', name='Daily',
+                line=dict(color='#95a5a6', width=1), opacity=0.6
+            ))
+            rolling = daily.rolling(measure, window, stores, segments)
+            fig_trend.add_trace(go.Scatter(
+                x=rolling.index, y=rolling * scale, mode='lines', name=f'{window}-day average',
+                line=dict(color='#667eea', width=3)
+            ))
+            fig_trend.add_trace(go.Scatter(
+                x=trend.index, y=trend['trend'] * scale, mode='lines', name=f'{window}-day trend (weekday-adjusted)',
+                line=dict(color='#27ae60', width=3, dash='dash')
+            ))
+            fig_trend.update_layout(
+                height=450,
+                yaxis_title=measure_label + (" (%)" if measure == 'coin_usage_rate' else ""),
+                hovermode='x unified',
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)'
+            )
+            return fig_trend
+        plotly_chart("trend", filters, build_trend)
+        st.caption("The weekday-adjusted trend divides each day by its day-of-week factor "
+                   "before averaging, so the weekly pharmacy cycle does not show up as a trend")
+        
+        st.markdown("---")
+        st.subheader("🏪 Week over Week by Store")
+        by_store = daily.week_over_week(measure, stores=stores, segments=segments, by_store=True)
+        st.dataframe(pd.DataFrame({
+            'Store': by_store.index,
+            'Last 7 Days': [fmt(measure, value) for value in by_store['current']],
+            'Previous 7 Days': [fmt(measure, value) for value in by_store['previous']],
+            'Change': by_store['change'].map(lambda change: f"{change*100:+.1f}%" if pd.notna(change) else "—")
+        }), use_container_width=True, hide_index=True)
+
+    elif page == "💡 Impact Calculator":
+        st.header("Revenue Impact Calculator")
+        st.markdown("Simulate the impact of improving coin holder conversion")
+        impact_calculator(segment_kpis(stats), dataset.bootstrap)
+
+    elif page == "📖 Documentation":
+        st.header("📖 Platform Documentation")
+        st.markdown("Complete guide to understanding metrics, KPIs, and calculation logic")
+        
+        # Create tabs for different sections
+        tab1, tab2, tab3, tab4 = st.tabs(["📊 KPI Definitions", "🧮 Calculation Logic", "📈 Data Processing", "💡 Impact Calculator"])
+        
+        with tab1:
+            st.subheader("Key Performance Indicators (KPIs)")
+            
+            st.markdown("### 1️⃣ Average Basket Size")
+            st.info("""
         **Definition:** The average amount spent per transaction/bill
         
         **Formula:** `Total Revenue ÷ Total Bills`
@@ -527,9 +860,9 @@ elif page == "📖 Documentation":
         
         **Business Meaning:** Indicates the average purchase value per customer visit
         """)
-        
-        st.markdown("### 2️⃣ Customer Segments")
-        st.warning("""
+            
+            st.markdown("### 2️⃣ Customer Segments")
+            st.warning("""
         **Three Segments Based on Coin Usage:**
         
         1. **Direct Users (38.2%)** - No Zeno Coins
@@ -544,9 +877,9 @@ elif page == "📖 Documentation":
            - Count: 7,288 bills
            - Avg Basket: ₹371.29
         """)
-        
-        st.markdown("### 3️⃣ Conversion Metrics")
-        st.success("""
+            
+            st.markdown("### 3️⃣ Conversion Metrics")
+            st.success("""
         **Coin Activation Rate:** 61.8%
         - Formula: `(Coin Holders + Coin Users) ÷ Total Bills × 100`
         - Calculation: `83,535 ÷ 135,249 × 100 = 61.8%`
@@ -559,9 +892,9 @@ elif page == "📖 Documentation":
         - Formula: `Coin Users ÷ Total Bills × 100`
         - Calculation: `7,288 ÷ 135,249 × 100 = 5.4%`
         """)
-        
-        st.markdown("### 4️⃣ Basket Lift")
-        st.error("""
+            
+            st.markdown("### 4️⃣ Basket Lift")
+            st.error("""
         **Lift Over Direct Users:**
         - Coin Holders: +11.8% (₹296 vs ₹265)
         - Coin Users: +40.3% (₹371 vs ₹265)
@@ -570,12 +903,12 @@ elif page == "📖 Documentation":
         
         **Business Impact:** Shows loyalty program effectiveness
         """)
-    
-    with tab2:
-        st.subheader("Calculation Logic")
         
-        st.markdown("### Current Revenue Calculation")
-        st.code("""
+        with tab2:
+            st.subheader("Calculation Logic")
+            
+            st.markdown("### Current Revenue Calculation")
+            st.code("""
 # Weighted Average Formula
 Current Revenue = Σ(Segment % × Segment Avg Basket)
 
@@ -584,9 +917,9 @@ Revenue = (38.2% × ₹264.63) + (56.4% × ₹295.96) + (5.4% × ₹371.29)
         = ₹101.09 + ₹166.92 + ₹20.05
         = ₹288.06 per bill
         """, language='python')
-        
-        st.markdown("### Revenue Opportunity")
-        st.code("""
+            
+            st.markdown("### Revenue Opportunity")
+            st.code("""
 # Formula
 Opportunity = Coin Holders × (User Avg - Holder Avg)
 
@@ -599,9 +932,9 @@ Opportunity = 76,247 × (₹371.29 - ₹295.96)
 Monthly = ₹5,744,180 ÷ 4.5 months
         = ₹1,276,484 per month
         """, language='python')
-        
-        st.markdown("### Segment Distribution Validation")
-        st.code("""
+            
+            st.markdown("### Segment Distribution Validation")
+            st.code("""
 # Verify segments add to 100%
 Direct:  51,714 ÷ 135,249 = 38.2%
 Holders: 76,247 ÷ 135,249 = 56.4%
@@ -614,19 +947,19 @@ Holders: 76,247 × ₹295.96 = ₹22,565,882
 Users:    7,288 × ₹371.29 = ₹2,705,762
 Total:                       ₹38,957,175 ✓
         """, language='python')
-    
-    with tab3:
-        st.subheader("Data Processing Pipeline")
         
-        st.markdown("### Step 1: Load Raw Data")
-        st.code("""
+        with tab3:
+            st.subheader("Data Processing Pipeline")
+            
+            st.markdown("### Step 1: Load Raw Data")
+            st.code("""
 df = pd.read_csv('data dump for old pilot stores.csv')
 # 266,697 rows (line items)
 # Each row = one drug/product in a bill
         """, language='python')
-        
-        st.markdown("### Step 2: Create Bill-Level Data")
-        st.code("""
+            
+            st.markdown("### Step 2: Create Bill-Level Data")
+            st.code("""
 bill_data = df.groupby('id').agg({
     'revenue-value': 'sum',        # Total bill amount
     'eligibilty_flag': 'max',      # Has coins (1/0)
@@ -634,9 +967,9 @@ bill_data = df.groupby('id').agg({
 })
 # Result: 135,249 unique bills
         """, language='python')
-        
-        st.markdown("### Step 3: Segment Classification")
-        st.code("""
+            
+            st.markdown("### Step 3: Segment Classification")
+            st.code("""
 # Classification Logic
 if eligibilty_flag == 0:
     segment = "Direct Users"      # No coins
@@ -645,9 +978,9 @@ elif has_zeno_discount == True:
 else:
     segment = "Coin Holders"      # Has but didn't use
         """, language='python')
-        
-        st.markdown("### Step 4: Calculate Metrics")
-        st.code("""
+            
+            st.markdown("### Step 4: Calculate Metrics")
+            st.code("""
 # Segment averages
 direct_avg = bill_data[bill_data['user_segment'] == 'Direct Users']['revenue-value'].mean()
 holder_avg = bill_data[bill_data['user_segment'] == 'Coin Holders']['revenue-value'].mean()
@@ -656,16 +989,44 @@ user_avg = bill_data[bill_data['user_segment'] == 'Coin Users']['revenue-value']
 # Overall average (weighted)
 overall_avg = bill_data['revenue-value'].mean()
         """, language='python')
-    
-    with tab4:
-        st.subheader("Impact Calculator Logic")
         
-        st.markdown("### How the Calculator Works")
-        
-        col1, col2 = st.columns(2)
+            st.markdown("### Memory Footprint")
+            st.markdown("Line items are held with an explicit schema: categories for store names, "
+                        "int32 IDs, int8 flags and integer paise for money.")
+            report = load_memory_report(version)
+            st.dataframe(pd.DataFrame({
+                'CSV dtypes (MB)': (report['before'] / 1e6).round(2),
+                'Compact schema (MB)': (report['after'] / 1e6).round(2),
+                'Ratio': report['ratio'].map(lambda x: f"{x:.0%}")
+            }), use_container_width=True)
+
+            st.markdown("### Data Quality")
+            quality = dataset.quality
+            if quality is None:
+                st.info("The quality report is built with the next data refresh.")
+            else:
+                st.markdown(f"Checked while parsing {quality.lines:,} line items. Bad values are coerced, "
+                            "not dropped, so findings here may skew the numbers above.")
+                summary = quality.summary()
+                st.dataframe(pd.DataFrame({
+                    'Check': summary['check'],
+                    'Found': summary['count'].map(lambda x: f"{x:,}"),
+                    'Share': summary['share'].map(lambda x: f"{x:.2%}"),
+                }), use_container_width=True, hide_index=True)
+                for check, rows in quality.samples.items():
+                    if rows:
+                        with st.expander(f"Samples: {summary.loc[check, 'check']}"):
+                            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
         
-        with col1:
-            st.info("""
+        with tab4:
+            st.subheader("Impact Calculator Logic")
+            
+            st.markdown("### How the Calculator Works")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.info("""
             **📥 Input Parameters:**
             1. Target % Who USE Coins (slider)
             2. Expected Monthly Bills (number)
@@ -676,19 +1037,19 @@ overall_avg = bill_data['revenue-value'].mean()
             - Holder Avg: ₹295.96
             - User Avg: ₹371.29
             """)
-        
-        with col2:
-            st.success("""
+            
+            with col2:
+                st.success("""
             **📈 Calculation Steps:**
             1. Redistribute segments
             2. Calculate new revenue
             3. Compare to current
             4. Project impact
             """)
-        
-        st.markdown("### Example Calculation: 10% Coin Users")
-        
-        st.code("""
+            
+            st.markdown("### Example Calculation: 10% Coin Users")
+            
+            st.code("""
 # Step 1: Redistribute Segments (keeping 61.8% with coins)
 New Users = 10.0%
 New Holders = 61.8% - 10.0% = 51.8%
@@ -708,27 +1069,25 @@ Incremental = ₹108,600 per month
 Annual Impact = ₹108,600 × 12 = ₹1,303,200
 ROI = ₹1,303,200 ÷ ₹8,641,200 = 15.1%
         """, language='python')
-        
-        st.markdown("### Scenario Comparison")
-        
-        scenario_data = {
-            'Target Users %': [5.4, 8.0, 10.0, 12.0, 15.0],
-            'Avg Basket': [288, 290, 292, 293, 295],
-            'Monthly Impact': [0, 65160, 108600, 152040, 217200],
-            'Annual Impact': [0, 781920, 1303200, 1824480, 2606400],
-            'New Users': [0, 780, 1380, 1980, 2880]
-        }
-        
-        import pandas as pd
-        scenario_df = pd.DataFrame(scenario_data)
-        scenario_df['Monthly Impact'] = scenario_df['Monthly Impact'].apply(lambda x: f"₹{x:,}")
-        scenario_df['Annual Impact'] = scenario_df['Annual Impact'].apply(lambda x: f"₹{x:,}")
-        scenario_df['Avg Basket'] = scenario_df['Avg Basket'].apply(lambda x: f"₹{x}")
-        
-        st.dataframe(scenario_df, use_container_width=True)
-        
-        st.markdown("### Key Formula")
-        st.error("""
+            
+            st.markdown("### Scenario Comparison")
+            
+            # Evaluated live from the current data in one vectorized sweep
+            current_use = stats.bills('Coin Users') / stats.total_bills * 100
+            sweep = sweep_from_stats(stats, [round(current_use, 1), 8.0, 10.0, 12.0, 15.0], [30000])
+            
+            scenario_df = pd.DataFrame({
+                'Target Users %': sweep['target_use_pct'],
+                'Avg Basket': sweep['avg_basket'].map(lambda x: f"₹{x:.0f}"),
+                'Monthly Impact': sweep['monthly_impact'].map(lambda x: f"₹{x:,.0f}"),
+                'Annual Impact': sweep['annual_impact'].map(lambda x: f"₹{x:,.0f}"),
+                'New Users': sweep['new_users'].round().astype('Int64')
+            })
+            
+            st.dataframe(scenario_df, use_container_width=True)
+            
+            st.markdown("### Key Formula")
+            st.error("""
         🔑 **Core Revenue Formula:**
         ```
         Revenue = Σ(Segment Count × Segment Average Basket)
@@ -739,9 +1098,28 @@ ROI = ₹1,303,200 ÷ ₹8,641,200 = 15.1%
         on actual historical performance.
         """)
 
-# Footer
-st.markdown("---")
-st.markdown(
-    "<p style='text-align: center; color: #7f8c8d;'>Zeno Coin Analytics Platform | Data-Driven Decision Making</p>",
-    unsafe_allow_html=True
-)
\ No newline at end of file
+    # Footer
+    st.markdown("---")
+    st.markdown(
+        "<p style='text-align: center; color: #7f8c8d;'>Zeno Coin Analytics Platform | Data-Driven Decision Making</p>",
+        unsafe_allow_html=True
+    )
+
+# Append ?perf=1 to the URL for per-stage timings of this server process
+if st.query_params.get("perf") == "1":
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.caption(f"This page: {page_span.record['seconds']*1000:.0f} ms "
+                   f"(CPU {page_span.record['cpu_seconds']*1000:.0f} ms)")
+        figures = get_figure_cache()
+        st.caption(f"Figure cache: {len(figures)} figures, {figures.size_bytes / 2**20:.1f} MiB, "
+                   f"{figures.hits:,} hits / {figures.misses:,} misses")
+        spans = pd.DataFrame.from_dict(RECORDER.totals(), orient='index')
+        spans['mean_ms'] = spans['seconds'] / spans['count'] * 1000
+        spans = spans.sort_values('seconds', ascending=False)
+        st.dataframe(pd.DataFrame({
+            'Calls': spans['count'],
+            'Last (ms)': (spans['last_seconds'] * 1000).round(1),
+            'Mean (ms)': spans['mean_ms'].round(1),
+            'Max (ms)': (spans['max_seconds'] * 1000).round(1),
+            'CPU (s)': spans['cpu_seconds'].round(3),
+        }), use_container_width=True)